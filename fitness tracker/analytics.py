@@ -0,0 +1,138 @@
+import itertools
+
+import archive
+import dates
+import db
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Training analytics for an exercise or a whole category: training streaks,
+# 7- and 28-day rolling volume, the acute:chronic workload ratio and
+# personal-record events. The history is loaded straight into arrays and
+# every metric is computed with numpy over the whole series, so the cost
+# grows linearly with the number of logs.
+#
+#   metrics = analytics.exercise_metrics(3)
+#   metrics["current_streak"], metrics["acwr"][-1], metrics["records"][-5:]
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+
+HISTORY_QUERIES = {
+    "exercise": '''
+        SELECT id, exercise_id, date, COALESCE(sets * reps, 0)
+        FROM all_workout_logs
+        WHERE exercise_id = ?
+    ''',
+    "category": '''
+        SELECT wl.id, wl.exercise_id, wl.date, COALESCE(wl.sets * wl.reps, 0)
+        FROM exercises e
+        JOIN all_workout_logs wl ON wl.exercise_id = e.id
+        WHERE e.category_id = ?
+    ''',
+}
+
+
+def _require_numpy():
+    if numpy is None:
+        raise RuntimeError("The training analytics need numpy (pip install numpy)")
+
+
+def load_history(scope, scope_id, conn=None):
+    # (log ids, exercise ids, days, volumes) as arrays, ordered by day and id
+    _require_numpy()
+    if scope not in HISTORY_QUERIES:
+        raise ValueError(f"Unknown scope '{scope}' (use exercise or category)")
+    conn = conn or db.get_connection()
+
+    # The whole history, archived years included
+    rows = archive.read_logs(conn, HISTORY_QUERIES[scope], (scope_id,))
+    flat = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.int64)
+    ids, exercise_ids, days, volumes = flat.reshape(-1, 4).T
+    order = numpy.lexsort((ids, days))
+    return ids[order], exercise_ids[order], days[order], volumes[order]
+
+
+def rolling_sum(values, window):
+    # Sum over the window ending on each day (shorter at the start)
+    sums = numpy.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums
+
+
+def streaks(active):
+    # (longest, current) runs of consecutive training days. The current
+    # streak is still alive if the last training day was today or yesterday.
+    trained = numpy.flatnonzero(active)
+    if not len(trained):
+        return 0, 0
+    breaks = numpy.flatnonzero(numpy.diff(trained) != 1)
+    starts = numpy.concatenate(([0], breaks + 1))
+    ends = numpy.concatenate((breaks, [len(trained) - 1]))
+    lengths = ends - starts + 1
+    current = int(lengths[-1]) if trained[-1] >= len(active) - 2 else 0
+    return int(lengths.max()), current
+
+
+def personal_records(exercise_ids, days, volumes, ids):
+    # Logs that beat every earlier volume (sets x reps) for their exercise,
+    # as a boolean mask. Each exercise gets its own band of values (offset)
+    # so a single running maximum over all of them restarts per exercise.
+    order = numpy.lexsort((ids, days, exercise_ids))
+    volumes = volumes[order]
+    group = numpy.unique(exercise_ids[order], return_inverse=True)[1].ravel()
+    banded = volumes + group * (int(volumes.max()) + 1)
+    best_before = numpy.concatenate(([-1], numpy.maximum.accumulate(banded)[:-1]))
+    mask = numpy.empty(len(order), dtype=bool)
+    mask[order] = banded > best_before
+    return mask
+
+
+def compute_metrics(ids, exercise_ids, days, volumes, as_of=None):
+    # Every metric for one loaded history, or None if it is empty. Daily
+    # series run from the first log to as_of (default today).
+    if not len(days):
+        return None
+    as_of = dates.today() if as_of is None else as_of
+    first = int(days[0])
+    length = max(as_of, int(days[-1])) - first + 1
+    offsets = days - first
+
+    daily_volume = numpy.bincount(offsets, weights=volumes, minlength=length)
+    active = numpy.bincount(offsets, minlength=length) > 0
+    volume_7d = rolling_sum(daily_volume, ACUTE_DAYS)
+    volume_28d = rolling_sum(daily_volume, CHRONIC_DAYS)
+    # Last week's load against the average week of the last four
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        acwr = numpy.where(volume_28d > 0, volume_7d / (volume_28d * ACUTE_DAYS / CHRONIC_DAYS), numpy.nan)
+    longest_streak, current_streak = streaks(active)
+
+    records = personal_records(exercise_ids, days, volumes, ids)
+    record_rows = zip(days[records].tolist(), exercise_ids[records].tolist(), volumes[records].tolist())
+
+    return {
+        "logs": len(days),
+        "first_day": dates.to_date(first),
+        "last_day": dates.to_date(first + length - 1),
+        "daily_volume": daily_volume,
+        "volume_7d": volume_7d,
+        "volume_28d": volume_28d,
+        "acwr": acwr,
+        "longest_streak": longest_streak,
+        "current_streak": current_streak,
+        # (date, exercise id, volume) in date order
+        "records": [(dates.to_date(day), ex_id, volume) for day, ex_id, volume in record_rows],
+    }
+
+
+def exercise_metrics(exercise_id, conn=None, as_of=None):
+    return compute_metrics(*load_history("exercise", exercise_id, conn), as_of=as_of)
+
+
+def category_metrics(category_id, conn=None, as_of=None):
+    # Streaks, rolling volume and workload count the category's exercises
+    # together; personal records are still per exercise
+    return compute_metrics(*load_history("category", category_id, conn), as_of=as_of)
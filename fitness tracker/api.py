@@ -0,0 +1,277 @@
+import itertools
+
+import archive
+import catalog_cache
+import dates
+import db
+import search
+import volume_index
+
+# The tracker's operations as plain functions, for services and scripts as
+# well as the interactive menu (which is a thin shell over them). Nothing
+# here prompts or prints. Unknown ids and bad arguments raise ValueError;
+# constraint violations (a duplicate category name, an exercise twice in a
+# routine) raise sqlite3.IntegrityError. Writes of several rows go through
+# executemany in a single transaction, so they land together or not at all.
+#
+#   ids = api.add_exercises([("Squat", 1, ""), ("Lunge", 1, "Walking")])
+#   routine_id = api.create_routine("Legs", [(ids[0], 5, 5), (ids[1], 3, 12)])
+#   api.log_session(routine_id, "2024-05-01", {ids[0]: (5, 3)})
+#
+# Dates may be given as anything dates.to_day() accepts; they come back as
+# datetime.date. Every function takes an optional connection and uses the
+# calling thread's shared one otherwise.
+
+# Largest log id, the upper bound when paging from the newest log
+MAX_ID = 2 ** 63 - 1
+
+
+def add_category(name, conn=None):
+    conn = conn or db.get_connection()
+    with conn:
+        category_id = conn.execute("INSERT INTO exercise_categories (name) VALUES (?)", (name,)).lastrowid
+    return category_id
+
+
+def _check_category(conn, category_id):
+    if not catalog_cache.category_name(conn, category_id):
+        raise ValueError(f"Category {category_id} not found")
+
+
+def add_exercises(exercises, conn=None):
+    # exercises: (name, category_id) or (name, category_id, description)
+    # tuples. Returns the new ids in the same order.
+    conn = conn or db.get_connection()
+    rows = [(name, category_id, rest[0] if rest else "") for name, category_id, *rest in exercises]
+    if not rows:
+        return []
+    for category_id in {row[1] for row in rows}:
+        _check_category(conn, category_id)
+
+    with conn:
+        conn.executemany("INSERT INTO exercises (name, category_id, description) VALUES (?, ?, ?)", rows)
+        # The write lock is held from the first insert and ids are
+        # max(id) + 1, so this transaction's ids are consecutive
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def add_exercise(name, category_id, description="", conn=None):
+    return add_exercises([(name, category_id, description)], conn)[0]
+
+
+def search_exercises(text, limit=search.DEFAULT_LIMIT, conn=None):
+    # [(exercise_id, name, category, description)], best match first; see
+    # search.py for how words are matched
+    return search.search_exercises(conn or db.get_connection(), text, limit)
+
+
+def create_routine(name, items, date_created=None, conn=None):
+    # items: (exercise_id, sets, reps) for each exercise in the routine
+    conn = conn or db.get_connection()
+    date_created = dates.today() if date_created is None else dates.to_day(date_created)
+    with conn:
+        routine_id = conn.execute(
+            "INSERT INTO workout_routines (name, date_created) VALUES (?, ?)", (name, date_created)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO routine_exercises (routine_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+            [(routine_id, exercise_id, sets, reps) for exercise_id, sets, reps in items]
+        )
+    return routine_id
+
+
+def list_routines(conn=None):
+    # [(id, name, date created)]
+    conn = conn or db.get_connection()
+    rows = conn.execute("SELECT id, name, date_created FROM workout_routines")
+    return [(routine_id, name, dates.to_date(created)) for routine_id, name, created in rows]
+
+
+def routine_name(routine_id, conn=None):
+    conn = conn or db.get_connection()
+    row = conn.execute("SELECT name FROM workout_routines WHERE id=?", (routine_id,)).fetchone()
+    return row[0] if row else None
+
+
+def routine_exercises(routine_id, conn=None):
+    # [(exercise_id, exercise name, category name, sets, reps)]
+    conn = conn or db.get_connection()
+    return conn.execute('''
+    SELECT e.id, e.name, ec.name, re.sets, re.reps
+    FROM routine_exercises re
+    JOIN exercises e ON re.exercise_id = e.id
+    JOIN exercise_categories ec ON e.category_id = ec.id
+    WHERE re.routine_id=?
+    ''', (routine_id,)).fetchall()
+
+
+def log_session(routine_id, date=None, overrides=None, conn=None):
+    # Logs every exercise in the routine with its default sets and reps,
+    # except where overrides ({exercise_id: (sets, reps)}, either may be
+    # None) say otherwise. Returns the number of logs written.
+    conn = conn or db.get_connection()
+    day = dates.today() if date is None else dates.to_day(date)
+    overrides = overrides or {}
+
+    exercises = routine_exercises(routine_id, conn)
+    if not exercises:
+        if routine_name(routine_id, conn) is None:
+            raise ValueError(f"Routine {routine_id} not found")
+        raise ValueError(f"Routine {routine_id} has no exercises")
+    unknown = set(overrides) - {row[0] for row in exercises}
+    if unknown:
+        raise ValueError(f"Exercises {sorted(unknown)} are not in routine {routine_id}")
+
+    rows = []
+    for exercise_id, _, _, default_sets, default_reps in exercises:
+        sets, reps = overrides.get(exercise_id, (None, None))
+        rows.append((exercise_id, day,
+                     default_sets if sets is None else sets,
+                     default_reps if reps is None else reps))
+
+    # The workout_logs triggers keep the stats, rollups and goals current
+    with conn:
+        conn.executemany("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)", rows)
+    volume_index.refresh(conn)
+    return len(rows)
+
+
+def history_page(exercise_id, start_day, end_day, older_than=None, newer_than=None, page_size=20, conn=None):
+    # One page of an exercise's logs as (day, id, sets, reps, total) rows,
+    # newest first. Pages are found by their (day, id) boundary rather than
+    # an OFFSET, so every page costs the same. Archived logs are read too
+    # when the range reaches back to them.
+    conn = conn or db.get_connection()
+    if newer_than is not None:
+        rows = archive.read_logs(conn, '''
+        SELECT date, id, sets, reps, (sets * reps) as total_reps
+        FROM all_workout_logs
+        WHERE exercise_id=? AND date >= ? AND date <= ? AND (date, id) > (?, ?)
+        ORDER BY date, id
+        LIMIT ?
+        ''', (exercise_id, start_day, end_day, newer_than[0], newer_than[1], page_size),
+            start_day, end_day, key=lambda row: row[:2])
+        return list(itertools.islice(rows, page_size))[::-1]
+
+    if older_than is None:
+        older_than = (dates.MAX_DAY, MAX_ID)
+    rows = archive.read_logs(conn, '''
+    SELECT date, id, sets, reps, (sets * reps) as total_reps
+    FROM all_workout_logs
+    WHERE exercise_id=? AND date >= ? AND date <= ? AND (date, id) < (?, ?)
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    ''', (exercise_id, start_day, end_day, older_than[0], older_than[1], page_size),
+        start_day, end_day, key=lambda row: row[:2], reverse=True)
+    return list(itertools.islice(rows, page_size))
+
+
+def exercise_history(exercise_id, start=None, end=None, limit=None, conn=None):
+    # [(log id, date, sets, reps)] newest first, optionally within a date
+    # range (inclusive) and capped at limit rows
+    conn = conn or db.get_connection()
+    start_day = dates.MIN_DAY if start is None else dates.to_day(start)
+    end_day = dates.MAX_DAY if end is None else dates.to_day(end)
+    rows = archive.read_logs(conn, '''
+    SELECT id, date, sets, reps
+    FROM all_workout_logs
+    WHERE exercise_id=? AND date >= ? AND date <= ?
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    ''', (exercise_id, start_day, end_day, -1 if limit is None else limit),
+        start_day, end_day, key=lambda row: (row[1], row[0]), reverse=True)
+    return [(log_id, dates.to_date(day), sets, reps) for log_id, day, sets, reps in itertools.islice(rows, limit)]
+
+
+def exercise_stats(exercise_id, conn=None):
+    # Summary of every log of the exercise, or None if it has none
+    conn = conn or db.get_connection()
+    row = conn.execute('''
+    SELECT workout_count, total_sets, total_reps, max_sets, max_reps, max_total, first_date, last_date
+    FROM exercise_stats
+    WHERE exercise_id=?
+    ''', (exercise_id,)).fetchone()
+    if row is None:
+        return None
+    workouts, total_sets, total_reps, max_sets, max_reps, max_total, first_day, last_day = row
+    return {
+        "workouts": workouts,
+        "total_sets": total_sets,
+        "total_reps": total_reps,
+        "max_sets": max_sets,
+        "max_reps": max_reps,
+        "max_total": max_total,
+        "avg_sets": total_sets / workouts,
+        "avg_reps": total_reps / workouts,
+        "first_date": dates.to_date(first_day),
+        "last_date": dates.to_date(last_day),
+    }
+
+
+def set_goal(category_id, name, target_value, deadline=None, window_type=None, window_days=None, conn=None):
+    # Starts from the volume already logged in the category, archived logs
+    # included, as maintenance.recompute_goals() would. With window_type
+    # ('days' with window_days, 'week' or 'month') progress counts only the
+    # volume in the current window; see goal_progress().
+    conn = conn or db.get_connection()
+    _check_category(conn, category_id)
+    volume_index.check_window(window_type, window_days)
+    deadline = None if deadline is None else dates.to_day(deadline)
+    with conn:
+        return conn.execute('''
+        INSERT INTO goals (name, target_value, current_value, category_id, deadline, window_type, window_days)
+        VALUES (?, ?, (
+            SELECT COALESCE(SUM(wl.sets * wl.reps), 0)
+            FROM workout_logs wl
+            JOIN exercises e ON wl.exercise_id = e.id
+            WHERE e.category_id = ?
+        ) + (
+            SELECT COALESCE(SUM(s.total_volume), 0)
+            FROM archived_exercise_stats s
+            JOIN exercises e ON s.exercise_id = e.id
+            WHERE e.category_id = ?
+        ), ?, ?, ?, ?)
+        ''', (name, target_value, category_id, category_id, category_id, deadline, window_type,
+              window_days)).lastrowid
+
+
+def goal_progress(conn=None):
+    # Every goal in a live category, with its progress as a percentage.
+    # Windowed goals count the volume from window_start to window_end (see
+    # volume_index.window_bounds()), two index lookups each while the
+    # category's running totals are up to date. Only reads, so it works
+    # inside a transaction or on a read-only connection. days_left is the
+    # days until the deadline, negative once it has passed. Goals are found
+    # from the live categories (CROSS JOIN keeps that order) by index.
+    conn = conn or db.get_connection()
+    today = dates.today()
+    rows = conn.execute('''
+    SELECT g.id, g.name, g.target_value, g.current_value, g.category_id, ec.name, g.deadline,
+           g.window_type, g.window_days
+    FROM exercise_categories ec
+    CROSS JOIN goals g ON g.category_id = ec.id
+    WHERE ec.deleted_at IS NULL
+    ''').fetchall()
+    goals = []
+    for goal_id, name, target, current, category_id, category, deadline, window_type, window_days in rows:
+        window_start = window_end = None
+        if window_type is not None:
+            window_start, window_end = volume_index.window_bounds(window_type, window_days, today, deadline)
+            current = volume_index.window_volume(conn, category_id, window_start, window_end)
+        goals.append({
+            "id": goal_id,
+            "name": name,
+            "category_id": category_id,
+            "category": category,
+            "target": target,
+            "current": current,
+            "percent": current / target * 100 if target > 0 else 0,
+            "deadline": None if deadline is None else dates.to_date(deadline),
+            "days_left": None if deadline is None else deadline - today,
+            "window_type": window_type,
+            "window_days": window_days,
+            "window_start": None if window_start is None else dates.to_date(window_start),
+            "window_end": None if window_end is None else dates.to_date(window_end),
+        })
+    return goals
@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import datetime
+import heapq
+import itertools
+import os
+import re
+
+import dates
+import db
+
+# Hot/cold partitioning of workout_logs. Logs older than a horizon are moved
+# in batches into one archive database per calendar year, stored next to
+# the main file (fitness_tracker-archive/2023.db), so the main file keeps
+# only recent logs and its tables and indexes stay small enough to live in
+# the page cache. Goals, exercise_stats and volume_rollups keep covering
+# the archived logs (see schema.create_log_archive); only queries that read
+# the logs themselves need the archives.
+#
+# Those queries read all_workout_logs instead of workout_logs, through
+# read_logs(). It is a TEMP view, a UNION ALL of the main table and every
+# attached archive, which attach_archives() (re)creates for the date range
+# being read. SQLite pushes the WHERE clause into each branch, so every
+# year is read through its own (exercise_id, date) index. A range with more
+# archived years than can be attached is read one archive at a time.
+#
+#   python archive.py move --days 365
+#   python archive.py status
+
+# SQLite's default limit on attached databases
+MAX_ATTACHED = 10
+DEFAULT_HORIZON_DAYS = 365
+DEFAULT_BATCH_SIZE = 5000
+
+ALL_LOGS = "all_workout_logs"
+
+# Ids of the logs being moved
+BATCH_TABLE = "CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)"
+
+_VIEW_YEAR = re.compile(r"archive_(\d+)\.")
+
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS {schema}.workout_logs (
+        id INTEGER PRIMARY KEY,
+        exercise_id INTEGER,
+        date INTEGER NOT NULL,
+        sets INTEGER,
+        reps INTEGER
+    ) STRICT''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_workout_logs_exercise_date ON workout_logs (exercise_id, date)",
+]
+
+
+def _main_file(conn):
+    main = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == "main")
+    if not main:
+        raise ValueError("Only a database file can have archives")
+    return main
+
+
+def archive_path(conn, year):
+    return os.path.join(os.path.splitext(_main_file(conn))[0] + "-archive", f"{year}.db")
+
+
+def archive_years(conn, start_day=dates.MIN_DAY, end_day=dates.MAX_DAY):
+    # Archived years holding logs between the two days, oldest first
+    rows = conn.execute(
+        "SELECT year FROM log_archives WHERE last_day >= ? AND first_day <= ? ORDER BY year", (start_day, end_day)
+    )
+    return [row[0] for row in rows]
+
+
+def _schema(year):
+    return f"archive_{year}"
+
+
+def _attached_years(conn):
+    return {int(name[len("archive_"):]) for _, name, _ in conn.execute("PRAGMA database_list")
+            if name.startswith("archive_")}
+
+
+def _attach(conn, year, create=False):
+    path = archive_path(conn, year)
+    if create:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    elif not os.path.exists(path):
+        raise RuntimeError(f"Archive {path} is missing")
+    conn.execute(f"ATTACH DATABASE ? AS {_schema(year)}", (path,))
+    if create:
+        conn.execute(f"PRAGMA {_schema(year)}.journal_mode=WAL")
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement.format(schema=_schema(year)))
+
+
+def detach_archives(conn):
+    conn.execute(f"DROP VIEW IF EXISTS temp.{ALL_LOGS}")
+    for year in _attached_years(conn):
+        conn.execute(f"DETACH DATABASE {_schema(year)}")
+
+
+def attach_archives(conn, start_day=dates.MIN_DAY, end_day=dates.MAX_DAY):
+    # Makes all_workout_logs cover the logs between the two days, attaching
+    # the archives it needs, and returns the view's name. Archives already
+    # attached stay in the view while there is room. Must be called outside
+    # a transaction whenever the view has to change.
+    years = set(archive_years(conn, start_day, end_day))
+    if len(years) > MAX_ATTACHED:
+        raise ValueError(f"Logs from {len(years)} archived years can't be read at once; "
+                         f"narrow the date range to {MAX_ATTACHED} years or fewer")
+
+    row = conn.execute("SELECT sql FROM sqlite_temp_master WHERE type='view' AND name=?", (ALL_LOGS,)).fetchone()
+    if row is not None and years <= set(map(int, _VIEW_YEAR.findall(row[0]))):
+        return ALL_LOGS
+
+    conn.execute(f"DROP VIEW IF EXISTS temp.{ALL_LOGS}")
+    attached = _attached_years(conn)
+    if len(attached | years) > MAX_ATTACHED:
+        for year in attached - years:
+            conn.execute(f"DETACH DATABASE {_schema(year)}")
+        attached &= years
+    for year in sorted(years - attached):
+        _attach(conn, year)
+
+    branches = ["SELECT id, exercise_id, date, sets, reps FROM main.workout_logs"]
+    branches += [f"SELECT id, exercise_id, date, sets, reps FROM {_schema(year)}.workout_logs"
+                 for year in sorted(attached | years)]
+    conn.execute(f"CREATE TEMP VIEW {ALL_LOGS} AS " + " UNION ALL ".join(branches))
+    return ALL_LOGS
+
+
+def read_logs(conn, sql, params=(), start_day=dates.MIN_DAY, end_day=dates.MAX_DAY, key=None, reverse=False):
+    # Rows of a query over all_workout_logs, for logs between the two days.
+    # If their archives are more than can be attached at once, the query
+    # runs over the hot logs and then each archive in turn instead, and the
+    # runs are merged by key (reverse for a descending ORDER BY) or simply
+    # chained. A LIMIT then applies to each run, so callers cut the merged
+    # rows to it again.
+    years = archive_years(conn, start_day, end_day)
+    if len(years) <= MAX_ATTACHED:
+        attach_archives(conn, start_day, end_day)
+        return conn.execute(sql, params)
+
+    runs = [conn.execute(sql.replace(ALL_LOGS, "main.workout_logs"), params).fetchall()]
+    for year in years:
+        with opened(conn, year) as schema:
+            runs.append(conn.execute(sql.replace(ALL_LOGS, f"{schema}.workout_logs"), params).fetchall())
+    if key is None:
+        return itertools.chain.from_iterable(runs)
+    return heapq.merge(*runs, key=key, reverse=reverse)
+
+
+@contextlib.contextmanager
+def opened(conn, year, create=False):
+    # The year's archive, attached for the length of the block; yields its
+    # schema name
+    if year in _attached_years(conn):
+        yield _schema(year)
+        return
+
+    if len(_attached_years(conn)) >= MAX_ATTACHED:
+        detach_archives(conn)
+    _attach(conn, year, create)
+    try:
+        yield _schema(year)
+    finally:
+        conn.execute(f"DETACH DATABASE {_schema(year)}")
+
+
+def each_archive(conn):
+    # Yields the schema name of every archive in turn
+    for year in archive_years(conn):
+        with opened(conn, year) as schema:
+            yield schema
+
+
+def _year_start(year):
+    return dates.to_day(datetime.date(year, 1, 1))
+
+
+def _move_batch(conn, schema, year, log_ids):
+    # Copies the logs into the archive, then takes them out of the main
+    # file. The two files commit separately: if the second commit never
+    # happens the logs are in both until the next move, which finds them
+    # still due and finishes the job.
+    with conn:
+        conn.execute("DELETE FROM temp.archive_batch")
+        conn.executemany("INSERT INTO temp.archive_batch (id) VALUES (?)", [(log_id,) for log_id in log_ids])
+        conn.execute(f'''
+        INSERT OR IGNORE INTO {schema}.workout_logs (id, exercise_id, date, sets, reps)
+        SELECT id, exercise_id, date, sets, reps FROM main.workout_logs
+        WHERE id IN (SELECT id FROM temp.archive_batch)
+        ''')
+
+    with conn:
+        # Keeps the delete triggers off these logs' goals, stats and rollups
+        conn.execute("UPDATE log_archive_control SET moving = 1")
+        conn.execute('''
+        INSERT INTO archived_exercise_stats (exercise_id, workout_count, total_sets, total_reps,
+                                             max_sets, max_reps, max_total, first_date, last_date, total_volume)
+        SELECT exercise_id, COUNT(*), COALESCE(SUM(sets), 0), COALESCE(SUM(reps), 0),
+               MAX(sets), MAX(reps), MAX(sets * reps), MIN(date), MAX(date), COALESCE(SUM(sets * reps), 0)
+        FROM workout_logs
+        WHERE id IN (SELECT id FROM temp.archive_batch)
+        GROUP BY exercise_id
+        ON CONFLICT (exercise_id) DO UPDATE SET
+            workout_count = workout_count + excluded.workout_count,
+            total_sets = total_sets + excluded.total_sets,
+            total_reps = total_reps + excluded.total_reps,
+            max_sets = MAX(max_sets, excluded.max_sets),
+            max_reps = MAX(max_reps, excluded.max_reps),
+            max_total = MAX(max_total, excluded.max_total),
+            first_date = MIN(first_date, excluded.first_date),
+            last_date = MAX(last_date, excluded.last_date),
+            total_volume = total_volume + excluded.total_volume
+        ''')
+        conn.execute('''
+        INSERT INTO log_archives (year, log_count, first_day, last_day)
+        SELECT ?, COUNT(*), MIN(date), MAX(date)
+        FROM workout_logs
+        WHERE id IN (SELECT id FROM temp.archive_batch)
+        ON CONFLICT (year) DO UPDATE SET
+            log_count = log_count + excluded.log_count,
+            first_day = MIN(first_day, excluded.first_day),
+            last_day = MAX(last_day, excluded.last_day)
+        ''', (year,))
+        conn.execute("DELETE FROM workout_logs WHERE id IN (SELECT id FROM temp.archive_batch)")
+        conn.execute("UPDATE log_archive_control SET moving = 0")
+
+
+def archive_old_logs(conn=None, horizon_days=DEFAULT_HORIZON_DAYS, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    # Moves every log dated more than horizon_days ago into its year's
+    # archive, batch_size logs per transaction, and gives the freed pages
+    # back. progress(year, logs moved so far) is called per batch. Safe to
+    # re-run if interrupted. Returns the number of logs moved.
+    conn = conn or db.get_connection()
+    cutoff = dates.today() - horizon_days
+
+    # One index seek per exercise with a log before the cutoff, live or
+    # archived (exercise_stats covers both)
+    oldest = conn.execute('''
+    SELECT MIN((SELECT MIN(date) FROM workout_logs WHERE exercise_id = s.exercise_id))
+    FROM exercise_stats s
+    WHERE s.first_date < ?
+    ''', (cutoff,)).fetchone()[0]
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    conn.execute(BATCH_TABLE)
+    moved = 0
+    for year in range(dates.to_date(oldest).year, dates.to_date(cutoff).year + 1):
+        start, end = _year_start(year), min(_year_start(year + 1), cutoff)
+        with opened(conn, year, create=True) as schema:
+            # Batches walk the exercises in id order
+            after_exercise = -2 ** 63
+            while True:
+                rows = conn.execute('''
+                SELECT wl.id, e.id
+                FROM exercises e
+                JOIN workout_logs wl ON wl.exercise_id = e.id AND wl.date >= ? AND wl.date < ?
+                WHERE e.id >= ?
+                ORDER BY e.id
+                LIMIT ?
+                ''', (start, end, after_exercise, batch_size)).fetchall()
+                if not rows:
+                    break
+                _move_batch(conn, schema, year, [log_id for log_id, _ in rows])
+                moved += len(rows)
+                after_exercise = rows[-1][1]
+                if progress:
+                    progress(year, moved)
+                if len(rows) < batch_size:
+                    break
+
+    conn.execute("DROP TABLE temp.archive_batch")
+    # Imported here because maintenance depends on this module
+    import maintenance
+    maintenance.incremental_vacuum(conn)
+    return moved
+
+
+def delete_category_logs(conn, category_id):
+    # Deletes the archived logs of the category's exercises; returns how many
+    deleted = 0
+    for year in archive_years(conn):
+        with opened(conn, year) as schema:
+            with conn:
+                count = conn.execute(f'''
+                DELETE FROM {schema}.workout_logs
+                WHERE exercise_id IN (SELECT id FROM main.exercises WHERE category_id=?)
+                ''', (category_id,)).rowcount
+                conn.execute("UPDATE log_archives SET log_count = log_count - ? WHERE year=?", (count, year))
+        deleted += count
+    return deleted
+
+
+def delete_exercise_logs(conn, exercise_ids):
+    # Deletes the archived logs of the given exercises, which may already
+    # be gone from the main file; returns how many
+    deleted = 0
+    for year in archive_years(conn):
+        with opened(conn, year) as schema:
+            with conn:
+                count = sum(conn.execute(f"DELETE FROM {schema}.workout_logs WHERE exercise_id=?",
+                                         (exercise_id,)).rowcount for exercise_id in exercise_ids)
+                conn.execute("UPDATE log_archives SET log_count = log_count - ? WHERE year=?", (count, year))
+        deleted += count
+    return deleted
+
+
+def status(conn=None):
+    # [(year or "hot", logs, file size in bytes)], archives first
+    conn = conn or db.get_connection()
+    rows = []
+    for year, log_count in conn.execute("SELECT year, log_count FROM log_archives ORDER BY year"):
+        path = archive_path(conn, year)
+        rows.append((year, log_count, os.path.getsize(path) if os.path.exists(path) else 0))
+    hot = conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0]
+    rows.append(("hot", hot, os.path.getsize(_main_file(conn))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old workout logs into per-year archive databases")
+    parser.add_argument("command", choices=["move", "status"])
+    parser.add_argument("--days", type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="keep logs from this many days back in the main file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "move":
+        def progress(year, moved):
+            print(f"  {year}: {moved} logs moved so far")
+        moved = archive_old_logs(horizon_days=args.days, batch_size=args.batch_size, progress=progress)
+        print(f"Archived {moved} logs older than {args.days} days.")
+    else:
+        print(f"{'Year':<6} {'Logs':>10} {'Size (KB)':>10}")
+        for year, logs, size in status():
+            print(f"{year!s:<6} {logs:>10} {size // 1024:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import archive
+import db
+
+# Online backups with SQLite's backup API, taken while the app keeps
+# logging workouts. Pages are copied a batch at a time with a pause in
+# between, so writers are never held up for long. The copy reads from a
+# single read transaction held open for the whole backup: in WAL mode
+# writers carry on meanwhile (their changes wait in the WAL), and the
+# backup sees one consistent state instead of restarting after every
+# commit, as it would between separate steps.
+#
+# Each snapshot is a directory named by its time, laid out like the
+# database it came from (the main file plus its year archives), so it can
+# be opened or copied back as it is:
+#
+#   python backup.py snapshot --keep 7
+#   python backup.py list
+#   python backup.py verify backups/20240501-031500
+
+DEFAULT_PAGES_PER_STEP = 1024
+DEFAULT_SLEEP = 0.01
+DEFAULT_KEEP = 7
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+PARTIAL_SUFFIX = ".partial"
+
+
+def backup_database(source_path, target_path, pages_per_step=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_SLEEP,
+                    progress=None, pinned=None):
+    # Copies the database at source_path to a new file at target_path,
+    # pages_per_step pages at a time with sleep seconds between steps.
+    # progress(pages copied, total pages) is called after each step.
+    # pinned, if given, is an open read-only connection to source_path
+    # inside the read transaction to copy from. Returns the page count.
+    source = pinned or db.connect(source_path, read_only=True)
+    target = sqlite3.connect(target_path)
+    try:
+        if pinned is None:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining:
+                time.sleep(sleep)
+
+        source.backup(target, pages=pages_per_step, progress=step)
+        # A snapshot is a single file: the copied header says WAL
+        target.execute("PRAGMA journal_mode=DELETE")
+        return target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        if pinned is None:
+            source.close()
+
+
+def default_directory():
+    return os.path.join(os.path.dirname(os.path.abspath(db.get_database_path())), "backups")
+
+
+def list_snapshots(directory=None):
+    # [(time taken, path)] of every complete snapshot, oldest first
+    directory = directory or default_directory()
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        try:
+            taken = datetime.datetime.strptime(name, TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((taken, os.path.join(directory, name)))
+    return sorted(snapshots)
+
+
+def prune_snapshots(directory=None, keep=DEFAULT_KEEP, max_age_days=None, now=None):
+    # Deletes all but the newest keep snapshots, and any older than
+    # max_age_days; the newest is always kept. Returns the paths removed.
+    snapshots = list_snapshots(directory)
+    now = now or datetime.datetime.now()
+    removed = []
+    for index, (taken, path) in enumerate(snapshots[:-1]):
+        too_many = index < len(snapshots) - max(keep, 1)
+        too_old = max_age_days is not None and now - taken > datetime.timedelta(days=max_age_days)
+        if too_many or too_old:
+            shutil.rmtree(path)
+            removed.append(path)
+    return removed
+
+
+def snapshot(directory=None, keep=DEFAULT_KEEP, max_age_days=None, pages_per_step=DEFAULT_PAGES_PER_STEP,
+             sleep=DEFAULT_SLEEP, progress=None, verify=True, on_verified=None):
+    # Takes a snapshot of the app's database and its archives, then prunes
+    # old ones. With verify, each file is integrity-checked on a background
+    # thread, which calls on_verified(path, problems) when done. Returns
+    # (snapshot path, that thread or None).
+    source_path = os.path.abspath(db.get_database_path())
+    directory = directory or default_directory()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, datetime.datetime.now().strftime(TIMESTAMP_FORMAT))
+    if os.path.exists(path):
+        raise FileExistsError(f"Snapshot {path} already exists")
+
+    # Written under a temporary name so it is never listed half done
+    partial = path + PARTIAL_SUFFIX
+    os.makedirs(partial)
+    try:
+        source = db.connect(source_path, read_only=True)
+        try:
+            source.execute("BEGIN")
+            years = archive.archive_years(source)
+            archives = [archive.archive_path(source, year) for year in years]
+            backup_database(source_path, os.path.join(partial, os.path.basename(source_path)),
+                            pages_per_step, sleep, progress, pinned=source)
+        finally:
+            source.close()
+
+        # Archives after the main file: a batch moved in between is then
+        # in both copies, which the next move tidies up, rather than in
+        # neither
+        for archive_file in archives:
+            target = os.path.join(partial, os.path.relpath(archive_file, os.path.dirname(source_path)))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            backup_database(archive_file, target, pages_per_step, sleep, progress)
+        os.rename(partial, path)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    prune_snapshots(directory, keep, max_age_days)
+    thread = start_verification(path, on_verified) if verify else None
+    return path, thread
+
+
+def snapshot_files(path):
+    # Every database file in a snapshot
+    files = []
+    for root, _, names in os.walk(path):
+        files.extend(os.path.join(root, name) for name in names if name.endswith(".db"))
+    return sorted(files)
+
+
+def verify_snapshot(path):
+    # Problems PRAGMA integrity_check finds in the snapshot's files, as
+    # "file: message" strings; [] if it is sound
+    problems = []
+    for file in snapshot_files(path):
+        conn = sqlite3.connect("file:" + file + "?mode=ro", uri=True)
+        try:
+            rows = conn.execute("PRAGMA integrity_check").fetchall()
+        except sqlite3.DatabaseError as e:
+            rows = [(str(e),)]
+        finally:
+            conn.close()
+        problems.extend(f"{os.path.relpath(file, path)}: {row[0]}" for row in rows if row[0] != "ok")
+    return problems
+
+
+def start_verification(path, on_verified=None):
+    # Runs verify_snapshot() on a daemon thread
+    def run():
+        problems = verify_snapshot(path)
+        if on_verified:
+            on_verified(path, problems)
+
+    thread = threading.Thread(target=run, name="snapshot-verify", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of the fitness tracker database")
+    parser.add_argument("command", choices=["snapshot", "list", "verify"])
+    parser.add_argument("path", nargs="?", help="snapshot to verify (default: the newest)")
+    parser.add_argument("--dir", help="snapshot directory (default: backups/ next to the database)")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="snapshots to keep")
+    parser.add_argument("--max-age-days", type=int, help="also delete snapshots older than this")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES_PER_STEP, help="pages copied per step")
+    parser.add_argument("--sleep", type=float, default=DEFAULT_SLEEP, help="seconds between steps")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        def progress(copied, total):
+            print(f"\r  {copied}/{total} pages ({copied / total:.0%})", end="", flush=True)
+
+        def on_verified(path, problems):
+            print(f"Integrity check: {'ok' if not problems else '; '.join(problems)}")
+
+        start = time.perf_counter()
+        path, thread = snapshot(args.dir, args.keep, args.max_age_days, args.pages, args.sleep, progress,
+                                on_verified=on_verified)
+        print(f"\nSnapshot written to {path} in {time.perf_counter() - start:.1f}s")
+        thread.join()
+    elif args.command == "list":
+        for taken, path in list_snapshots(args.dir):
+            size = sum(os.path.getsize(file) for file in snapshot_files(path))
+            print(f"{taken:%Y-%m-%d %H:%M:%S}  {size / 2**20:>8.1f} MB  {path}")
+    else:
+        snapshots = list_snapshots(args.dir)
+        path = args.path or (snapshots[-1][1] if snapshots else None)
+        if path is None:
+            print("No snapshots found.")
+            sys.exit(1)
+        problems = verify_snapshot(path)
+        for problem in problems:
+            print(problem)
+        print(f"{path}: {'ok' if not problems else f'{len(problems)} problems'}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
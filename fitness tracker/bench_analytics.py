@@ -0,0 +1,75 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import analytics
+import dates
+import schema
+
+# Shows that the training analytics scale linearly: the database grows to
+# each size in turn and every metric is computed for a category holding
+# all of the logs. Time per million logs should stay roughly flat.
+#
+#   python bench_analytics.py --logs 100000,1000000,10000000
+
+DEFAULT_SCALES = "100000,1000000,10000000"
+
+
+def create(path, exercises):
+    # Just the tables and indexes the analytics read; no triggers, so
+    # millions of logs load in seconds
+    conn = sqlite3.connect(path)
+    for table, definition, _ in schema.COMPACT_TABLES:
+        conn.execute(f"CREATE TABLE {table} ({definition}")
+    schema.create_indexes(conn)
+    conn.execute("INSERT INTO exercise_categories (id, name) VALUES (1, 'Bench')")
+    conn.executemany("INSERT INTO exercises (id, name, category_id) VALUES (?, ?, 1)",
+                     [(i, f"Exercise {i}") for i in range(1, exercises + 1)])
+    conn.commit()
+    return conn
+
+
+def grow(conn, total, exercises):
+    # Adds logs up to total, spread over the ten years before today
+    have = conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0]
+    with conn:
+        conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT ? UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO workout_logs (exercise_id, date, sets, reps)
+        SELECT 1 + i % ?, ? - i * 7919 % 3650, 1 + i % 5, 5 + i * 31 % 11
+        FROM n
+        ''', (have + 1, total, exercises, dates.today()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training analytics time against history size")
+    parser.add_argument("--logs", default=DEFAULT_SCALES, help=f"comma-separated sizes (default {DEFAULT_SCALES})")
+    parser.add_argument("--exercises", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the best is shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = create(os.path.join(tmp, "analytics.db"), args.exercises)
+        print(f"{'Logs':>10} {'Load (ms)':>10} {'Metrics (ms)':>13} {'Total (ms)':>11} {'ms per 1M logs':>15}")
+        print("-" * 64)
+        for total in sorted(int(n) for n in args.logs.split(",")):
+            grow(conn, total, args.exercises)
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                history = analytics.load_history("category", 1, conn)
+                loaded = time.perf_counter()
+                analytics.compute_metrics(*history)
+                done = time.perf_counter()
+                if best is None or done - start < best[1]:
+                    best = (loaded - start, done - start)
+            load, elapsed = best
+            print(f"{total:>10} {load * 1000:>10.1f} {(elapsed - load) * 1000:>13.1f} {elapsed * 1000:>11.1f} "
+                  f"{elapsed * 1000 / (total / 1e6):>15.1f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
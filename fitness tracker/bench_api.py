@@ -0,0 +1,91 @@
+import argparse
+import os
+import tempfile
+import time
+
+import api
+import dates
+import db
+import synthetic_data
+
+# Creating and logging large routines through the batch API against the
+# per-row statements the menu used to run (one execute per exercise, one
+# commit at the end), and against committing every row, which is what a
+# caller logging one exercise at a time gets. All run on the same
+# synthetic database.
+#
+#   python bench_api.py --sizes 20,50,100 --repeat 200
+
+
+def per_row_routine(conn, name, items):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO workout_routines (name, date_created) VALUES (?, ?)", (name, dates.today()))
+    routine_id = cursor.lastrowid
+    for exercise_id, sets, reps in items:
+        cursor.execute(
+            "INSERT INTO routine_exercises (routine_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+            (routine_id, exercise_id, sets, reps)
+        )
+    conn.commit()
+    return routine_id
+
+
+def per_row_session(conn, routine_id, day, commit_each=False):
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT e.id, e.name, re.sets, re.reps
+    FROM routine_exercises re
+    JOIN exercises e ON re.exercise_id = e.id
+    WHERE re.routine_id=?
+    ''', (routine_id,))
+    for ex_id, name, sets, reps in cursor.fetchall():
+        cursor.execute(
+            "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+            (ex_id, day, sets, reps)
+        )
+        if commit_each:
+            conn.commit()
+    conn.commit()
+
+
+def timed(repeat, fn):
+    # Mean milliseconds per call
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch API vs per-row inserts for large routines")
+    parser.add_argument("--sizes", default="20,50,100", help="comma-separated exercises per routine")
+    parser.add_argument("--repeat", type=int, default=100, help="routines created and sessions logged per size")
+    parser.add_argument("--logs", type=int, default=100000, help="history already in the database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sizes = [int(n) for n in args.sizes.split(",")]
+        print(f"Building {args.logs} logs...")
+        synthetic_data.build_database(os.path.join(tmp, "api.db"), exercises=max(200, max(sizes)), logs=args.logs)
+        conn = db.get_connection()
+        today = dates.today()
+
+        print(f"\n{'Exercises':>9} {'Create per-row':>15} {'Create API':>11} {'Log per-row':>12} "
+              f"{'Log, commit each':>17} {'Log API':>9}")
+        print("-" * 78)
+        for size in sizes:
+            items = [(exercise_id, 3, 10) for exercise_id in range(1, size + 1)]
+            old_ids, new_ids = [], []
+            create_old = timed(args.repeat, lambda i: old_ids.append(per_row_routine(conn, f"Old {size}.{i}", items)))
+            create_new = timed(args.repeat, lambda i: new_ids.append(api.create_routine(f"New {size}.{i}", items,
+                                                                                       conn=conn)))
+            log_old = timed(args.repeat, lambda i: per_row_session(conn, old_ids[i], today - i))
+            log_each = timed(args.repeat, lambda i: per_row_session(conn, old_ids[i], today - i, commit_each=True))
+            log_new = timed(args.repeat, lambda i: api.log_session(new_ids[i], today - i, conn=conn))
+            print(f"{size:>9} {create_old:>12.2f} ms {create_new:>8.2f} ms {log_old:>9.2f} ms {log_each:>14.2f} ms "
+                  f"{log_new:>6.2f} ms")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import api
+import archive
+import dates
+import db
+import synthetic_data
+
+# What moving old logs out to the per-year archives buys: the main file's
+# size, the cost of logging a workout, and reads of recent history, before
+# and after the move, next to reads that reach back into the archives.
+#
+#   python bench_archive.py --logs 1000000 --years 5 --days 365
+
+
+def file_size(path):
+    # The database and its WAL, checkpointed first
+    db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def timed(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+
+def measure(conn, rng, exercises, repeat):
+    recent = dates.today() - 30
+    results = {}
+
+    def log_workout():
+        with conn:
+            conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, 3, 10)",
+                         (rng.randint(1, exercises), dates.today()))
+    results["log a workout"] = timed(repeat, log_workout)
+    results["last 30 days, first page"] = timed(repeat, lambda: api.history_page(
+        rng.randint(1, exercises), recent, dates.MAX_DAY, conn=conn))
+    results["whole history, first page"] = timed(repeat, lambda: api.history_page(
+        rng.randint(1, exercises), dates.MIN_DAY, dates.MAX_DAY, conn=conn))
+    results["whole history, oldest page"] = timed(repeat, lambda: api.history_page(
+        rng.randint(1, exercises), dates.MIN_DAY, dates.MAX_DAY, newer_than=(dates.MIN_DAY, 0), conn=conn))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Main file size and latency before and after archiving")
+    parser.add_argument("--logs", type=int, default=1000000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--days", type=int, default=archive.DEFAULT_HORIZON_DAYS, help="horizon to archive at")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.db")
+        print(f"Seeding {args.logs} logs over {args.years} years...")
+        synthetic_data.build_database(path, exercises=args.exercises, logs=args.logs, years=args.years)
+        conn = db.get_connection()
+
+        size_before = file_size(path)
+        before = measure(conn, random.Random(0), args.exercises, args.repeat)
+
+        start = time.perf_counter()
+        moved = archive.archive_old_logs(conn, args.days)
+        elapsed = time.perf_counter() - start
+        size_after = file_size(path)
+        after = measure(conn, random.Random(0), args.exercises, args.repeat)
+
+        print(f"\nMoved {moved} logs older than {args.days} days in {elapsed:.1f}s "
+              f"({moved / elapsed:.0f} logs/s)")
+        print(f"Main file: {size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB")
+        for year, logs, size in archive.status(conn)[:-1]:
+            print(f"  archive {year}: {logs} logs, {size / 2**20:.1f} MB")
+
+        print(f"\n{'Operation':<30} {'Before p50':>10} {'p95':>8} {'After p50':>10} {'p95':>8}  (ms)")
+        print("-" * 72)
+        for label in before:
+            print(f"{label:<30} {before[label][0]:>10.3f} {before[label][1]:>8.3f} "
+                  f"{after[label][0]:>10.3f} {after[label][1]:>8.3f}")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import backup
+import db
+import synthetic_data
+
+# Write latency while an online backup runs. A writer thread logs one
+# workout every --interval ms (its own commit each time, as log_workout
+# does) with no backup running, then during a backup copied in one go,
+# then during paced backups. The database is padded with incompressible
+# filler up to --size-mb so the copy takes a while.
+#
+#   python bench_backup.py --size-mb 2048
+
+
+# 64 KB blobs, as many as the parameter says
+PADDING = '''
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+    INSERT INTO bench_padding SELECT randomblob(65536) FROM n
+'''
+
+
+def pad(conn, size_mb):
+    # Random blobs in a table of their own, until the file reaches size_mb
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_padding (data BLOB)")
+    while os.path.getsize(db.get_database_path()) < size_mb * 2**20:
+        with conn:
+            conn.execute(PADDING, (1024,))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def write_while(task, interval):
+    # Runs task() while a writer logs workouts; returns (latencies in ms,
+    # seconds task took)
+    latencies = []
+    done = threading.Event()
+
+    def writer():
+        conn = db.connect()
+        while not done.is_set():
+            start = time.perf_counter()
+            with conn:
+                conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (1, 20000, 3, 10)")
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(interval / 1000)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    start = time.perf_counter()
+    task()
+    elapsed = time.perf_counter() - start
+    done.set()
+    thread.join()
+    return sorted(latencies), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write latency during online backups")
+    parser.add_argument("--size-mb", type=int, default=1024, help="database size to pad up to")
+    parser.add_argument("--interval", type=float, default=5, help="ms between logged workouts")
+    parser.add_argument("--idle-seconds", type=float, default=5, help="length of the no-backup baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "backup.db")
+        print(f"Building a {args.size_mb} MB database...")
+        synthetic_data.build_database(path, logs=100000)
+        pad(db.get_connection(), args.size_mb)
+        db.close_connection()
+        print(f"Database: {os.path.getsize(path) / 2**20:.0f} MB")
+
+        runs = [("no backup", lambda: time.sleep(args.idle_seconds))]
+        for pages, sleep in [(-1, 0), (backup.DEFAULT_PAGES_PER_STEP, backup.DEFAULT_SLEEP), (256, 0.01),
+                             (1024, 0.05)]:
+            label = "one step" if pages < 0 else f"{pages} pages, {sleep * 1000:.0f} ms sleep"
+
+            def task(pages=pages, sleep=sleep):
+                path, _ = backup.snapshot(os.path.join(tmp, "backups"), keep=1, pages_per_step=pages,
+                                          sleep=sleep, verify=False)
+            runs.append((label, task))
+
+        print(f"\n{'Backup':<26} {'Took (s)':>8} {'Writes':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'Max (ms)':>9}")
+        print("-" * 72)
+        for label, task in runs:
+            latencies, elapsed = write_while(task, args.interval)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{label:<26} {elapsed:>8.1f} {len(latencies):>7} {statistics.median(latencies):>9.2f} "
+                  f"{p99:>9.2f} {latencies[-1]:>9.2f}")
+            # Snapshots are named by the second
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
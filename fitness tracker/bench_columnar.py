@@ -0,0 +1,71 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import columnar
+import db
+import synthetic_data
+
+# Per-exercise totals and maxima computed from fetchall() tuples against
+# the memory-mapped columnar export.
+#
+#   python bench_columnar.py --logs 5000000
+
+
+def python_totals(conn):
+    # How long-horizon analysis works without the export
+    totals = {}
+    for exercise_id, sets, reps in conn.execute("SELECT exercise_id, sets, reps FROM workout_logs").fetchall():
+        entry = totals.setdefault(exercise_id, [0, 0, 0, 0, 0])
+        volume = sets * reps
+        entry[0] += 1
+        entry[1] += sets
+        entry[2] += reps
+        entry[3] += volume
+        entry[4] = max(entry[4], volume)
+    return len(totals)
+
+
+def measure(label, fn, memory=True):
+    # Timed without tracemalloc, which slows Python code down a lot; the
+    # peak memory comes from a second, traced run
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = ""
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = f"{tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB"
+        tracemalloc.stop()
+    print(f"{label:<36} {elapsed * 1000:>10.1f} ms {peak:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fetchall() analytics vs the columnar export")
+    parser.add_argument("--logs", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {args.logs} logs...")
+        synthetic_data.build_database(os.path.join(tmp, "columnar.db"), logs=args.logs)
+        conn = db.get_connection()
+        directory = os.path.join(tmp, "columns")
+
+        print(f"\n{'Operation':<36} {'Time':>13} {'Peak memory':>14}")
+        measure("totals from fetchall()", lambda: python_totals(conn))
+        measure("full export", lambda: columnar.export(directory, conn), memory=False)
+        conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) SELECT exercise_id, date, sets, reps "
+                     "FROM workout_logs WHERE id <= 1000")
+        conn.commit()
+        measure("incremental export (1000 new logs)", lambda: columnar.export(directory, conn), memory=False)
+        measure("totals from the mapped columns", lambda: columnar.exercise_totals(columnar.open_columns(directory)))
+        measure("28-day rolling average, exercise 1",
+                lambda: columnar.rolling_average(columnar.open_columns(directory), 1, 28))
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
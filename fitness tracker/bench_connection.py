@@ -0,0 +1,102 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import dates
+import db
+
+# Compares opening a fresh connection for every operation (how the menu
+# functions used to work) with the shared per-thread connection from db.py.
+#
+#   python bench_connection.py --ops 2000
+
+
+def seed(path):
+    db.set_database_path(path)
+    conn = db.get_connection()
+    conn.execute("INSERT INTO exercise_categories (name) VALUES ('Legs')")
+    conn.executemany(
+        "INSERT INTO exercises (name, category_id, description) VALUES (?, 1, '')",
+        [(f"Exercise {i}",) for i in range(100)]
+    )
+    conn.commit()
+    db.close_connection()
+
+
+def operations(conn):
+    def lookup_exercise():
+        conn.execute("SELECT name FROM exercises WHERE id=?", (42,)).fetchone()
+
+    def list_categories():
+        conn.execute("SELECT id, name FROM exercise_categories").fetchall()
+
+    def log_workout():
+        conn.execute(
+            "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+            (42, dates.to_day("2024-01-01"), 3, 10)
+        )
+        conn.commit()
+
+    return [lookup_exercise, list_categories, log_workout]
+
+
+def time_old(path, ops):
+    results = {}
+    for index in range(3):
+        samples = []
+        for _ in range(ops):
+            start = time.perf_counter()
+            conn = sqlite3.connect(path)
+            operations(conn)[index]()
+            conn.close()
+            samples.append(time.perf_counter() - start)
+        results[operations(None)[index].__name__] = samples
+    return results
+
+
+def time_new(path, ops):
+    db.set_database_path(path)
+    conn = db.get_connection()
+    results = {}
+    for op in operations(conn):
+        samples = []
+        for _ in range(ops):
+            start = time.perf_counter()
+            op()
+            samples.append(time.perf_counter() - start)
+        results[op.__name__] = samples
+    db.close_connection()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-operation latency before/after the connection manager")
+    parser.add_argument("--ops", type=int, default=1000, help="operations per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "old.db")
+        new_path = os.path.join(tmp, "new.db")
+        seed(new_path)
+        seed(old_path)
+        # The old code never enabled WAL, so put that file back on the default journal
+        conn = sqlite3.connect(old_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        old = time_old(old_path, args.ops)
+        new = time_new(new_path, args.ops)
+
+    print(f"{'Operation':<18} {'Before (us)':>12} {'After (us)':>12} {'Speedup':>8}")
+    print("-" * 54)
+    for name in old:
+        before = statistics.median(old[name]) * 1e6
+        after = statistics.median(new[name]) * 1e6
+        print(f"{name:<18} {before:>12.1f} {after:>12.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import api
+import dates
+import db
+import synthetic_data
+import volume_index
+
+# Windowed goal progress at growing log counts: the volume in a 30-day
+# window summed from the logs themselves, next to two lookups in the
+# running totals, then the whole goal view after a workout is logged today
+# or backdated a year, with the refresh the write paths run after it.
+#
+#   python bench_goal_windows.py --logs 10000 100000 1000000
+
+WINDOW_SCAN = '''
+    SELECT COALESCE(SUM(wl.sets * wl.reps), 0)
+    FROM workout_logs wl
+    JOIN exercises e ON wl.exercise_id = e.id
+    WHERE e.category_id = ? AND wl.date BETWEEN ? AND ?
+'''
+
+
+def timed(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def measure(conn, rng, categories, exercises, repeat):
+    today = dates.today()
+    results = {}
+
+    def window(fn):
+        category = rng.randint(1, categories)
+        first = rng.randint(today - 365, today - 29)
+        return fn(category, first, first + 29)
+    results["30-day window, scan logs"] = timed(repeat, lambda: window(
+        lambda category, first, last: conn.execute(WINDOW_SCAN, (category, first, last)).fetchone()))
+    results["30-day window, running totals"] = timed(repeat, lambda: window(
+        lambda category, first, last: volume_index.window_volume(conn, category, first, last)))
+
+    def log_then_view(days_back):
+        def run():
+            with conn:
+                conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, 3, 10)",
+                             (rng.randint(1, exercises), today - days_back))
+            volume_index.refresh(conn)
+            api.goal_progress(conn)
+        return run
+    results["goal view"] = timed(repeat, lambda: api.goal_progress(conn))
+    results["log today + goal view"] = timed(repeat, log_then_view(0))
+    results["log a year back + goal view"] = timed(repeat, log_then_view(365))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Windowed goal progress against the number of logs")
+    parser.add_argument("--logs", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--goals", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for logs in args.logs:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"Seeding {logs} logs...")
+            synthetic_data.build_database(os.path.join(tmp, "goals.db"), exercises=args.exercises, logs=logs,
+                                          years=args.years)
+            conn = db.get_connection()
+            categories = conn.execute("SELECT COUNT(*) FROM exercise_categories").fetchone()[0]
+            rng = random.Random(0)
+            for i in range(args.goals):
+                window_type, window_days = [("days", 30), ("week", None), ("month", None)][i % 3]
+                api.set_goal(rng.randint(1, categories), f"goal {i}", 1000, None, window_type, window_days,
+                             conn=conn)
+            rows.append((logs, measure(conn, rng, categories, args.exercises, args.repeat)))
+            db.close_connection()
+
+    labels = list(rows[0][1])
+    print(f"\n{'p50 (ms)':<32}" + "".join(f"{logs:>12}" for logs, _ in rows))
+    print("-" * (32 + 12 * len(rows)))
+    for label in labels:
+        print(f"{label:<32}" + "".join(f"{results[label]:>12.3f}" for _, results in rows))
+
+
+if __name__ == "__main__":
+    main()
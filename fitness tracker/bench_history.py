@@ -0,0 +1,101 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import dates
+import db
+
+# Compares loading an exercise's whole history with fetchall() (the old
+# progress screen) against keyset-paginated pages.
+#
+#   python bench_history.py --rows 10000000 --exercises 50
+#
+# Building the 10M-row table takes a few minutes; pass --db to reuse one.
+
+
+def build(path, rows, exercises):
+    db.set_database_path(path)
+    tracker = db.load_tracker()
+    conn = db.get_connection()
+    if conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0] >= rows:
+        return tracker
+
+    conn.execute("INSERT OR IGNORE INTO exercise_categories (id, name) VALUES (1, 'Bench')")
+    conn.executemany(
+        "INSERT OR IGNORE INTO exercises (id, name, category_id) VALUES (?, ?, 1)",
+        [(i, f"Exercise {i}") for i in range(1, exercises + 1)]
+    )
+    # Spread the logs over ten years of dates, generated inside SQLite
+    with conn:
+        conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO workout_logs (exercise_id, date, sets, reps)
+        SELECT 1 + i % ?, ? + i * 7919 % 3650,
+               1 + i % 5, 5 + i % 11
+        FROM n
+        ''', (rows, exercises, dates.to_day("2015-01-01")))
+    return tracker
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<32} {elapsed * 1000:>10.2f} ms {peak / 1024:>10.0f} KiB {count:>10} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History view: fetchall() vs keyset pagination")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--exercises", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=10, help="pages to walk through")
+    parser.add_argument("--db", help="database file to build or reuse (default: a temporary file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "history.db")
+        print(f"Building {args.rows} logs over {args.exercises} exercises...")
+        tracker = build(path, args.rows, args.exercises)
+        cursor = db.get_connection().cursor()
+        exercise_id = 1
+
+        def old_fetchall():
+            cursor.execute('''
+            SELECT date, sets, reps, (sets * reps) as total_reps
+            FROM workout_logs
+            WHERE exercise_id=?
+            ORDER BY date DESC
+            ''', (exercise_id,))
+            return len(cursor.fetchall())
+
+        def first_page():
+            return len(tracker.fetch_history_page(cursor, exercise_id, tracker.MIN_DATE, tracker.MAX_DATE))
+
+        def walk_pages():
+            page = tracker.fetch_history_page(cursor, exercise_id, tracker.MIN_DATE, tracker.MAX_DATE)
+            seen = len(page)
+            for _ in range(args.pages - 1):
+                page = tracker.fetch_history_page(cursor, exercise_id, tracker.MIN_DATE, tracker.MAX_DATE,
+                                                  older_than=page[-1][:2])
+                seen += len(page)
+            return seen
+
+        def date_range_page():
+            return len(tracker.fetch_history_page(cursor, exercise_id, dates.to_day("2019-01-01"),
+                                                  dates.to_day("2019-12-31")))
+
+        print(f"\n{'Operation':<32} {'Time':>13} {'Peak memory':>14} {'Rows':>15}")
+        measure("fetchall() whole history", old_fetchall)
+        measure("first page", first_page)
+        measure(f"walk {args.pages} pages", walk_pages)
+        measure("first page of a 1-year range", date_range_page)
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+
+import db
+import reports
+import synthetic_data
+
+# Report generation time against the number of worker processes, on a
+# database with thousands of exercises. Past one worker the speedup is
+# bounded by the cores available (os.cpu_count() is printed first).
+#
+#   python bench_reports.py --exercises 5000 --logs 1000000 --workers 1,2,4,8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report generation time by worker count")
+    parser.add_argument("--exercises", type=int, default=3000)
+    parser.add_argument("--logs", type=int, default=500000)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per worker count; the best is shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reports.db")
+        print(f"Building {args.exercises} exercises, {args.logs} logs...")
+        synthetic_data.build_database(path, exercises=args.exercises, logs=args.logs)
+        db.close_connection()
+
+        print(f"\n{os.cpu_count()} cores")
+        print(f"{'Workers':>8} {'Time (ms)':>10} {'Exercises/s':>12} {'Speedup':>8}")
+        print("-" * 41)
+        serial = None
+        for workers in (int(n) for n in args.workers.split(",")):
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = reports.generate_report(path, workers=workers)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            serial = serial or best
+            print(f"{workers:>8} {best * 1000:>10.1f} {len(rows) / best:>12.0f} {serial / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
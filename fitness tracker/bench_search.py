@@ -0,0 +1,112 @@
+import argparse
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import db
+import search
+
+# Exercise search latency on a large catalog, next to what the pickers did
+# before: list every exercise, or filter with LIKE '%word%'.
+#
+#   python bench_search.py --exercises 100000 --repeat 200
+
+CATEGORIES = ["Chest", "Back", "Legs", "Shoulders", "Arms", "Core", "Glutes", "Calves", "Forearms", "Neck",
+              "Cardio", "Mobility", "Olympic", "Plyometrics", "Grip", "Balance", "Hips", "Traps", "Rehab", "Sport"]
+EQUIPMENT = ["Barbell", "Dumbbell", "Kettlebell", "Cable", "Machine", "Band", "Smith", "Landmine", "Trap Bar",
+             "Bodyweight", "Sandbag", "Medicine Ball", "Sled", "Rings", "TRX"]
+MODIFIERS = ["Incline", "Decline", "Seated", "Standing", "Single-Arm", "Alternating", "Paused", "Tempo",
+             "Close-Grip", "Wide-Grip", "Reverse", "Sumo", "Bulgarian", "Romanian", "Deficit", "Kneeling"]
+MOVEMENTS = ["Press", "Curl", "Row", "Squat", "Deadlift", "Lunge", "Raise", "Fly", "Extension", "Pulldown",
+             "Pull-Up", "Shrug", "Thrust", "Kickback", "Crunch", "Plank", "Carry", "Clean", "Snatch", "Step-Up"]
+MUSCLES = ["pectorals", "lats", "quadriceps", "hamstrings", "deltoids", "biceps", "triceps", "obliques",
+           "glutes", "calves", "rhomboids", "trapezius", "forearms", "adductors", "abductors"]
+
+QUERIES = [
+    ("one letter prefix", "p"),
+    ("word prefix", "dead"),
+    ("whole word", "deadlift"),
+    ("three words", "incline dumbbell press"),
+    ("typo", "dumbel"),
+    ("typos, two words", "romanain dedlift"),
+    ("category and word", "shoulders raise"),
+    ("description word", "hamstrings"),
+]
+
+
+def build_catalog(conn, exercises, seed=0):
+    rng = random.Random(seed)
+    conn.executemany("INSERT INTO exercise_categories (id, name) VALUES (?, ?)", list(enumerate(CATEGORIES, 1)))
+    rows = []
+    for i in range(1, exercises + 1):
+        name = f"{rng.choice(MODIFIERS)} {rng.choice(EQUIPMENT)} {rng.choice(MOVEMENTS)} {i}"
+        description = f"Targets the {rng.choice(MUSCLES)} and {rng.choice(MUSCLES)}"
+        rows.append((i, name, rng.randint(1, len(CATEGORIES)), description))
+    # The triggers index every exercise as it is inserted
+    conn.executemany("INSERT INTO exercises (id, name, category_id, description) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def list_everything(conn):
+    # What the pickers printed before
+    out = io.StringIO()
+    for exercise_id, name, category in conn.execute('''
+    /* full scan */
+    SELECT e.id, e.name, ec.name
+    FROM exercises e
+    JOIN exercise_categories ec ON e.category_id = ec.id
+    WHERE ec.deleted_at IS NULL
+    '''):
+        print(f"{exercise_id}. {name} (Category: {category})", file=out)
+
+
+def like_search(conn, word):
+    return conn.execute('''
+    /* full scan */
+    SELECT id, name FROM exercises WHERE name LIKE ? OR description LIKE ?
+    ''', (f"%{word}%", f"%{word}%")).fetchall()
+
+
+def timed(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise search latency on a large catalog")
+    parser.add_argument("--exercises", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("-k", type=int, default=search.DEFAULT_LIMIT, help="results per search")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_database_path(os.path.join(tmp, "search.db"))
+        conn = db.get_connection()
+        start = time.perf_counter()
+        build_catalog(conn, args.exercises)
+        print(f"Built and indexed {args.exercises} exercises in {time.perf_counter() - start:.1f}s")
+
+        print(f"\n{'Operation':<42} {'p50 (ms)':>9} {'p95 (ms)':>9}  Top result")
+        print("-" * 90)
+        p50, p95 = timed(max(3, args.repeat // 20), lambda: list_everything(conn))
+        print(f"{'list every exercise (old picker)':<42} {p50:>9.2f} {p95:>9.2f}")
+        p50, p95 = timed(max(3, args.repeat // 20), lambda: like_search(conn, "romanian"))
+        print(f"{'LIKE %romanian%':<42} {p50:>9.2f} {p95:>9.2f}")
+        for label, text in QUERIES:
+            p50, p95 = timed(args.repeat, lambda: search.search_exercises(conn, text, args.k))
+            results = search.search_exercises(conn, text, args.k)
+            top = results[0][1] if results else "-"
+            print(f"{label + ': ' + repr(text):<42} {p50:>9.2f} {p95:>9.2f}  {top}")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import db
+import synthetic_data
+
+# Load test for server.py. Seeds a synthetic database, starts the server on
+# it in a separate process, then keeps --clients keep-alive connections busy
+# for --seconds with a mix of reads and workout logs, and reports requests
+# per second and latency percentiles per request type. --url points it at a
+# server that is already running instead (which must have exercises 1-200).
+#
+#   python bench_server.py --clients 64 --seconds 20 --write-ratio 0.3
+
+
+def read_requests(rng, exercises):
+    exercise_id = rng.randint(1, exercises)
+    return rng.choice([
+        ("stats", "GET", f"/exercises/{exercise_id}/stats", None),
+        ("history", "GET", f"/exercises/{exercise_id}/history?limit=20", None),
+        ("goals", "GET", "/goals", None),
+        ("exercises", "GET", f"/categories/{rng.randint(1, 10)}/exercises", None),
+    ])
+
+
+def log_request(rng, exercises):
+    body = {"exercise_id": rng.randint(1, exercises), "sets": rng.randint(1, 5), "reps": rng.randint(5, 15)}
+    return "log", "POST", "/logs", body
+
+
+async def request(reader, writer, method, path, body):
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                 + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(host, port, seed, deadline, write_ratio, exercises, samples, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                kind, method, path, body = log_request(rng, exercises)
+            else:
+                kind, method, path, body = read_requests(rng, exercises)
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, body)
+            samples.setdefault(kind, []).append(time.perf_counter() - start)
+            if status >= 400:
+                errors[kind] = errors.get(kind, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, clients, seconds, write_ratio, exercises):
+    samples, errors = {}, {}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, seed, deadline, write_ratio, exercises, samples, errors)
+                           for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    metrics = json.loads((await request(reader, writer, "GET", "/metrics", None))[1])
+    writer.close()
+    return elapsed, samples, errors, metrics
+
+
+def report(elapsed, samples, errors, metrics):
+    total = sum(len(values) for values in samples.values())
+    print(f"\n{total} requests in {elapsed:.1f}s: {total / elapsed:.0f} requests/s")
+    print(f"\n{'Request':<10} {'Count':>8} {'Errors':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'Max (ms)':>9}")
+    print("-" * 66)
+    every = []
+    for kind in sorted(samples):
+        values = sorted(samples[kind])
+        every.extend(values)
+        print_row(kind, values, errors.get(kind, 0))
+    print_row("all", sorted(every), sum(errors.values()))
+
+    queue = metrics["write_queue"]
+    print(f"\nServer write queue: {queue['written']} logs in {queue['batches']} commits "
+          f"(average batch {queue['avg_batch_size']:.1f}, largest {queue['max_batch_size']})")
+
+
+def print_row(kind, values, errors):
+    def pct(p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+    print(f"{kind:<10} {len(values):>8} {errors:>7} {pct(0.5):>9.2f} {pct(0.95):>9.2f} {pct(0.99):>9.2f} "
+          f"{values[-1] * 1000:>9.2f}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(process, host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server didn't start on {host}:{port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the tracker's HTTP server")
+    parser.add_argument("--url", help="host:port of a running server (default: start one on a seeded database)")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent connections")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that log a workout")
+    parser.add_argument("--workers", type=int, default=8, help="database threads for the server started here")
+    parser.add_argument("--logs", type=int, default=100000, help="logs in the seeded database")
+    args = parser.parse_args()
+    exercises = 200
+
+    if args.url:
+        host, port = args.url.rsplit(":", 1)
+        report(*asyncio.run(run_load(host, int(port), args.clients, args.seconds, args.write_ratio, exercises)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "server.db")
+        print(f"Seeding {args.logs} logs...")
+        synthetic_data.build_database(path, exercises=exercises, logs=args.logs)
+        db.close_connection()
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+             "--port", str(port), "--workers", str(args.workers)],
+            env=dict(os.environ, FITNESS_TRACKER_DB=path),
+        )
+        try:
+            wait_for(server, "127.0.0.1", port)
+            print(f"{args.clients} clients for {args.seconds:.0f}s, {args.write_ratio:.0%} writes")
+            report(*asyncio.run(run_load("127.0.0.1", port, args.clients, args.seconds, args.write_ratio,
+                                         exercises)))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
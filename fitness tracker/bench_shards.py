@@ -0,0 +1,99 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import api
+import db
+import schema
+import shards
+
+# Write throughput with every user in one database file, next to one shard
+# per user through shards.ShardRouter. Each of --users threads logs
+# --sessions workouts of a five-exercise routine, one transaction each.
+# With one file the threads queue on its single write lock; with shards
+# each thread writes its own file.
+#
+#   python bench_shards.py --users 1 2 4 8 --sessions 200
+
+
+def setup_user(conn, name):
+    category_id = api.add_category(f"Strength {name}", conn=conn)
+    exercise_ids = api.add_exercises([(f"Exercise {i} {name}", category_id) for i in range(5)], conn=conn)
+    return api.create_routine(f"Routine {name}", [(exercise_id, 3, 10) for exercise_id in exercise_ids],
+                              "2024-01-01", conn=conn)
+
+
+def log_sessions(conn, routine_id, sessions):
+    for i in range(sessions):
+        api.log_session(routine_id, 738000 + i, conn=conn)
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def single_file(tmp, users, sessions):
+    path = os.path.join(tmp, f"single-{users}.db")
+    conn = db.connect(path)
+    schema.ensure_schema(conn)
+    routines = [setup_user(conn, f"user{i}") for i in range(users)]
+    conn.close()
+
+    def target(routine_id):
+        def run():
+            conn = db.connect(path)
+            log_sessions(conn, routine_id, sessions)
+            conn.close()
+        return run
+
+    return run_threads([target(routine_id) for routine_id in routines])
+
+
+def sharded(tmp, users, sessions):
+    router = shards.ShardRouter(os.path.join(tmp, f"shards-{users}"))
+    user_ids = [f"user{i}" for i in range(users)]
+    routines = {}
+    for user_id in user_ids:
+        with router.connection(user_id) as conn:
+            routines[user_id] = setup_user(conn, user_id)
+
+    def target(user_id):
+        def run():
+            with router.connection(user_id) as conn:
+                log_sessions(conn, routines[user_id], sessions)
+        return run
+
+    elapsed = run_threads([target(user_id) for user_id in user_ids])
+    logged = sum(router.fan_out(lambda user_id, conn: conn.execute(shards.TOTAL_VOLUME).fetchone()[0]).values())
+    router.close()
+    assert logged == users * sessions * 5
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write throughput: one database file vs per-user shards")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrent writers")
+    parser.add_argument("--sessions", type=int, default=200, help="workouts logged by each user")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.sessions} sessions of 5 logs per user, one commit per session\n")
+    print(f"{'Users':>5} {'One file (sessions/s)':>22} {'Shards (sessions/s)':>20} {'Speedup':>8}")
+    print("-" * 58)
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.users:
+            total = users * args.sessions
+            single = total / single_file(tmp, users, args.sessions)
+            shard = total / sharded(tmp, users, args.sessions)
+            print(f"{users:>5} {single:>22.0f} {shard:>20.0f} {shard / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
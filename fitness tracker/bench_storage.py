@@ -0,0 +1,117 @@
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import dates
+import schema
+import synthetic_data
+
+# File size and scan time of workout_logs in the old layout (TEXT dates,
+# rowid tables) against the compact one (day numbers, STRICT, WITHOUT
+# ROWID where it fits). Both files get the same logs, the same indexes
+# and no triggers, so only the storage format differs.
+#
+#   python bench_storage.py --logs 5000000
+
+
+def build(path, compact, logs, exercises, seed):
+    conn = sqlite3.connect(path)
+    if compact:
+        for table, definition, _ in schema.COMPACT_TABLES:
+            conn.execute(f"CREATE TABLE {table} ({definition}")
+    else:
+        schema.create_tables(conn)
+    schema.create_indexes(conn)
+
+    conn.executemany("INSERT INTO exercises (id, name, category_id) VALUES (?, ?, 1)",
+                     [(i, f"Exercise {i}") for i in range(1, exercises + 1)])
+    rows = synthetic_data.generate_logs(random.Random(seed), logs, exercises, datetime.date(2024, 12, 31), 5)
+    while True:
+        batch = list(itertools.islice(rows, synthetic_data.BATCH_SIZE))
+        if not batch:
+            break
+        if not compact:
+            batch = [(ex_id, dates.to_iso(day), sets, reps) for ex_id, day, sets, reps in batch]
+        conn.executemany("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def table_sizes(path):
+    # Bytes used by each table and index, from the dbstat virtual table
+    conn = sqlite3.connect(path)
+    sizes = dict(conn.execute('''
+    SELECT name, SUM(pgsize) FROM dbstat
+    WHERE name IN ('workout_logs', 'idx_workout_logs_exercise_date')
+    GROUP BY name
+    '''))
+    conn.close()
+    return sizes
+
+
+def scans(compact):
+    def bound(iso):
+        return dates.to_day(iso) if compact else iso
+
+    year = (bound("2023-01-01"), bound("2023-12-31"))
+    return {
+        # No index leads with date, so these read the whole table
+        "volume in one year (full scan)":
+            ("SELECT SUM(sets * reps) FROM workout_logs WHERE date BETWEEN ? AND ?", year),
+        "logs per day (full scan)":
+            ("SELECT COUNT(*) FROM (SELECT date FROM workout_logs GROUP BY date)", ()),
+        # Through idx_workout_logs_exercise_date
+        "one exercise, one year (index)":
+            ("SELECT COUNT(*), SUM(sets * reps) FROM workout_logs WHERE exercise_id = 1 AND date BETWEEN ? AND ?",
+             year),
+    }
+
+
+def time_scans(path, compact, repeat):
+    conn = sqlite3.connect(path)
+    results = {}
+    for label, (sql, params) in scans(compact).items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append(time.perf_counter() - start)
+        results[label] = statistics.median(samples)
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Old vs compact storage format for workout_logs")
+    parser.add_argument("--logs", type=int, default=2000000)
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per scan; the median is shown")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, compact in (("old", False), ("compact", True)):
+            path = os.path.join(tmp, f"{label}.db")
+            print(f"Building the {label} layout with {args.logs} logs...")
+            build(path, compact, args.logs, args.exercises, args.seed)
+            results[label] = (os.path.getsize(path), table_sizes(path), time_scans(path, compact, args.repeat))
+
+    (old_size, old_tables, old_scans), (new_size, new_tables, new_scans) = results["old"], results["compact"]
+    print(f"\n{'':<36} {'Old':>12} {'Compact':>12} {'Change':>8}")
+    print("-" * 72)
+    rows = [("file size (MiB)", old_size / 2 ** 20, new_size / 2 ** 20)]
+    rows += [(f"{name} (MiB)", old_tables[name] / 2 ** 20, new_tables[name] / 2 ** 20) for name in old_tables]
+    rows += [(f"{label} (ms)", old_scans[label] * 1000, new_scans[label] * 1000) for label in old_scans]
+    for label, before, after in rows:
+        print(f"{label:<36} {before:>12.1f} {after:>12.1f} {(after - before) / before * 100:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import dates
+import db
+import schema
+import sync
+import synthetic_data
+
+# What a sync costs against the size of the history: two devices start
+# from copies of one database and sync once, then each logs a day of
+# workouts and the day is synced both ways. Also the extra cost the sync
+# triggers add to logging a workout, against a copy with them dropped.
+#
+#   python bench_sync.py --logs 10000 100000 1000000 --day 40
+
+
+def log_day(conn, rng, exercises, count):
+    with conn:
+        for _ in range(count):
+            conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+                         (rng.randint(1, exercises), dates.today(), rng.randint(1, 5), rng.randint(5, 15)))
+
+
+def insert_latency(conn, rng, exercises, repeat):
+    # Median ms to log one workout in its own transaction
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        log_day(conn, rng, exercises, 1)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta sync cost against the number of logs")
+    parser.add_argument("--logs", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--day", type=int, default=40, help="workouts each device logs before syncing")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = []
+    for logs in args.logs:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"Seeding {logs} logs...")
+            first_path, second_path = os.path.join(tmp, "first.db"), os.path.join(tmp, "second.db")
+            synthetic_data.build_database(first_path, exercises=args.exercises, logs=logs)
+            db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.close_connection()
+            shutil.copy(first_path, second_path)
+
+            first = db.connect(first_path)
+            second = db.connect(second_path)
+            schema.ensure_schema(second)
+            sync.new_device(second)
+            # The first sync from the copy reads through every entry once,
+            # as the original has no bookmark for it yet
+            sync.pull(first, second)
+            rng = random.Random(0)
+            log_day(first, rng, args.exercises, args.day)
+            log_day(second, rng, args.exercises, args.day)
+
+            start = time.perf_counter()
+            _, sent, _ = sync.pull(second, first)
+            _, returned, _ = sync.pull(first, second)
+            elapsed = (time.perf_counter() - start) * 1000
+
+            with_triggers = insert_latency(first, rng, args.exercises, args.repeat)
+            for table, _, _ in schema.SYNC_TABLES:
+                for name in ("insert", "update", "delete"):
+                    first.execute(f"DROP TRIGGER trg_{table}_sync_{name}")
+            without_triggers = insert_latency(first, rng, args.exercises, args.repeat)
+            first.close()
+            second.close()
+            rows.append((logs, elapsed, sent + returned, with_triggers, without_triggers))
+
+    print(f"\n{'Logs':>10} {'Sync (ms)':>10} {'Delta (KB)':>11} {'Log p50 (ms)':>13} {'No triggers':>12}")
+    print("-" * 60)
+    for logs, elapsed, size, with_triggers, without_triggers in rows:
+        print(f"{logs:>10} {elapsed:>10.1f} {size / 1024:>11.1f} {with_triggers:>13.3f} {without_triggers:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import dates
+import db
+import write_queue
+
+# Concurrent logging throughput: every thread committing its own inserts
+# (how log_workout works today) against the group-commit write queue.
+#
+#   python bench_write_queue.py --threads 8 --logs 500
+
+
+def setup(path):
+    db.set_database_path(path)
+    conn = db.get_connection()
+    conn.execute("INSERT INTO exercise_categories (name) VALUES ('Legs')")
+    conn.executemany(
+        "INSERT INTO exercises (name, category_id, description) VALUES (?, 1, '')",
+        [(f"Exercise {i}",) for i in range(20)]
+    )
+    conn.commit()
+
+
+def run_threads(threads, work):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        mine = work(n)
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def per_call_commits(threads, logs, synchronous):
+    def work(n):
+        conn = db.get_connection()
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        latencies = []
+        for i in range(logs):
+            start = time.perf_counter()
+            conn.execute(
+                "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+                (1 + (n + i) % 20, dates.to_day("2024-05-01"), 3, 10)
+            )
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+        db.close_connection()
+        return latencies
+
+    return run_threads(threads, work)
+
+
+def group_commit(threads, logs, synchronous, max_batch, max_delay_ms):
+    writer = write_queue.WriteQueue(max_batch=max_batch, max_delay_ms=max_delay_ms,
+                                    synchronous=synchronous).start()
+
+    def work(n):
+        latencies = []
+        for i in range(logs):
+            start = time.perf_counter()
+            writer.submit(1 + (n + i) % 20, "2024-05-01", 3, 10).result()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    elapsed, latencies = run_threads(threads, work)
+    writer.stop()
+    return elapsed, latencies, writer.metrics()
+
+
+def report(label, total, elapsed, latencies):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<20} {total / elapsed:>10.0f} logs/s  p50 {statistics.median(latencies) * 1000:>7.2f} ms  "
+          f"p99 {p99 * 1000:>7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call commits vs group commit")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--logs", type=int, default=500, help="logs per thread")
+    parser.add_argument("--synchronous", default="FULL", choices=["NORMAL", "FULL"])
+    parser.add_argument("--max-batch", type=int, default=write_queue.DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-delay-ms", type=float, default=write_queue.DEFAULT_MAX_DELAY_MS)
+    args = parser.parse_args()
+    total = args.threads * args.logs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(os.path.join(tmp, "per_call.db"))
+        elapsed, latencies = per_call_commits(args.threads, args.logs, args.synchronous)
+        report("per-call commits", total, elapsed, latencies)
+
+        setup(os.path.join(tmp, "group.db"))
+        elapsed, latencies, metrics = group_commit(args.threads, args.logs, args.synchronous,
+                                                   args.max_batch, args.max_delay_ms)
+        report("group commit", total, elapsed, latencies)
+        print(f"  {metrics['batches']} batches, average {metrics['avg_batch_size']:.1f} logs, "
+              f"largest {metrics['max_batch_size']}, peak queue depth {metrics['max_queue_depth']}")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import builtins
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+import db
+import instrumentation
+import synthetic_data
+
+# Times every core menu operation against synthetic databases of growing
+# size. The menu functions are driven with scripted answers to their
+# prompts and their output is discarded.
+#
+#   python benchmark.py --logs 1000,100000,10000000 --output before.json
+#   python benchmark.py --logs 1000,100000 --output after.json --compare before.json
+
+DEFAULT_SCALES = "1000,10000,100000"
+
+
+class ScriptedInput:
+    # Stands in for input(): returns the given answers in order, then
+    # presses Enter (accepting every default) for any further prompt
+    def __init__(self, answers):
+        self.answers = list(answers)
+
+    def __call__(self, prompt=""):
+        return self.answers.pop(0) if self.answers else ""
+
+
+def scratch_category(conn, i):
+    # A category with a few exercises, to be deleted by the benchmark
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO exercise_categories (name) VALUES (?)", (f"Scratch {i}",))
+    category_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO exercises (name, category_id, description) VALUES (?, ?, '')",
+        [(f"Scratch exercise {i}.{n}", category_id) for n in range(5)]
+    )
+    conn.commit()
+    return category_id
+
+
+def operations(tracker, conn):
+    # name -> (menu function, setup returning the answers for iteration i)
+    return {
+        "add_exercise": (tracker.add_exercise,
+                         lambda i: ["1", f"Bench exercise {i}", "Added by the benchmark"]),
+        "create_workout_routine": (tracker.create_workout_routine,
+                                   lambda i: [f"Bench routine {i}", "1", str(1 + i % 10), "3", "10", "n"]),
+        "log_workout": (tracker.log_workout,
+                        lambda i: [str(1 + i % 50)]),
+        "view_exercise_progress": (tracker.view_exercise_progress,
+                                   lambda i: ["1"]),
+        "view_fitness_goals": (tracker.view_fitness_goals,
+                               lambda i: []),
+        "delete_exercise_category": (tracker.delete_exercise_category,
+                                     lambda i: [str(scratch_category(conn, i)), "y"]),
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def run_operation(function, setup, iterations):
+    samples = []
+    with open(os.devnull, "w") as devnull:
+        for i in range(iterations):
+            answers = setup(i)
+            with mock.patch.object(builtins, "input", ScriptedInput(answers)), \
+                    contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                with instrumentation.operation(function.__name__):
+                    function()
+                samples.append(time.perf_counter() - start)
+
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.mean(samples) * 1000,
+        "ops_per_sec": len(samples) / sum(samples),
+    }
+
+
+def run_scale(logs, iterations, seed, tmp):
+    path = os.path.join(tmp, f"bench_{logs}.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tracker = synthetic_data.build_database(path, logs=logs, seed=seed)
+    conn = db.get_connection()
+    # Only the menu operations should show up in the profile
+    instrumentation.reset()
+
+    results = {}
+    for name, (function, setup) in operations(tracker, conn).items():
+        results[name] = run_operation(function, setup, iterations)
+        print(f"  {name:<26} p50 {results[name]['p50_ms']:>8.3f} ms  "
+              f"p95 {results[name]['p95_ms']:>8.3f} ms  p99 {results[name]['p99_ms']:>8.3f} ms  "
+              f"{results[name]['ops_per_sec']:>10.1f} ops/s")
+
+    db.close_connection()
+    return results
+
+
+def compare(current, baseline_path, threshold):
+    # Prints p95 changes against an earlier run; returns True on a regression
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    regressed = False
+    print(f"\nCompared with {baseline_path} (p95):")
+    for scale, operations_results in current.items():
+        for name, result in operations_results.items():
+            before = baseline.get(scale, {}).get(name)
+            if not before:
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+            flag = "  REGRESSION" if change > threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"  {scale:>10} logs {name:<26} {before['p95_ms']:>8.3f} -> {result['p95_ms']:>8.3f} ms "
+                  f"({change:+.1f}%){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fitness tracker menu operations")
+    parser.add_argument("--logs", default=DEFAULT_SCALES,
+                        help=f"comma-separated workout_logs sizes (default {DEFAULT_SCALES})")
+    parser.add_argument("--iterations", type=int, default=200, help="runs per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="p95 slowdown in percent reported as a regression")
+    parser.add_argument("--profile", type=int, metavar="N",
+                        help="also print the N slowest statements per scale (adds some overhead)")
+    args = parser.parse_args()
+    if args.profile:
+        instrumentation.enable()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for logs in [int(n) for n in args.logs.split(",")]:
+            print(f"{logs} workout logs:")
+            results[str(logs)] = run_scale(logs, args.iterations, args.seed, tmp)
+            if args.profile:
+                print()
+                instrumentation.dump(top=args.profile)
+                print()
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "iterations": args.iterations,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
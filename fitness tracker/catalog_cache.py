@@ -0,0 +1,143 @@
+import collections
+import threading
+import weakref
+
+# In-process read-through cache for the exercise catalog: categories, the
+# exercises in each category and exercise names by id. The catalog is small
+# and rarely changes, but every picker in the menus reads it.
+#
+# Entries are kept per database file, so connections to different files
+# (shards, say) never see each other's catalog. Triggers on the catalog
+# tables bump catalog_version, and a read that finds it changed drops that
+# database's entries, whichever connection or process made the edit. Other
+# writes (logging workouts, say) leave the cache alone. catalog_version is
+# only read again once something may have been committed since the
+# connection last looked: PRAGMA data_version moves when another
+# connection commits, and total_changes when this one writes.
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+class CatalogCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()
+        # database file -> the catalog_version its entries were read at
+        self._catalog_versions = {}
+        # conn -> (its main database file, (data_version, total_changes)
+        # when it last read catalog_version). Weak, so a closed connection's
+        # entry goes with it.
+        self._connections = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _invalidate_database(self, database):
+        # Called with the lock held
+        for key in [key for key in self._entries if key[0] == database]:
+            del self._entries[key]
+        self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def _check_catalog_version(self, conn):
+        # Drops the database's entries if its catalog changed; returns the
+        # database. Inside a transaction the connection may hold catalog
+        # edits it hasn't committed (and may roll back), so the version is
+        # always read then, and read again after.
+        marker = None
+        if not conn.in_transaction:
+            marker = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        with self._lock:
+            seen = self._seen(conn)
+        if seen is not None and marker is not None and seen[1] == marker:
+            return seen[0]
+
+        database = seen[0] if seen else conn.execute("PRAGMA database_list").fetchone()[2]
+        version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+        with self._lock:
+            self._remember(conn, (database, marker))
+            if self._catalog_versions.get(database) != version:
+                if database in self._catalog_versions:
+                    self._invalidate_database(database)
+                self._catalog_versions[database] = version
+        return database
+
+    def _seen(self, conn):
+        # Called with the lock held. Connections that can't be weakly
+        # referenced (not opened by db.connect()) are checked every time.
+        try:
+            return self._connections.get(conn)
+        except TypeError:
+            return None
+
+    def _remember(self, conn, seen):
+        # Called with the lock held
+        try:
+            self._connections[conn] = seen
+        except TypeError:
+            pass
+
+    def _get(self, conn, key, load):
+        database = self._check_catalog_version(conn)
+        key = (database,) + key
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = load()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            # Drop the least recently used entries beyond the limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def categories(self, conn):
+        # ((id, name), ...) for every category
+        return self._get(conn, ("categories",), lambda: tuple(
+            conn.execute("SELECT id, name FROM exercise_categories WHERE deleted_at IS NULL")
+        ))
+
+    def category_name(self, conn, category_id):
+        def load():
+            row = conn.execute(
+                "SELECT name FROM exercise_categories WHERE id=? AND deleted_at IS NULL", (category_id,)
+            ).fetchone()
+            return row[0] if row else None
+        return self._get(conn, ("category", category_id), load)
+
+    def exercises_in_category(self, conn, category_id):
+        # ((id, name, description), ...) for the category's exercises
+        return self._get(conn, ("exercises", category_id), lambda: tuple(
+            conn.execute("SELECT id, name, description FROM exercises WHERE category_id=?", (category_id,))
+        ))
+
+    def exercise_name(self, conn, exercise_id):
+        def load():
+            row = conn.execute("SELECT name FROM exercises WHERE id=?", (exercise_id,)).fetchone()
+            return row[0] if row else None
+        return self._get(conn, ("exercise", exercise_id), load)
+
+
+# Shared by the whole app
+catalog = CatalogCache()
+
+categories = catalog.categories
+category_name = catalog.category_name
+exercises_in_category = catalog.exercises_in_category
+exercise_name = catalog.exercise_name
+stats = catalog.stats
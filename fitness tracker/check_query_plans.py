@@ -0,0 +1,448 @@
+import argparse
+import ast
+import glob
+import importlib
+import inspect
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import textwrap
+
+import archive
+import db
+
+# Runs EXPLAIN QUERY PLAN on every SQL statement the app executes, and on
+# every statement in the schema's triggers, and fails if one of them walks
+# a whole large table instead of using an index, or searches one on a
+# column that only takes a handful of values (volume_rollups by scope
+# alone, say). tests/test_query_plans.py runs it with the other tests.
+#
+#   python check_query_plans.py
+#   python check_query_plans.py --verbose    # also list what was skipped
+#
+# Statements are found wherever .execute(), .executemany() or
+# archive.read_logs() is called, as literals, module constants (dicts and
+# lists of them too), f-strings and concatenations of those. Names set in the calling function and loops
+# over module constants are followed; anything that still depends on run
+# time values is skipped. A statement without a WHERE clause lists a whole
+# table on purpose, so its outer loop may scan one, but not a join or a
+# correlated subquery: those would scan a large table once per row.
+#
+# Deliberate full passes (rebuilds, say) are marked /* full scan */ and
+# not checked. Every function or constant using the marker has to be
+# listed in FULL_SCAN_ALLOWED with the reason it may.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LARGE_TABLES = {"workout_logs", "exercises", "goals", "routine_exercises", "volume_rollups",
+                "exercise_stats", "category_volume_prefix", "sync_rows"}
+
+FULL_SCAN = "/* full scan */"
+
+# "module.function" or "module.CONSTANT" -> why its SQL may read whole tables
+FULL_SCAN_ALLOWED = {
+    "bench_search.list_everything": "the picker listing the benchmark compares the search against",
+    "bench_search.like_search": "the LIKE search that full-text search replaced, as the benchmark's baseline",
+    "maintenance.recompute_goals": "recomputes every goal from every log",
+    "maintenance.full_exercise_stats_query": "exercise_stats from scratch, when no condition limits it",
+    "maintenance.volume_rollups_query": "volume_rollups from scratch, one logs table at a time",
+    "maintenance.VOLUME_PREFIX_QUERY": "category_volume_prefix from scratch, from every category's day rollups",
+    "schema.create_exercise_stats": "migration 4 fills exercise_stats from every log",
+    "schema.create_volume_rollups": "migration 5 fills volume_rollups from every log",
+    "schema.compact_storage": "migration 8 copies every log, and recomputes every goal and rollup from them",
+    "schema.create_goal_windows": "migration 11 fills category_volume_prefix from every category's day rollups",
+}
+
+# Columns with a few values over the whole table: an index search on them
+# alone reads a large share of it
+CONSTANT_LIKE_COLUMNS = {"scope", "period", "tbl"}
+
+SQL_KEYWORDS = {"WHERE", "JOIN", "LEFT", "INNER", "CROSS", "ON", "ORDER", "GROUP",
+                "LIMIT", "SET", "VALUES", "USING", "AS", "UNION", "HAVING"}
+
+STATEMENT_TYPES = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+# What runs SQL, and which argument the statement is
+EXECUTE_CALLS = {"execute": 0, "executemany": 0, "read_logs": 1}
+
+# What working out a statement may call: string methods, these builtins
+# and the app's own functions that only call those (the SQL builders)
+STRING_METHODS = {"join", "format", "upper", "lower", "replace", "strip", "split"}
+SAFE_BUILTINS = {len, str, int, range, sorted, tuple, list, enumerate, zip, min, max}
+
+
+def load_module(path):
+    if os.path.basename(path) == "import sqlite3.py":
+        return db.load_tracker()
+    return importlib.import_module(os.path.splitext(os.path.basename(path))[0])
+
+
+def safe_call(call, env):
+    if isinstance(call.func, ast.Attribute) and call.func.attr in STRING_METHODS:
+        return True
+    callee = evaluate_safely(call.func, env)
+    if any(callee is builtin for builtin in SAFE_BUILTINS):
+        return True
+    return inspect.isfunction(callee) and os.path.dirname(inspect.getfile(callee)) == HERE and pure(callee)
+
+
+# function -> whether it is pure; False while its body is being checked,
+# so recursion doesn't count as pure
+_pure = {}
+
+
+def pure(function):
+    # Whether every call the function makes is safe
+    if function not in _pure:
+        _pure[function] = False
+        tree = ast.parse(textwrap.dedent(inspect.getsource(function)))
+        _pure[function] = all(safe_call(node, function.__globals__)
+                              for node in ast.walk(tree) if isinstance(node, ast.Call))
+    return _pure[function]
+
+
+def evaluate_safely(node, env):
+    # Like evaluate(), for a node with no calls
+    if any(isinstance(child, ast.Call) for child in ast.walk(node)):
+        return None
+    return evaluate(node, env)
+
+
+def evaluate(node, env):
+    # The node's value given the names in env, or None if it needs anything
+    # only known at run time or would call something with side effects
+    if not all(safe_call(child, env) for child in ast.walk(node) if isinstance(child, ast.Call)):
+        return None
+    try:
+        return eval(compile(ast.Expression(node), "<sql>", "eval"), env)
+    except Exception:
+        return None
+
+
+def possible_values(node, env):
+    # Every value the node can have. A dict looked up with a key known only
+    # at run time, by [] or .get(), can give any of its values.
+    value = evaluate(node, env)
+    if value is not None:
+        return [value]
+    if isinstance(node, ast.Subscript):
+        container = evaluate(node.value, env)
+    elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "get"
+          and len(node.args) in (1, 2)):
+        container = evaluate(node.func.value, env)
+    else:
+        return None
+    if not isinstance(container, dict):
+        return None
+    values = list(container.values())
+    if isinstance(node, ast.Call) and len(node.args) == 2:
+        values.append(evaluate(node.args[1], env))
+    return values
+
+
+def statements(node, env):
+    # Every SQL string an .execute() argument can be
+    values = possible_values(node, env)
+    if values is None or not all(isinstance(value, str) for value in values):
+        return None
+    return values
+
+
+def bind(target, value, env):
+    # Assigns value to a Name or a tuple of Names, as Python would
+    if isinstance(target, ast.Name):
+        env[target.id] = value
+    elif isinstance(target, ast.Tuple) and isinstance(value, (tuple, list)) and len(value) == len(target.elts):
+        for element, item in zip(target.elts, value):
+            bind(element, item, env)
+    else:
+        unbind(target, env)
+
+
+def unbind(target, env):
+    for node in ast.walk(target):
+        if isinstance(node, ast.Name):
+            env.pop(node.id, None)
+
+
+class Finder:
+    def __init__(self, filename, module_env):
+        self.filename = filename
+        self.module_env = module_env
+        self.found = {}
+        self.skipped = set()
+
+    def calls(self, node, env):
+        for child in ast.walk(node):
+            if not (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)):
+                continue
+            position = EXECUTE_CALLS.get(child.func.attr)
+            if position is None or len(child.args) <= position:
+                continue
+            where = f"{self.filename}:{child.lineno}"
+            sqls = statements(child.args[position], env)
+            if sqls is None:
+                self.skipped.add((where, "built from run time values"))
+                continue
+            for sql in sqls:
+                self.found.setdefault(where, set()).add(sql)
+
+    def visit(self, body, env, module_level=False):
+        # Walks statements in order, following simple assignments, and each
+        # iteration of a loop over a value known up front. At module level
+        # env already holds what the imported module assigned.
+        for stmt in body:
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.visit(stmt.body, dict(env))
+            elif isinstance(stmt, ast.ClassDef):
+                self.visit(stmt.body, dict(env))
+            elif isinstance(stmt, (ast.For, ast.AsyncFor)):
+                self.calls(stmt.iter, env)
+                iterables = possible_values(stmt.iter, env)
+                if iterables and all(isinstance(items, (list, tuple, dict, set, frozenset, range))
+                                     for items in iterables):
+                    for items in iterables:
+                        for item in items:
+                            loop_env = dict(env)
+                            bind(stmt.target, item, loop_env)
+                            self.visit(stmt.body, loop_env)
+                else:
+                    unbind(stmt.target, env)
+                    self.visit(stmt.body, env)
+                self.visit(stmt.orelse, env)
+            elif isinstance(stmt, (ast.If, ast.While)):
+                self.calls(stmt.test, env)
+                self.visit(stmt.body, env)
+                self.visit(stmt.orelse, env)
+            elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+                for item in stmt.items:
+                    self.calls(item.context_expr, env)
+                    if item.optional_vars is not None:
+                        unbind(item.optional_vars, env)
+                self.visit(stmt.body, env)
+            elif isinstance(stmt, ast.Try):
+                self.visit(stmt.body, env)
+                for handler in stmt.handlers:
+                    self.visit(handler.body, env)
+                self.visit(stmt.orelse, env)
+                self.visit(stmt.finalbody, env)
+            else:
+                self.calls(stmt, env)
+                if module_level:
+                    continue
+                if isinstance(stmt, ast.Assign):
+                    value = evaluate(stmt.value, env)
+                    for target in stmt.targets:
+                        if value is None:
+                            unbind(target, env)
+                        else:
+                            bind(target, value, env)
+                elif isinstance(stmt, (ast.AugAssign, ast.AnnAssign)):
+                    unbind(stmt.target, env)
+
+
+def find_queries():
+    # [(where, sql)] for every statement passed to .execute()/.executemany()
+    # in the app's modules, and [(where, why)] for the calls whose SQL
+    # couldn't be worked out
+    queries = []
+    skipped = set()
+    for path in sorted(glob.glob(os.path.join(HERE, "*.py"))):
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        finder = Finder(os.path.basename(path), dict(vars(load_module(path))))
+        finder.visit(tree.body, dict(finder.module_env), module_level=True)
+        for where, sqls in finder.found.items():
+            for sql in sqls:
+                sql = " ".join(sql.split())
+                if statement_type(sql) in STATEMENT_TYPES:
+                    queries.append((where, sql))
+        skipped |= finder.skipped
+    return sorted(set(queries), key=lambda query: (location(query[0]), query[1])), list(skipped)
+
+
+def location(where):
+    # Sort key for "file.py:123", by line number within each file
+    name, _, line = where.rpartition(":")
+    return (name, int(line)) if line.isdigit() else (where, 0)
+
+
+def statement_type(sql):
+    # The first keyword, after any leading comments
+    sql = re.sub(r"^(\s*/\*.*?\*/)*\s*", "", sql, flags=re.S)
+    return sql.split(" ", 1)[0].upper()
+
+
+def trigger_queries(conn):
+    # [(where, sql)] for each statement in a trigger body, with NEW.x and
+    # OLD.x as parameters
+    queries = []
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' ORDER BY name"):
+        body = sql[re.search(r"\bBEGIN\b", sql, re.I).end():re.search(r"\bEND\s*$", sql, re.I).start()]
+        for statement in body.split(";"):
+            statement = re.sub(r"\b(?:NEW|OLD)\.\w+", "?", " ".join(statement.split()))
+            if statement_type(statement) in STATEMENT_TYPES:
+                queries.append((f"trigger {name}", statement))
+    return queries
+
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def bind_parameters(sql):
+    names = re.findall(r":(\w+)", sql)
+    if names:
+        return {name: None for name in names}
+    return (None,) * sql.count("?")
+
+
+def correlated(steps, parent):
+    # Whether a plan step runs inside a correlated subquery, once per row
+    while parent in steps:
+        parent, detail = steps[parent]
+        if detail.startswith("CORRELATED"):
+            return True
+    return False
+
+
+def check(conn, sql):
+    # Returns the plan steps that read too much of a large table
+    if FULL_SCAN in sql:
+        return []
+
+    filtered = re.search(r"\bWHERE\b", sql, re.I) is not None
+    aliases = table_aliases(sql)
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql, bind_parameters(sql)).fetchall()
+    steps = {node: (parent, detail) for node, parent, _, detail in plan}
+    # Plan nodes whose first loop has been seen: steps after it under the
+    # same node are inner loops of a join
+    looped = set()
+    flagged = []
+    for node, parent, _, detail in plan:
+        match = re.match(r"(SCAN|SEARCH) (\w+)(?: USING .*?\((.*)\))?", detail)
+        if not match or detail.startswith("SCAN CONSTANT ROW"):
+            continue
+        outer = parent not in looped and not correlated(steps, parent)
+        looped.add(parent)
+        if aliases.get(match.group(2), match.group(2)) not in LARGE_TABLES:
+            continue
+        if match.group(1) == "SCAN":
+            if filtered or not outer:
+                flagged.append(detail)
+        elif "AUTOMATIC" in detail:
+            # Built by reading the whole table, every time the statement runs
+            flagged.append(detail)
+        elif match.group(3):
+            columns = set(re.findall(r"(\w+)\s*(?:=|>|<|IN\b)", match.group(3)))
+            if columns <= CONSTANT_LIKE_COLUMNS:
+                flagged.append(detail)
+    return flagged
+
+
+def enclosing(body, line, prefix=""):
+    # Name of the function, method or module constant the line is in
+    for node in body:
+        if not node.lineno <= line <= node.end_lineno:
+            continue
+        if isinstance(node, ast.ClassDef):
+            return enclosing(node.body, line, f"{prefix}{node.name}.")
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return prefix + node.name
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            return prefix + node.targets[0].id
+    return prefix + "<module>"
+
+
+def full_scans():
+    # [(where, "module.name")] for every /* full scan */ in the app's modules
+    found = []
+    for path in sorted(glob.glob(os.path.join(HERE, "*.py"))):
+        if os.path.abspath(path) == os.path.abspath(__file__):
+            continue
+        with open(path) as f:
+            source = f.read()
+        if FULL_SCAN not in source:
+            continue
+        tree = ast.parse(source, path)
+        module = os.path.splitext(os.path.basename(path))[0]
+        for number, line in enumerate(source.splitlines(), 1):
+            if FULL_SCAN in line:
+                found.append((f"{os.path.basename(path)}:{number}", f"{module}.{enclosing(tree.body, number)}"))
+    return found
+
+
+def check_full_scans():
+    # ([(where, name)] of markers FULL_SCAN_ALLOWED doesn't list, [names]
+    # it lists that no longer use one)
+    found = full_scans()
+    unlisted = [(where, name) for where, name in found if name not in FULL_SCAN_ALLOWED]
+    unused = sorted(set(FULL_SCAN_ALLOWED) - {name for _, name in found})
+    return unlisted, unused
+
+
+def run():
+    # (statements checked, [(where, sql, flagged plan steps)], [(where, why
+    # skipped)])
+    queries, skipped = find_queries()
+    previous = db.get_database_path()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_database_path(os.path.join(tmp, "plans.db"))
+        conn = db.get_connection()
+        # The temp objects archive.py's statements use
+        archive.attach_archives(conn)
+        conn.execute(archive.BATCH_TABLE)
+        queries += trigger_queries(conn)
+
+        checked = 0
+        failures = []
+        for where, sql in queries:
+            try:
+                flagged = check(conn, sql)
+            except sqlite3.OperationalError as error:
+                # Tables the app creates just before using them
+                if not str(error).startswith("no such table"):
+                    raise
+                skipped.append((where, str(error)))
+                continue
+            checked += 1
+            if flagged:
+                failures.append((where, sql, flagged))
+
+        db.set_database_path(previous)
+    return checked, failures, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plan of every statement the app runs")
+    parser.add_argument("--verbose", action="store_true", help="list the calls that were skipped")
+    args = parser.parse_args()
+
+    checked, failures, skipped = run()
+    for where, sql, flagged in failures:
+        print(f"FAIL {where}: {sql}")
+        for detail in flagged:
+            print(f"    {detail}")
+    unlisted, unused = check_full_scans()
+    for where, name in unlisted:
+        print(f"FAIL {where}: {FULL_SCAN} in {name}, which FULL_SCAN_ALLOWED doesn't list")
+    for name in unused:
+        print(f"FAIL FULL_SCAN_ALLOWED lists {name}, which has no {FULL_SCAN}")
+
+    if args.verbose:
+        for where, why in sorted(skipped, key=lambda item: location(item[0])):
+            print(f"SKIP {where}: {why}")
+    print(f"{checked} statements checked, {len(failures)} reading too much of a large table, "
+          f"{len(skipped)} skipped")
+    return 1 if failures or unlisted or unused else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import argparse
+import array
+import itertools
+import mmap
+import os
+import struct
+import sys
+
+import archive
+import dates
+import db
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Columnar copy of workout_logs, archived years included, for analysis.
+# Each column is its own file of fixed-width little-endian int32 values
+# behind a small header, so a reader can memory-map it and get an array
+# without copying or parsing. Rows are in no particular order.
+#
+#   python columnar.py export columns/           # only appends new logs
+#   python columnar.py totals columns/
+#   python columnar.py rolling columns/ 3 --window 7
+#
+# Exporting needs only the standard library; the analytics need numpy.
+# The export appends logs above the last exported id, so edits and deletes
+# of rows already exported show up only after export(rebuild=True).
+
+COLUMNS = ("exercise_id", "day", "sets", "reps", "volume")
+
+# magic, format version, bytes per value, rows, last exported log id
+HEADER = struct.Struct("<8sHHQq")
+HEADER_SIZE = 32
+MAGIC = b"FTCOLUMN"
+VERSION = 1
+ITEM_SIZE = 4
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def column_path(directory, name):
+    return os.path.join(directory, f"{name}.col")
+
+
+def read_header(path):
+    # (rows, last_id) of a column file; (0, 0) if it doesn't exist yet
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, "rb") as f:
+        magic, version, item_size, rows, last_id = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or item_size != ITEM_SIZE:
+        raise ValueError(f"{path} is not a version {VERSION} column file")
+    return rows, last_id
+
+
+def write_header(f, rows, last_id):
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, ITEM_SIZE, rows, last_id).ljust(HEADER_SIZE, b"\0"))
+
+
+def export(directory, conn=None, chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False, progress=None):
+    # Appends the logs above the last exported id; returns how many. The
+    # headers are written last, so an interrupted export leaves the files
+    # as they were and the next one writes over the partial tail.
+    conn = conn or db.get_connection()
+    os.makedirs(directory, exist_ok=True)
+    paths = [column_path(directory, name) for name in COLUMNS]
+
+    if rebuild:
+        rows, last_id = 0, 0
+    else:
+        # The columns only disagree if a crash hit while headers were written
+        rows, last_id = min(read_header(path) for path in paths)
+
+    files = []
+    for path in paths:
+        f = open(path, "r+b" if os.path.exists(path) else "w+b")
+        write_header(f, rows, last_id)
+        f.truncate(HEADER_SIZE + rows * ITEM_SIZE)
+        f.seek(0, os.SEEK_END)
+        files.append(f)
+
+    # The hot logs, then each archived year's. Log ids are never reused,
+    # so a log archived since the last export is still above its id.
+    exported_id = last_id
+    added = 0
+    try:
+        for schema in itertools.chain(["main"], archive.each_archive(conn)):
+            cursor = conn.execute(f'''
+            SELECT id, COALESCE(exercise_id, 0), date, COALESCE(sets, 0), COALESCE(reps, 0)
+            FROM {schema}.workout_logs
+            WHERE id > ?
+            ORDER BY id
+            ''', (exported_id,))
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                ids, exercise_ids, days, sets, reps = zip(*chunk)
+                values = (exercise_ids, days, sets, reps, [s * r for s, r in zip(sets, reps)])
+                for f, column in zip(files, values):
+                    data = array.array("i", column)
+                    if sys.byteorder == "big":
+                        data.byteswap()
+                    f.write(data.tobytes())
+                added += len(chunk)
+                last_id = max(last_id, ids[-1])
+                if progress:
+                    progress(rows + added)
+
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+            write_header(f, rows + added, last_id)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+    return added
+
+
+class Columns:
+    # The exported columns as read-only arrays over the mapped files:
+    # numpy arrays if numpy is installed, memoryviews otherwise
+    def __init__(self, directory):
+        self.directory = directory
+        headers = [read_header(column_path(directory, name)) for name in COLUMNS]
+        self.rows, self.last_id = min(headers)
+        self._maps = []
+        for name in COLUMNS:
+            setattr(self, name, self._map(column_path(directory, name)))
+
+    def _map(self, path):
+        if self.rows == 0:
+            return numpy.zeros(0, dtype="<i4") if numpy else memoryview(b"").cast("i")
+        if numpy:
+            return numpy.memmap(path, dtype="<i4", mode="r", offset=HEADER_SIZE, shape=(self.rows,))
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)[HEADER_SIZE:HEADER_SIZE + self.rows * ITEM_SIZE].cast("i")
+
+    def __len__(self):
+        return self.rows
+
+
+def open_columns(directory):
+    return Columns(directory)
+
+
+def _require_numpy():
+    if numpy is None:
+        raise RuntimeError("The columnar analytics need numpy (pip install numpy)")
+
+
+def exercise_totals(columns):
+    # [(exercise_id, logs, total sets, total reps, total volume, max volume)]
+    # for every exercise with at least one log
+    _require_numpy()
+    exercise_ids = columns.exercise_id
+    size = int(exercise_ids.max()) + 1 if len(columns) else 0
+    logs = numpy.bincount(exercise_ids, minlength=size)
+    sets = numpy.bincount(exercise_ids, weights=columns.sets, minlength=size)
+    reps = numpy.bincount(exercise_ids, weights=columns.reps, minlength=size)
+    volume = numpy.bincount(exercise_ids, weights=columns.volume, minlength=size)
+    maxima = numpy.zeros(size, dtype=numpy.int64)
+    numpy.maximum.at(maxima, exercise_ids, columns.volume)
+
+    present = numpy.flatnonzero(logs)
+    return [(int(ex_id), int(logs[ex_id]), int(sets[ex_id]), int(reps[ex_id]), int(volume[ex_id]),
+             int(maxima[ex_id])) for ex_id in present]
+
+
+def daily_volume(columns, exercise_id):
+    # (first day, volume per day from then to the last logged day)
+    _require_numpy()
+    mask = columns.exercise_id == exercise_id
+    days = columns.day[mask]
+    if not len(days):
+        return None, numpy.zeros(0)
+    first = int(days.min())
+    return first, numpy.bincount(days - first, weights=columns.volume[mask])
+
+
+def rolling_average(columns, exercise_id, window=7):
+    # [(date, average daily volume over the window ending that day)] for
+    # every day from the exercise's first log to its last. The first
+    # window - 1 days average over the days since the first log.
+    if window < 1:
+        raise ValueError("The window must be at least 1 day")
+    first, volume = daily_volume(columns, exercise_id)
+    if first is None:
+        return []
+    sums = numpy.cumsum(volume)
+    sums[window:] = sums[window:] - sums[:-window]
+    averages = sums / numpy.minimum(numpy.arange(1, len(sums) + 1), window)
+    return [(dates.to_date(first + offset), float(value)) for offset, value in enumerate(averages)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar export of workout_logs and analytics over it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="append new logs to the column files")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    export_parser.add_argument("--rebuild", action="store_true", help="export everything again")
+    totals_parser = subparsers.add_parser("totals", help="per-exercise totals and maxima")
+    totals_parser.add_argument("directory")
+    rolling_parser = subparsers.add_parser("rolling", help="rolling average daily volume for an exercise")
+    rolling_parser.add_argument("directory")
+    rolling_parser.add_argument("exercise_id", type=int)
+    rolling_parser.add_argument("--window", type=int, default=7, help="days")
+    args = parser.parse_args()
+    if args.command == "rolling" and args.window < 1:
+        parser.error("--window must be at least 1 day")
+
+    if args.command == "export":
+        added = export(args.directory, chunk_size=args.chunk_size, rebuild=args.rebuild,
+                       progress=lambda rows: print(f"  {rows} rows", end="\r"))
+        print(f"Exported {added} new logs to {args.directory}")
+    elif args.command == "totals":
+        print(f"{'Exercise':>8} {'Logs':>9} {'Sets':>10} {'Reps':>11} {'Volume':>12} {'Max':>6}")
+        for row in exercise_totals(open_columns(args.directory)):
+            print(f"{row[0]:>8} {row[1]:>9} {row[2]:>10} {row[3]:>11} {row[4]:>12} {row[5]:>6}")
+    else:
+        for day, average in rolling_average(open_columns(args.directory), args.exercise_id, args.window):
+            print(f"{day.isoformat():<12} {average:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
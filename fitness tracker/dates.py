@@ -0,0 +1,97 @@
+import datetime
+import re
+import sqlite3
+
+# Calendar dates are stored as INTEGER day numbers: days since 1970-01-01.
+# They take 1-3 bytes instead of 10, compare as integers, and can't hold a
+# malformed date. Everything the user sees or types is still YYYY-MM-DD;
+# these helpers convert at the edges.
+#
+#   dates.to_day("2024-05-01")  -> 19844
+#   dates.to_iso(19844)         -> "2024-05-01"
+
+EPOCH = datetime.date(1970, 1, 1)
+# Julian day number of EPOCH, for doing the same conversions in SQL
+EPOCH_JULIAN_DAY = 2440587.5
+
+_LEGACY_DATE = re.compile(r"\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+
+
+def to_day(value):
+    # Day number for a date, datetime, ISO string or day number
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = parse_date(value)
+    return (value - EPOCH).days
+
+
+def to_date(day):
+    return EPOCH + datetime.timedelta(days=day)
+
+
+def to_iso(day):
+    # YYYY-MM-DD for display; None stays None
+    return None if day is None else to_date(day).isoformat()
+
+
+def today():
+    return to_day(datetime.date.today())
+
+
+def parse_date(text):
+    # Strict YYYY-MM-DD, as typed at a prompt; raises ValueError otherwise
+    text = text.strip()
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", text):
+        raise ValueError(f"Invalid date: {text!r}")
+    return datetime.date.fromisoformat(text)
+
+
+def parse_day(text):
+    return to_day(parse_date(text))
+
+
+def parse_legacy(text):
+    # Best-effort reading of the free-text dates stored before the compact
+    # schema (2024-5-1, 2024/05/01, a trailing time...); None if hopeless
+    if text is None:
+        return None
+    if isinstance(text, int):
+        return text
+    match = _LEGACY_DATE.match(str(text))
+    if not match:
+        return None
+    try:
+        return to_day(datetime.date(*map(int, match.groups())))
+    except ValueError:
+        return None
+
+
+MIN_DAY = to_day(datetime.date.min)
+MAX_DAY = to_day(datetime.date.max)
+
+
+# The same conversions as SQL expressions, for queries and triggers
+
+def sql_to_iso(expr):
+    return f"date({expr} + {EPOCH_JULIAN_DAY})"
+
+
+def sql_from_iso(expr):
+    return f"CAST(julianday({expr}) - {EPOCH_JULIAN_DAY} AS INTEGER)"
+
+
+def sql_week_start(expr):
+    # Monday of the day's ISO week; 1970-01-01 was a Thursday. The + 10
+    # keeps the remainder positive for days before 1970.
+    return f"({expr} - ({expr} % 7 + 10) % 7)"
+
+
+def sql_month_start(expr):
+    return sql_from_iso(f"date({expr} + {EPOCH_JULIAN_DAY}, 'start of month')")
+
+
+# date objects passed as query parameters are stored as day numbers
+sqlite3.register_adapter(datetime.date, to_day)
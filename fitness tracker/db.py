@@ -0,0 +1,103 @@
+import importlib.util
+import os
+import sqlite3
+import threading
+
+import instrumentation
+
+# Database file used by every part of the app. Override with the
+# FITNESS_TRACKER_DB environment variable or set_database_path().
+DEFAULT_DB_PATH = 'fitness_tracker.db'
+
+# Applied to every connection we open
+PRAGMAS = [
+    ("auto_vacuum", "INCREMENTAL"),  # only takes effect on a new database
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("busy_timeout", 5000),
+    ("cache_size", -16000),        # negative means KiB, so ~16 MB of page cache
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+]
+
+_db_path = os.environ.get('FITNESS_TRACKER_DB', DEFAULT_DB_PATH)
+_local = threading.local()
+# Bumped whenever the path changes so other threads reopen on next use
+_generation = 0
+_lock = threading.Lock()
+
+
+def get_database_path():
+    return _db_path
+
+
+def set_database_path(path):
+    global _db_path, _generation
+    with _lock:
+        _db_path = path
+        _generation += 1
+    close_connection()
+
+
+def connect(path=None, read_only=False, check_same_thread=True):
+    # Open a new connection with our pragmas applied. Most code should use
+    # get_connection() instead; this is for workers that need their own.
+    # check_same_thread=False is for pools that hand a connection to one
+    # thread at a time.
+    path = path or _db_path
+    factory = instrumentation.connection_factory()
+    if read_only:
+        uri = "file:" + os.path.abspath(path) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, factory=factory, check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(path, factory=factory, check_same_thread=check_same_thread)
+
+    for name, value in PRAGMAS:
+        if read_only and name in ("auto_vacuum", "journal_mode"):
+            continue
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def get_connection():
+    # One long-lived connection per thread. The schema is checked (and
+    # migrated if needed) the first time each thread connects.
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.generation == _generation:
+        return conn
+
+    if conn is not None:
+        conn.close()
+
+    # Imported here because schema depends on maintenance, which uses this module
+    import schema
+
+    conn = connect()
+    schema.ensure_schema(conn)
+    _local.conn = conn
+    _local.generation = _generation
+    return conn
+
+
+def release_connection(conn):
+    # Called where functions used to close their connection: throw away
+    # anything left uncommitted so it can't leak into the next operation.
+    if conn.in_transaction:
+        conn.rollback()
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def load_tracker():
+    # The app's file name isn't a valid module name, so tools load it by path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import sqlite3.py")
+    spec = importlib.util.spec_from_file_location("fitness_tracker", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
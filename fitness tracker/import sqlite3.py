@@ -1,112 +1,77 @@
+import math
 import sqlite3
 import os
-import datetime
+
+import analytics
+import api
+import catalog_cache
+import dates
+import db
+import instrumentation
+import maintenance
+import schema
+import search
+
+# Rows per page in the workout history view
+HISTORY_PAGE_SIZE = int(os.environ.get('FITNESS_TRACKER_PAGE_SIZE', 20))
+
+# Bounds used when the history isn't filtered by date (day numbers)
+MIN_DATE = dates.MIN_DAY
+MAX_DATE = dates.MAX_DAY
+
+# Exercise pickers list every exercise only up to this many; past that they
+# ask for search terms instead
+LIST_LIMIT = int(os.environ.get('FITNESS_TRACKER_LIST_LIMIT', 50))
 
 def create_database():
-    # Create database file if it doesn't exist
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    # The schema is set up lazily on first connection (see schema.py); this
+    # just makes sure it has been, e.g. to prepare a new database file.
+    schema.ensure_schema(db.get_connection())
+
+def show_search_results(conn, text):
+    # Prints the best matches for text; returns whether there were any
+    results = search.search_exercises(conn, text)
+    if not results:
+        print(f"No exercises match '{text}'.")
+        return False
+
+    print(f"\nBest matches for '{text}':")
+    for id, name, category, description in results:
+        print(f"{id}. {name} (Category: {category})")
+    return True
 
-    # Create exercise categories table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS exercise_categories (
-        id INTEGER PRIMARY KEY,
-        name TEXT UNIQUE NOT NULL
-    )
-    ''')
-
-    # Create exercises table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS exercises (
-        id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        category_id INTEGER,
-        description TEXT,
-        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
-    )
-    ''')
-
-    # Create workout routines table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS workout_routines (
-        id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        date_created TEXT NOT NULL
-    )
-    ''')
-
-    # Create routine exercises junction table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS routine_exercises (
-        routine_id INTEGER,
-        exercise_id INTEGER,
-        sets INTEGER,
-        reps INTEGER,
-        PRIMARY KEY (routine_id, exercise_id),
-        FOREIGN KEY (routine_id) REFERENCES workout_routines (id),
-        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
-    )
-    ''')
-
-    # Create goals table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS goals (
-        id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        target_value INTEGER,
-        current_value INTEGER DEFAULT 0,
-        category_id INTEGER,
-        deadline TEXT,
-        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
-    )
-    ''')
-
-    # Create workout logs table to track progress
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS workout_logs (
-        id INTEGER PRIMARY KEY,
-        exercise_id INTEGER,
-        date TEXT NOT NULL,
-        sets INTEGER,
-        reps INTEGER,
-        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
-    )
-    ''')
-
-    conn.commit()
-    conn.close()
-    print("Database created successfully!")
-
-# Call function to create database
-create_database()
+def input_exercise_id(conn, prompt):
+    # Reads an exercise ID. Anything else is taken as search terms: the
+    # matches are shown and the question asked again.
+    while True:
+        answer = input(prompt).strip()
+        if not answer or answer.isdigit():
+            return int(answer)
+        show_search_results(conn, answer)
 
 # Implement core function
 def add_exercise_category():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     category_name = input("Enter new exercise category name: ")
 
     try:
-        cursor.execute("INSERT INTO exercise_categories (name) VALUES (?)", (category_name,))
-        conn.commit()
+        api.add_category(category_name, conn)
         print(f"Category '{category_name}' added successfully!")
     except sqlite3.IntegrityError:
         print(f"Category '{category_name}' already exists!")
 
-    conn.close()
+    db.release_connection(conn)
 
 def view_exercises_by_category():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all categories
-    cursor.execute("SELECT id, name FROM exercise_categories")
-    categories = cursor.fetchall()
+    categories = catalog_cache.categories(conn)
 
     if not categories:
         print("No categories found. Please add some categories first.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nAvailable Categories:")
@@ -114,35 +79,33 @@ def view_exercises_by_category():
         print(f"{id}. {name}")
 
     try:
-        category_id = int(input("\nEnter category ID to view exercises: "))
+        answer = input("\nEnter category ID to view exercises, or search terms: ").strip()
+        if answer and not answer.isdigit():
+            show_search_results(conn, answer)
+            db.release_connection(conn)
+            return
+        category_id = int(answer)
 
         # Check if category exists
-        cursor.execute("SELECT name FROM exercise_categories WHERE id=?", (category_id,))
-        category = cursor.fetchone()
+        category = catalog_cache.category_name(conn, category_id)
 
         if not category:
             print("Category not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
         # Get exercises for selected category
-        cursor.execute('''
-        SELECT e.id, e.name, e.description
-        FROM exercises e
-        WHERE e.category_id=?
-        ''', (category_id,))
-
-        exercises = cursor.fetchall()
+        exercises = catalog_cache.exercises_in_category(conn, category_id)
 
         if exercises:
-            print(f"\nExercises in category '{category[0]}':")
+            print(f"\nExercises in category '{category}':")
             for id, name, description in exercises:
                 print(f"ID: {id}, Name: {name}")
                 if description:
                     print(f"Description: {description}")
                 print("-----")
         else:
-            print(f"No exercises found in category '{category[0]}'.")
+            print(f"No exercises found in category '{category}'.")
 
             # Option to add exercises
             add_option = input("Would you like to add exercises to this category? (y/n): ")
@@ -152,20 +115,18 @@ def view_exercises_by_category():
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
 
 def add_exercise(category_id=None):
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     if category_id is None:
         # Get all categories
-        cursor.execute("SELECT id, name FROM exercise_categories")
-        categories = cursor.fetchall()
+        categories = catalog_cache.categories(conn)
 
         if not categories:
             print("No categories found. Please add some categories first.")
-            conn.close()
+            db.release_connection(conn)
             return
 
         print("\nAvailable Categories:")
@@ -176,42 +137,34 @@ def add_exercise(category_id=None):
             category_id = int(input("\nEnter category ID for the new exercise: "))
 
             # Check if category exists
-            cursor.execute("SELECT name FROM exercise_categories WHERE id=?", (category_id,))
-            category = cursor.fetchone()
+            category = catalog_cache.category_name(conn, category_id)
 
             if not category:
                 print("Category not found!")
-                conn.close()
+                db.release_connection(conn)
                 return
 
         except ValueError:
             print("Invalid input. Please enter a number.")
-            conn.close()
+            db.release_connection(conn)
             return
 
     exercise_name = input("Enter exercise name: ")
     exercise_description = input("Enter exercise description (optional): ")
 
-    cursor.execute(
-        "INSERT INTO exercises (name, category_id, description) VALUES (?, ?, ?)",
-        (exercise_name, category_id, exercise_description)
-    )
-
-    conn.commit()
+    api.add_exercise(exercise_name, category_id, exercise_description, conn)
     print(f"Exercise '{exercise_name}' added successfully!")
-    conn.close()
+    db.release_connection(conn)
 
 def delete_exercise_category():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all categories
-    cursor.execute("SELECT id, name FROM exercise_categories")
-    categories = cursor.fetchall()
+    categories = catalog_cache.categories(conn)
 
     if not categories:
         print("No categories found.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nAvailable Categories:")
@@ -222,58 +175,54 @@ def delete_exercise_category():
         category_id = int(input("\nEnter category ID to delete: "))
 
         # Check if category exists
-        cursor.execute("SELECT name FROM exercise_categories WHERE id=?", (category_id,))
-        category = cursor.fetchone()
+        category = catalog_cache.category_name(conn, category_id)
 
         if not category:
             print("Category not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
         # Check if there are exercises in this category
-        cursor.execute("SELECT COUNT(*) FROM exercises WHERE category_id=?", (category_id,))
-        exercise_count = cursor.fetchone()[0]
+        exercise_count = len(catalog_cache.exercises_in_category(conn, category_id))
 
         if exercise_count > 0:
-            confirm = input(f"Category '{category[0]}' has {exercise_count} exercises. Deleting it will also delete all exercises. Continue? (y/n): ")
+            confirm = input(f"Category '{category}' has {exercise_count} exercises. Deleting it will also delete all exercises, their logs, routine entries and goals. Continue? (y/n): ")
             if confirm.lower() != 'y':
                 print("Operation cancelled.")
-                conn.close()
+                db.release_connection(conn)
                 return
 
-            # Delete all exercises in the category
-            cursor.execute("DELETE FROM exercises WHERE category_id=?", (category_id,))
+        mode = input("Delete now, or hide it now and purge in the background? (now/background) [now]: ")
 
-        # Delete the category
-        cursor.execute("DELETE FROM exercise_categories WHERE id=?", (category_id,))
+        if mode.lower().startswith('b'):
+            maintenance.soft_delete_category(conn, category_id)
+            maintenance.start_background_purge()
+            print(f"Category '{category}' has been hidden and will be purged in the background.")
+        else:
+            # Deleted in chunks so other writers aren't blocked for long
+            def progress(table, deleted):
+                print(f"  {table}: {deleted} rows deleted")
 
-        conn.commit()
-        print(f"Category '{category[0]}' and all its exercises have been deleted.")
+            maintenance.delete_category(conn, category_id, progress=progress)
+            maintenance.incremental_vacuum(conn)
+            print(f"Category '{category}' and all its exercises have been deleted.")
 
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
 
 def create_workout_routine():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     routine_name = input("Enter name for the new workout routine: ")
-    date_created = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    # Insert the routine
-    cursor.execute(
-        "INSERT INTO workout_routines (name, date_created) VALUES (?, ?)",
-        (routine_name, date_created)
-    )
-    routine_id = cursor.lastrowid
 
+    # exercise id -> (sets, reps), saved together at the end
+    items = {}
     adding_exercises = True
     while adding_exercises:
         # Get all categories
-        cursor.execute("SELECT id, name FROM exercise_categories")
-        categories = cursor.fetchall()
+        categories = catalog_cache.categories(conn)
 
         if not categories:
             print("No categories found. Please add some categories first.")
@@ -284,36 +233,37 @@ def create_workout_routine():
             print(f"{id}. {name}")
 
         try:
-            category_id = int(input("\nEnter category ID to view exercises: "))
-
-            # Check if category exists
-            cursor.execute("SELECT name FROM exercise_categories WHERE id=?", (category_id,))
-            category = cursor.fetchone()
+            answer = input("\nEnter category ID to view exercises, or search terms: ").strip()
+            if answer and not answer.isdigit():
+                if not show_search_results(conn, answer):
+                    continue
+            else:
+                category_id = int(answer)
 
-            if not category:
-                print("Category not found!")
-                continue
+                # Check if category exists
+                category = catalog_cache.category_name(conn, category_id)
 
-            # Get exercises for selected category
-            cursor.execute('''
-            SELECT id, name FROM exercises WHERE category_id=?
-            ''', (category_id,))
+                if not category:
+                    print("Category not found!")
+                    continue
 
-            exercises = cursor.fetchall()
+                # Get exercises for selected category
+                exercises = catalog_cache.exercises_in_category(conn, category_id)
 
-            if not exercises:
-                print(f"No exercises found in category '{category[0]}'.")
-                continue
+                if not exercises:
+                    print(f"No exercises found in category '{category}'.")
+                    continue
 
-            print(f"\nExercises in category '{category[0]}':")
-            for id, name in exercises:
-                print(f"{id}. {name}")
+                print(f"\nExercises in category '{category}':")
+                for id, name, description in exercises[:LIST_LIMIT]:
+                    print(f"{id}. {name}")
+                if len(exercises) > LIST_LIMIT:
+                    print(f"... and {len(exercises) - LIST_LIMIT} more. Type search terms to find one.")
 
-            exercise_id = int(input("\nEnter exercise ID to add to routine: "))
+            exercise_id = input_exercise_id(conn, "\nEnter exercise ID to add to routine: ")
 
             # Check if exercise exists
-            cursor.execute("SELECT name FROM exercises WHERE id=?", (exercise_id,))
-            exercise = cursor.fetchone()
+            exercise = catalog_cache.exercise_name(conn, exercise_id)
 
             if not exercise:
                 print("Exercise not found!")
@@ -323,14 +273,11 @@ def create_workout_routine():
             reps = int(input("Enter number of reps: "))
 
             # Add exercise to routine
-            try:
-                cursor.execute(
-                    "INSERT INTO routine_exercises (routine_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
-                    (routine_id, exercise_id, sets, reps)
-                )
-                print(f"Exercise '{exercise[0]}' added to routine!")
-            except sqlite3.IntegrityError:
+            if exercise_id in items:
                 print(f"Exercise already exists in this routine!")
+            else:
+                items[exercise_id] = (sets, reps)
+                print(f"Exercise '{exercise}' added to routine!")
 
             add_more = input("\nAdd more exercises to routine? (y/n): ")
             if add_more.lower() != 'y':
@@ -339,115 +286,99 @@ def create_workout_routine():
         except ValueError:
             print("Invalid input. Please enter a number.")
 
-    conn.commit()
+    api.create_routine(routine_name, [(ex_id, sets, reps) for ex_id, (sets, reps) in items.items()], conn=conn)
     print(f"\nWorkout routine '{routine_name}' created successfully!")
-    conn.close()
+    db.release_connection(conn)
 
 def view_workout_routines():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all routines
-    cursor.execute("SELECT id, name, date_created FROM workout_routines")
-    routines = cursor.fetchall()
+    routines = api.list_routines(conn)
 
     if not routines:
         print("No workout routines found.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nAvailable Workout Routines:")
     for id, name, date in routines:
-        print(f"{id}. {name} (Created: {date})")
+        print(f"{id}. {name} (Created: {date.isoformat()})")
 
     try:
         routine_id = int(input("\nEnter routine ID to view details: "))
 
         # Check if routine exists
-        cursor.execute("SELECT name FROM workout_routines WHERE id=?", (routine_id,))
-        routine = cursor.fetchone()
+        routine = api.routine_name(routine_id, conn)
 
         if not routine:
             print("Routine not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
         # Get exercises in routine
-        cursor.execute('''
-        SELECT e.name, re.sets, re.reps, ec.name
-        FROM routine_exercises re
-        JOIN exercises e ON re.exercise_id = e.id
-        JOIN exercise_categories ec ON e.category_id = ec.id
-        WHERE re.routine_id=?
-        ''', (routine_id,))
-
-        exercises = cursor.fetchall()
+        exercises = api.routine_exercises(routine_id, conn)
 
         if exercises:
-            print(f"\nExercises in routine '{routine[0]}':")
+            print(f"\nExercises in routine '{routine}':")
             print("=" * 50)
             print(f"{'Exercise':<20} {'Category':<15} {'Sets':<5} {'Reps':<5}")
             print("-" * 50)
-            for name, sets, reps, category in exercises:
+            for ex_id, name, category, sets, reps in exercises:
                 print(f"{name:<20} {category:<15} {sets:<5} {reps:<5}")
         else:
-            print(f"No exercises found in routine '{routine[0]}'.")
+            print(f"No exercises found in routine '{routine}'.")
 
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
 
 def log_workout():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all routines
-    cursor.execute("SELECT id, name FROM workout_routines")
-    routines = cursor.fetchall()
+    routines = api.list_routines(conn)
 
     if not routines:
         print("No workout routines found. Please create a routine first.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nSelect a routine to log:")
-    for id, name in routines:
+    for id, name, date in routines:
         print(f"{id}. {name}")
 
     try:
         routine_id = int(input("\nEnter routine ID: "))
 
         # Check if routine exists
-        cursor.execute("SELECT name FROM workout_routines WHERE id=?", (routine_id,))
-        routine = cursor.fetchone()
+        routine = api.routine_name(routine_id, conn)
 
         if not routine:
             print("Routine not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
         # Get exercises in routine
-        cursor.execute('''
-        SELECT e.id, e.name, re.sets, re.reps
-        FROM routine_exercises re
-        JOIN exercises e ON re.exercise_id = e.id
-        WHERE re.routine_id=?
-        ''', (routine_id,))
-
-        exercises = cursor.fetchall()
+        exercises = api.routine_exercises(routine_id, conn)
 
         if not exercises:
-            print(f"No exercises found in routine '{routine[0]}'.")
-            conn.close()
+            print(f"No exercises found in routine '{routine}'.")
+            db.release_connection(conn)
             return
 
         workout_date = input("Enter workout date (YYYY-MM-DD) or press Enter for today: ")
-        if not workout_date:
-            workout_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        try:
+            workout_day = dates.parse_day(workout_date) if workout_date else dates.today()
+        except ValueError:
+            print("Invalid date. Please use YYYY-MM-DD.")
+            db.release_connection(conn)
+            return
 
-        print(f"\nLogging workout for routine '{routine[0]}' on {workout_date}:")
-        for ex_id, name, default_sets, default_reps in exercises:
+        print(f"\nLogging workout for routine '{routine}' on {dates.to_iso(workout_day)}:")
+        overrides = {}
+        for ex_id, name, category, default_sets, default_reps in exercises:
             print(f"\nExercise: {name}")
             print(f"Default: {default_sets} sets, {default_reps} reps")
 
@@ -457,128 +388,130 @@ def log_workout():
             reps = input(f"Reps completed (press Enter for default {default_reps}): ")
             reps = int(reps) if reps else default_reps
 
-            # Log the exercise
-            cursor.execute(
-                "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
-                (ex_id, workout_date, sets, reps)
-            )
-
-            # Update goals progress if applicable
-            cursor.execute('''
-            SELECT g.id, g.target_value, g.current_value
-            FROM goals g
-            JOIN exercises e ON e.category_id = g.category_id
-            WHERE e.id = ?
-            ''', (ex_id,))
-
-            goals = cursor.fetchall()
-            for goal_id, target, current in goals:
-                # Assuming goal is based on total reps
-                new_value = current + (sets * reps)
-                cursor.execute(
-                    "UPDATE goals SET current_value = ? WHERE id = ?",
-                    (new_value, goal_id)
-                )
-
-        conn.commit()
+            overrides[ex_id] = (sets, reps)
+
+        # All of the session's logs go in one transaction
+        api.log_session(routine_id, workout_day, overrides, conn)
         print(f"\nWorkout logged successfully!")
 
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
+
+def fetch_history_page(cursor, exercise_id, start_date, end_date, older_than=None, newer_than=None,
+                       page_size=HISTORY_PAGE_SIZE):
+    return api.history_page(exercise_id, start_date, end_date, older_than, newer_than, page_size,
+                            cursor.connection)
+
+def show_history(cursor, exercise_id, start_date, end_date):
+    page = fetch_history_page(cursor, exercise_id, start_date, end_date)
+    if not page:
+        print("No workout logs found in that date range.")
+        return
+
+    while True:
+        print("=" * 50)
+        print(f"{'Date':<12} {'Sets':<5} {'Reps':<5} {'Total':<5}")
+        print("-" * 50)
+        for date, log_id, sets, reps, total in page:
+            print(f"{dates.to_iso(date):<12} {sets:<5} {reps:<5} {total:<5}")
+
+        choice = input("\n[n]ext (older), [p]revious (newer), or press Enter to finish: ").lower()
+        if choice == 'n':
+            rows = fetch_history_page(cursor, exercise_id, start_date, end_date, older_than=page[-1][:2])
+        elif choice == 'p':
+            rows = fetch_history_page(cursor, exercise_id, start_date, end_date, newer_than=page[0][:2])
+        else:
+            break
+
+        if rows:
+            page = rows
+        else:
+            print("No more entries in that direction.")
 
 def view_exercise_progress():
-    conn = sqlite3.connect('fitness_tracker.db')
+    conn = db.get_connection()
     cursor = conn.cursor()
 
-    # Get all exercises
-    cursor.execute('''
-    SELECT e.id, e.name, ec.name
-    FROM exercises e
-    JOIN exercise_categories ec ON e.category_id = ec.id
-    ''')
-    exercises = cursor.fetchall()
-
-    if not exercises:
-        print("No exercises found.")
-        conn.close()
-        return
+    exercise_count = cursor.execute("SELECT COUNT(*) FROM exercises").fetchone()[0]
 
-    print("\nSelect an exercise to view progress:")
-    for id, name, category in exercises:
-        print(f"{id}. {name} (Category: {category})")
+    if exercise_count <= LIST_LIMIT:
+        # Get all exercises, live categories first (CROSS JOIN keeps that
+        # order) and their exercises by index
+        cursor.execute('''
+        SELECT e.id, e.name, ec.name
+        FROM exercise_categories ec
+        CROSS JOIN exercises e ON e.category_id = ec.id
+        WHERE ec.deleted_at IS NULL
+        ''')
+        exercises = cursor.fetchall()
+
+        if not exercises:
+            print("No exercises found.")
+            db.release_connection(conn)
+            return
+
+        print("\nSelect an exercise to view progress:")
+        for id, name, category in exercises:
+            print(f"{id}. {name} (Category: {category})")
+    else:
+        # Too many to list: find one by name, description or category
+        print(f"\n{exercise_count} exercises. Type part of a name, description or category to search.")
 
     try:
-        exercise_id = int(input("\nEnter exercise ID: "))
+        exercise_id = input_exercise_id(conn, "\nEnter exercise ID (or search terms): ")
 
         # Check if exercise exists
-        cursor.execute("SELECT name FROM exercises WHERE id=?", (exercise_id,))
-        exercise = cursor.fetchone()
+        exercise = catalog_cache.exercise_name(conn, exercise_id)
 
         if not exercise:
             print("Exercise not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
-        # Get logs for the exercise
-        cursor.execute('''
-        SELECT date, sets, reps, (sets * reps) as total_reps
-        FROM workout_logs
-        WHERE exercise_id=?
-        ORDER BY date DESC
-        ''', (exercise_id,))
-
-        logs = cursor.fetchall()
+        # Stats come from the summary table, whatever the history length
+        stats = api.exercise_stats(exercise_id, conn)
 
-        if logs:
-            print(f"\nProgress for exercise '{exercise[0]}':")
-            print("=" * 50)
-            print(f"{'Date':<12} {'Sets':<5} {'Reps':<5} {'Total':<5}")
-            print("-" * 50)
-            for date, sets, reps, total in logs:
-                print(f"{date:<12} {sets:<5} {reps:<5} {total:<5}")
-
-            # Calculate some stats
-            cursor.execute('''
-            SELECT
-                MAX(sets) as max_sets,
-                MAX(reps) as max_reps,
-                MAX(sets * reps) as max_total,
-                AVG(sets) as avg_sets,
-                AVG(reps) as avg_reps,
-                COUNT(*) as workout_count
-            FROM workout_logs
-            WHERE exercise_id=?
-            ''', (exercise_id,))
-
-            stats = cursor.fetchone()
+        if stats:
+            print(f"\nProgress for exercise '{exercise}':")
             print("\nStats:")
-            print(f"Total workouts: {stats[5]}")
-            print(f"Max sets: {stats[0]}")
-            print(f"Max reps: {stats[1]}")
-            print(f"Max total reps: {stats[2]}")
-            print(f"Average sets: {stats[3]:.1f}")
-            print(f"Average reps: {stats[4]:.1f}")
+            print(f"Total workouts: {stats['workouts']}")
+            print(f"Max sets: {stats['max_sets']}")
+            print(f"Max reps: {stats['max_reps']}")
+            print(f"Max total reps: {stats['max_total']}")
+            print(f"Average sets: {stats['avg_sets']:.1f}")
+            print(f"Average reps: {stats['avg_reps']:.1f}")
+            print(f"First workout: {stats['first_date'].isoformat()}")
+            print(f"Last workout: {stats['last_date'].isoformat()}")
+
+            start_date = input("\nShow history from date (YYYY-MM-DD) or press Enter for all: ")
+            end_date = input("Show history up to date (YYYY-MM-DD) or press Enter for all: ")
+            try:
+                start_day = dates.parse_day(start_date) if start_date else MIN_DATE
+                end_day = dates.parse_day(end_date) if end_date else MAX_DATE
+            except ValueError:
+                print("Invalid date. Please use YYYY-MM-DD.")
+                db.release_connection(conn)
+                return
+            show_history(cursor, exercise_id, start_day, end_day)
         else:
-            print(f"No workout logs found for exercise '{exercise[0]}'.")
+            print(f"No workout logs found for exercise '{exercise}'.")
 
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
 
 def set_fitness_goals():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all categories
-    cursor.execute("SELECT id, name FROM exercise_categories")
-    categories = cursor.fetchall()
+    categories = catalog_cache.categories(conn)
 
     if not categories:
         print("No categories found. Please add some categories first.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nAvailable Categories:")
@@ -589,65 +522,166 @@ def set_fitness_goals():
         category_id = int(input("\nEnter category ID for the goal: "))
 
         # Check if category exists
-        cursor.execute("SELECT name FROM exercise_categories WHERE id=?", (category_id,))
-        category = cursor.fetchone()
+        category = catalog_cache.category_name(conn, category_id)
 
         if not category:
             print("Category not found!")
-            conn.close()
+            db.release_connection(conn)
             return
 
         goal_name = input("Enter goal name: ")
         target_value = int(input("Enter target value (e.g., total reps to achieve): "))
         deadline = input("Enter deadline (YYYY-MM-DD) or press Enter for no deadline: ")
 
-        if not deadline:
-            deadline = None
+        try:
+            deadline = dates.parse_day(deadline) if deadline else None
+        except ValueError:
+            print("Invalid date. Please use YYYY-MM-DD.")
+            db.release_connection(conn)
+            return
 
-        cursor.execute(
-            "INSERT INTO goals (name, target_value, current_value, category_id, deadline) VALUES (?, ?, ?, ?, ?)",
-            (goal_name, target_value, 0, category_id, deadline)
-        )
+        window = input("Count volume over the last N days (enter N), this 'week', this 'month', "
+                       "or press Enter for all time: ").strip().lower()
+        if not window:
+            window_type, window_days = None, None
+        elif window in ("week", "month"):
+            window_type, window_days = window, None
+        else:
+            window_type, window_days = "days", int(window)
+            if window_days < 1:
+                print("The window must be at least 1 day.")
+                db.release_connection(conn)
+                return
 
-        conn.commit()
+        api.set_goal(category_id, goal_name, target_value, deadline, window_type, window_days, conn=conn)
         print(f"Fitness goal '{goal_name}' set successfully!")
 
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-    conn.close()
+    db.release_connection(conn)
 
 def view_fitness_goals():
-    conn = sqlite3.connect('fitness_tracker.db')
-    cursor = conn.cursor()
+    conn = db.get_connection()
 
     # Get all goals
-    cursor.execute('''
-    SELECT g.id, g.name, g.target_value, g.current_value, ec.name, g.deadline
-    FROM goals g
-    JOIN exercise_categories ec ON g.category_id = ec.id
-    ''')
-
-    goals = cursor.fetchall()
+    goals = api.goal_progress(conn)
 
     if not goals:
         print("No fitness goals found.")
-        conn.close()
+        db.release_connection(conn)
         return
 
     print("\nYour Fitness Goals:")
-    print("=" * 80)
-    print(f"{'ID':<4} {'Goal':<20} {'Category':<15} {'Progress':<20} {'Deadline':<12}")
-    print("-" * 80)
+    print("=" * 100)
+    print(f"{'ID':<4} {'Goal':<20} {'Category':<15} {'Progress':<20} {'Window':<14} {'Deadline':<12} {'Days left':<9}")
+    print("-" * 100)
+
+    for goal in goals:
+        progress_bar = f"{goal['current']}/{goal['target']} ({goal['percent']:.1f}%)"
+        deadline_str = goal['deadline'].isoformat() if goal['deadline'] is not None else "None"
+        if goal['window_type'] == "days":
+            window_str = f"last {goal['window_days']} days"
+        elif goal['window_type'] is not None:
+            window_str = f"this {goal['window_type']}"
+        else:
+            window_str = "all time"
+        if goal['days_left'] is None:
+            days_left_str = "-"
+        elif goal['days_left'] < 0:
+            days_left_str = "ended"
+        else:
+            days_left_str = str(goal['days_left'])
+
+        print(f"{goal['id']:<4} {goal['name']:<20} {goal['category']:<15} {progress_bar:<20} {window_str:<14} "
+              f"{deadline_str:<12} {days_left_str:<9}")
+
+    db.release_connection(conn)
+
+def view_training_analytics():
+    conn = db.get_connection()
+
+    if analytics.numpy is None:
+        print("Training analytics need numpy. Install it with: pip install numpy")
+        db.release_connection(conn)
+        return
+
+    categories = catalog_cache.categories(conn)
+
+    if not categories:
+        print("No categories found. Please add some categories first.")
+        db.release_connection(conn)
+        return
 
-    for id, name, target, current, category, deadline in goals:
-        progress_pct = (current / target) * 100 if target > 0 else 0
-        progress_bar = f"{current}/{target} ({progress_pct:.1f}%)"
-        deadline_str = deadline if deadline else "None"
+    print("\nAvailable Categories:")
+    for id, name in categories:
+        print(f"{id}. {name}")
+
+    try:
+        category_id = int(input("\nEnter category ID: "))
+
+        # Check if category exists
+        category = catalog_cache.category_name(conn, category_id)
 
-        print(f"{id:<4} {name:<20} {category:<15} {progress_bar:<20} {deadline_str:<12}")
+        if not category:
+            print("Category not found!")
+            db.release_connection(conn)
+            return
 
-    conn.close()
+        print(f"\nExercises in category '{category}':")
+        for id, name, description in catalog_cache.exercises_in_category(conn, category_id):
+            print(f"{id}. {name}")
+
+        exercise_id = input("\nEnter exercise ID, or press Enter for the whole category: ")
+        if exercise_id:
+            exercise_id = int(exercise_id)
+            title = catalog_cache.exercise_name(conn, exercise_id)
+            if not title:
+                print("Exercise not found!")
+                db.release_connection(conn)
+                return
+            metrics = analytics.exercise_metrics(exercise_id, conn)
+        else:
+            title = category
+            metrics = analytics.category_metrics(category_id, conn)
+
+        if not metrics:
+            print(f"No workout logs found for '{title}'.")
+            db.release_connection(conn)
+            return
+
+        acwr = metrics["acwr"][-1]
+        print(f"\nTraining analytics for '{title}' ({metrics['logs']} logs since {metrics['first_day']}):")
+        print(f"Longest streak: {metrics['longest_streak']} days")
+        print(f"Current streak: {metrics['current_streak']} days")
+        print(f"Volume, last 7 days: {metrics['volume_7d'][-1]:.0f}")
+        print(f"Volume, last 28 days: {metrics['volume_28d'][-1]:.0f}")
+        if not math.isnan(acwr):
+            print(f"Acute:chronic workload ratio: {acwr:.2f} (0.8-1.3 is the usual safe range)")
+        else:
+            print("Acute:chronic workload ratio: no training in the last 28 days")
+
+        print("\nLatest personal records (sets x reps):")
+        for day, ex_id, volume in metrics["records"][-5:][::-1]:
+            print(f"{day.isoformat():<12} {catalog_cache.exercise_name(conn, ex_id) or ex_id:<20} {volume}")
+
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+
+    db.release_connection(conn)
+
+MENU_ACTIONS = {
+    '1': add_exercise_category,
+    '2': view_exercises_by_category,
+    '3': delete_exercise_category,
+    '4': create_workout_routine,
+    '5': view_workout_routines,
+    '6': log_workout,
+    '7': view_exercise_progress,
+    '8': set_fitness_goals,
+    '9': view_fitness_goals,
+    '10': view_training_analytics,
+}
 
 def main_menu():
     while True:
@@ -663,33 +697,21 @@ def main_menu():
         print("7. View exercise progress")
         print("8. Set fitness goals")
         print("9. View progress towards fitness goals")
+        print("10. View training analytics")
         print("0. Quit")
 
-        choice = input("\nEnter your choice (0-9): ")
-
-        if choice == '1':
-            add_exercise_category()
-        elif choice == '2':
-            view_exercises_by_category()
-        elif choice == '3':
-            delete_exercise_category()
-        elif choice == '4':
-            create_workout_routine()
-        elif choice == '5':
-            view_workout_routines()
-        elif choice == '6':
-            log_workout()
-        elif choice == '7':
-            view_exercise_progress()
-        elif choice == '8':
-            set_fitness_goals()
-        elif choice == '9':
-            view_fitness_goals()
-        elif choice == '0':
+        choice = input("\nEnter your choice (0-10): ")
+
+        if choice == '0':
             print("\nThank you for using the Fitness Tracker App!")
             break
-        else:
-            print("Invalid choice. Please enter a number between 0 and 9.")
+
+        action = MENU_ACTIONS.get(choice)
+        if action is None:
+            print("Invalid choice. Please enter a number between 0 and 10.")
+            continue
+        with instrumentation.operation(action.__name__):
+            action()
 
 if __name__ == "__main__":
     main_menu()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+
+import dates
+import db
+import volume_index
+
+# Bulk import of workout history, e.g. exported from a wearable:
+#
+#   python importer.py history.csv --batch-size 5000
+#
+# Each record needs an exercise (name or exercise_id), a date (YYYY-MM-DD),
+# sets and reps. CSV files need a header row; JSONL files hold one object per
+# line. Rows are streamed, so memory use doesn't depend on the file size.
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def read_records(path, fmt=None):
+    # Yields one record per row without loading the file; a JSONL line
+    # that isn't valid JSON comes through as None, to be skipped
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    with open(path, newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt in ("jsonl", "ndjson", "json"):
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield None
+        else:
+            raise ValueError(f"Unknown import format '{fmt}' (use csv or jsonl)")
+
+
+def load_exercise_map(conn):
+    # name (case-insensitive) -> id, and id -> category_id
+    by_name = {}
+    categories = {}
+    for ex_id, name, category_id in conn.execute("SELECT id, name, category_id FROM exercises ORDER BY id"):
+        by_name.setdefault(name.strip().lower(), ex_id)
+        categories[ex_id] = category_id
+    return by_name, categories
+
+
+def parse_record(record, by_name, categories):
+    # Returns an (exercise_id, date, sets, reps) row, or None if unusable
+    if not isinstance(record, dict):
+        return None
+    try:
+        if record.get("exercise_id") not in (None, ""):
+            ex_id = int(record["exercise_id"])
+        else:
+            ex_id = by_name.get(str(record.get("exercise", "")).strip().lower())
+        if ex_id not in categories:
+            return None
+
+        date = dates.to_day(datetime.date.fromisoformat(str(record["date"]).strip()))
+        return ex_id, date, int(record["sets"]), int(record["reps"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def write_batch(conn, rows):
+    # One transaction per batch; the workout_logs triggers update the goals
+    with conn:
+        conn.executemany(
+            "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+            rows
+        )
+
+
+def import_workout_logs(path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    conn = db.get_connection()
+    by_name, categories = load_exercise_map(conn)
+
+    imported = 0
+    skipped = 0
+    batch = []
+    for record in read_records(path, fmt):
+        row = parse_record(record, by_name, categories)
+        if row is None:
+            skipped += 1
+            continue
+
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write_batch(conn, batch)
+            imported += len(batch)
+            batch = []
+            if progress:
+                progress(imported, skipped)
+
+    if batch:
+        write_batch(conn, batch)
+        imported += len(batch)
+    # The windowed goals' running totals, once for the whole import
+    volume_index.refresh(conn)
+
+    return imported, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import workout logs from CSV or JSONL")
+    parser.add_argument("path", help="file to import")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+
+    def progress(imported, skipped):
+        print(f"\r{imported} rows imported, {skipped} skipped", end="", flush=True)
+
+    imported, skipped = import_workout_logs(args.path, args.format, args.batch_size, progress)
+    print(f"\rImport finished: {imported} rows imported, {skipped} skipped")
+
+
+if __name__ == "__main__":
+    main()
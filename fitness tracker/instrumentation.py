@@ -0,0 +1,365 @@
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Query instrumentation. When enabled, db.connect() hands out connections
+# whose cursors time every statement (execute plus fetching its rows) and
+# record a latency histogram per normalized statement. Menu operations are
+# timed the same way, along with how much of that time was spent in SQL.
+# Statements slower than the threshold are logged with their query plan.
+#
+# Enable it with FITNESS_TRACKER_PROFILE=profile.json (the stats are written
+# there on exit) or enable() in code, then:
+#
+#   python instrumentation.py top profile.json -n 20
+#
+# When disabled, connections are plain sqlite3 connections and operation()
+# returns a no-op context manager, so nothing is measured or paid for.
+
+DEFAULT_SLOW_MS = 100
+MAX_RECENT_SLOW = 100
+# Statements built with f-strings could make this grow without bound
+MAX_NORMALIZED = 2000
+
+enabled = False
+slow_threshold = float(os.environ.get('FITNESS_TRACKER_SLOW_MS', DEFAULT_SLOW_MS)) / 1000
+slow_log_path = os.environ.get('FITNESS_TRACKER_SLOW_LOG')
+
+_lock = threading.Lock()
+_statements = {}
+_operations = {}
+_recent_slow = []
+_normalized = {}
+_local = threading.local()
+_noop = contextlib.nullcontext()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def enable(threshold_ms=None, slow_log=None):
+    # Only connections opened after this are instrumented
+    global enabled, slow_threshold, slow_log_path
+    enabled = True
+    if threshold_ms is not None:
+        slow_threshold = threshold_ms / 1000
+    if slow_log is not None:
+        slow_log_path = slow_log
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _operations.clear()
+        del _recent_slow[:]
+
+
+def normalize(sql):
+    # Literals become ? and whitespace is collapsed, so the same statement
+    # with different values is counted once
+    key = _normalized.get(sql)
+    if key is None:
+        key = _SPACE.sub(" ", _NUMBER.sub("?", _STRING.sub("?", sql))).strip()
+        if len(_normalized) >= MAX_NORMALIZED:
+            _normalized.clear()
+        _normalized[sql] = key
+    return key
+
+
+def _bucket(seconds):
+    # Power-of-two buckets in microseconds: bucket n holds [2^(n-1), 2^n)
+    return int(seconds * 1e6).bit_length()
+
+
+def _new_entry():
+    return {"count": 0, "total": 0.0, "max": 0.0, "buckets": {}}
+
+
+def _add(entry, seconds):
+    entry["count"] += 1
+    entry["total"] += seconds
+    entry["max"] = max(entry["max"], seconds)
+    bucket = _bucket(seconds)
+    entry["buckets"][bucket] = entry["buckets"].get(bucket, 0) + 1
+
+
+def percentile(entry, pct):
+    # Upper bound of the bucket holding the pct-th sample, in seconds
+    target = entry["count"] * pct / 100
+    seen = 0
+    for bucket in sorted(entry["buckets"]):
+        seen += entry["buckets"][bucket]
+        if seen >= target:
+            return min((1 << bucket) / 1e6, entry["max"])
+    return entry["max"]
+
+
+def _record_statement(conn, sql, params, seconds):
+    key = normalize(sql)
+    with _lock:
+        entry = _statements.get(key)
+        if entry is None:
+            entry = _statements[key] = _new_entry()
+        _add(entry, seconds)
+
+    current = getattr(_local, "operation", None)
+    if current is not None:
+        current["sql_time"] += seconds
+        current["statements"] += 1
+
+    if seconds >= slow_threshold:
+        _log_slow(conn, sql, params, seconds)
+
+
+def _log_slow(conn, sql, params, seconds):
+    plan = []
+    if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+        try:
+            # A plain cursor, so the plan lookup isn't timed itself
+            cursor = sqlite3.Cursor(conn)
+            plan = [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ())]
+        except sqlite3.Error as error:
+            plan = [f"(no plan: {error})"]
+
+    entry = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ms": round(seconds * 1000, 3),
+        "sql": normalize(sql),
+        "plan": plan,
+    }
+    with _lock:
+        _recent_slow.append(entry)
+        del _recent_slow[:-MAX_RECENT_SLOW]
+
+    lines = [f"[slow query {entry['ms']:.1f} ms] {entry['sql']}"] + [f"    {step}" for step in plan]
+    if slow_log_path:
+        with open(slow_log_path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines), file=sys.stderr)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # A statement is recorded once its rows have all been fetched, the
+    # cursor runs something else, or the cursor goes away. Fetch time
+    # counts, since SQLite does most of a SELECT's work while stepping.
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            _record_statement(self.connection, *pending)
+
+    def _run(self, method, sql, params, args):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            self._pending = [sql, params, time.perf_counter() - start]
+            if self.description is None:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters, (parameters,))
+
+    def executemany(self, sql, seq_of_parameters):
+        # The plan is the same for every row, so no parameters are kept
+        seq_of_parameters = list(seq_of_parameters)
+        params = seq_of_parameters[0] if seq_of_parameters else ()
+        return self._run(sqlite3.Cursor.executemany, sql, params, (seq_of_parameters,))
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+
+    def fetchone(self):
+        row = self._fetch(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(sqlite3.Cursor.fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(sqlite3.Cursor.fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._fetch(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class Connection(sqlite3.Connection):
+    # sqlite3.Connection as it is, except that it can be weakly referenced
+    # (catalog_cache.py keeps per-connection state that way)
+    pass
+
+
+class InstrumentedConnection(Connection):
+    # The C versions of execute() and executemany() create a plain cursor
+    # without going through cursor(), so both are redone here
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _record_statement(self, "COMMIT", (), time.perf_counter() - start)
+
+
+def connection_factory():
+    # What db.connect() passes to sqlite3.connect()
+    return InstrumentedConnection if enabled else Connection
+
+
+@contextlib.contextmanager
+def _timed_operation(name):
+    current = {"sql_time": 0.0, "statements": 0}
+    outer = getattr(_local, "operation", None)
+    _local.operation = current
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.operation = outer
+        with _lock:
+            entry = _operations.get(name)
+            if entry is None:
+                entry = _operations[name] = dict(_new_entry(), sql_time=0.0, statements=0)
+            _add(entry, elapsed)
+            entry["sql_time"] += current["sql_time"]
+            entry["statements"] += current["statements"]
+
+
+def operation(name):
+    # with instrumentation.operation("log_workout"): ...
+    return _timed_operation(name) if enabled else _noop
+
+
+def snapshot():
+    with _lock:
+        return {
+            "statements": {key: dict(entry, buckets=dict(entry["buckets"])) for key, entry in _statements.items()},
+            "operations": {key: dict(entry, buckets=dict(entry["buckets"])) for key, entry in _operations.items()},
+            "slow": list(_recent_slow),
+        }
+
+
+def save(path):
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    # JSON turned the bucket numbers into strings
+    for group in ("statements", "operations"):
+        for entry in data[group].values():
+            entry["buckets"] = {int(bucket): count for bucket, count in entry["buckets"].items()}
+    return data
+
+
+def dump(data=None, top=20, file=None):
+    # Top statements by total time, then every menu operation
+    data = data or snapshot()
+    file = file or sys.stdout
+
+    statements = sorted(data["statements"].items(), key=lambda item: item[1]["total"], reverse=True)
+    print(f"{'Calls':>8} {'Total ms':>10} {'Mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'Max ms':>8}  Statement",
+          file=file)
+    for key, entry in statements[:top]:
+        print(f"{entry['count']:>8} {entry['total'] * 1000:>10.1f} {entry['total'] / entry['count'] * 1000:>9.3f} "
+              f"{percentile(entry, 50) * 1000:>8.3f} {percentile(entry, 95) * 1000:>8.3f} "
+              f"{entry['max'] * 1000:>8.3f}  {key[:100]}", file=file)
+
+    if data["operations"]:
+        print(f"\n{'Operation':<26} {'Calls':>6} {'Total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'SQL ms':>10} "
+              f"{'Statements':>10}", file=file)
+        operations = sorted(data["operations"].items(), key=lambda item: item[1]["total"], reverse=True)
+        for name, entry in operations:
+            print(f"{name:<26} {entry['count']:>6} {entry['total'] * 1000:>10.1f} "
+                  f"{percentile(entry, 50) * 1000:>8.3f} {percentile(entry, 95) * 1000:>8.3f} "
+                  f"{entry['sql_time'] * 1000:>10.1f} {entry['statements']:>10}", file=file)
+
+    if data["slow"]:
+        print(f"\n{len(data['slow'])} slow queries logged; the latest:", file=file)
+        print(f"  {data['slow'][-1]['ms']:.1f} ms  {data['slow'][-1]['sql'][:100]}", file=file)
+
+
+def _enable_from_environment():
+    path = os.environ.get('FITNESS_TRACKER_PROFILE')
+    if path:
+        enable()
+        atexit.register(save, path)
+
+
+_enable_from_environment()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show statement timings recorded with FITNESS_TRACKER_PROFILE")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top_parser = subparsers.add_parser("top", help="top statements by total time")
+    top_parser.add_argument("path", help="stats file written on exit")
+    top_parser.add_argument("-n", "--top", type=int, default=20)
+    slow_parser = subparsers.add_parser("slow", help="recent slow queries with their plans")
+    slow_parser.add_argument("path")
+    args = parser.parse_args()
+
+    data = load(args.path)
+    if args.command == "top":
+        dump(data, args.top)
+    else:
+        for entry in data["slow"]:
+            print(f"{entry['time']}  {entry['ms']:.1f} ms  {entry['sql']}")
+            for step in entry["plan"]:
+                print(f"    {step}")
+
+
+if __name__ == "__main__":
+    main()
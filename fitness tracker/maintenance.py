@@ -0,0 +1,450 @@
+import argparse
+import datetime
+import sys
+import threading
+
+import archive
+import dates
+import db
+import volume_index
+
+# Housekeeping for derived data that the database normally keeps current
+# on its own:
+#
+#   python maintenance.py recompute-goals
+#   python maintenance.py rebuild-stats
+#   python maintenance.py verify-stats
+#   python maintenance.py rebuild-rollups
+#   python maintenance.py verify-rollups
+#   python maintenance.py refresh-volume-prefix
+#   python maintenance.py rebuild-volume-prefix
+#   python maintenance.py verify-volume-prefix
+#   python maintenance.py purge-deleted
+#   python maintenance.py vacuum
+#   python maintenance.py enable-incremental-vacuum
+
+
+def recompute_goals(conn=None):
+    # Rebuild every goal's current_value from workout_logs in one grouped
+    # pass; archived logs count through their per-exercise totals
+    conn = conn or db.get_connection()
+    with conn:
+        conn.execute("UPDATE goals SET current_value = 0")
+        conn.execute('''
+        UPDATE goals SET current_value = totals.volume
+        FROM (
+            /* full scan */
+            SELECT e.category_id, SUM(logs.volume) AS volume
+            FROM (
+                SELECT exercise_id, sets * reps AS volume FROM workout_logs
+                UNION ALL
+                SELECT exercise_id, total_volume FROM archived_exercise_stats
+            ) AS logs
+            JOIN exercises e ON logs.exercise_id = e.id
+            GROUP BY e.category_id
+        ) AS totals
+        WHERE goals.category_id = totals.category_id
+        ''')
+    return conn.execute("SELECT COUNT(*) FROM goals").fetchone()[0]
+
+
+# exercise_stats as it would be computed from scratch
+EXERCISE_STATS_QUERY = '''
+    SELECT exercise_id, COUNT(*), COALESCE(SUM(sets), 0), COALESCE(SUM(reps), 0),
+           MAX(sets), MAX(reps), MAX(sets * reps), MIN(date), MAX(date)
+    FROM workout_logs
+    GROUP BY exercise_id
+'''
+
+
+def full_exercise_stats_query(condition="true"):
+    # EXERCISE_STATS_QUERY once logs may have been archived: the logs still
+    # in workout_logs merged with archived_exercise_stats. condition, on
+    # exercise_id, limits the exercises covered; only the unlimited query
+    # is a deliberate full pass.
+    marker = "/* full scan */" if condition == "true" else ""
+    return f'''
+    {marker}
+    SELECT exercise_id, SUM(workout_count) AS workout_count, SUM(total_sets) AS total_sets,
+           SUM(total_reps) AS total_reps, MAX(max_sets) AS max_sets, MAX(max_reps) AS max_reps,
+           MAX(max_total) AS max_total, MIN(first_date) AS first_date, MAX(last_date) AS last_date
+    FROM (
+        SELECT exercise_id, COUNT(*) AS workout_count, COALESCE(SUM(sets), 0) AS total_sets,
+               COALESCE(SUM(reps), 0) AS total_reps,
+               MAX(sets) AS max_sets, MAX(reps) AS max_reps, MAX(sets * reps) AS max_total,
+               MIN(date) AS first_date, MAX(date) AS last_date
+        FROM workout_logs
+        WHERE {condition}
+        GROUP BY exercise_id
+        UNION ALL
+        SELECT exercise_id, workout_count, total_sets, total_reps,
+               max_sets, max_reps, max_total, first_date, last_date
+        FROM archived_exercise_stats
+        WHERE {condition}
+    )
+    GROUP BY exercise_id
+'''
+
+
+def rebuild_exercise_stats(conn=None):
+    conn = conn or db.get_connection()
+    with conn:
+        conn.execute("DELETE FROM exercise_stats")
+        conn.execute("INSERT INTO exercise_stats " + full_exercise_stats_query())
+    return conn.execute("SELECT COUNT(*) FROM exercise_stats").fetchone()[0]
+
+
+def verify_exercise_stats(conn=None):
+    # Ids of exercises whose summary row differs from a full recompute
+    conn = conn or db.get_connection()
+    query = full_exercise_stats_query()
+    rows = conn.execute(f'''
+    SELECT exercise_id FROM (
+        SELECT * FROM ({query}) EXCEPT SELECT * FROM exercise_stats
+    )
+    UNION
+    SELECT exercise_id FROM (
+        SELECT * FROM exercise_stats EXCEPT SELECT * FROM ({query})
+    )
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+
+def volume_rollups_query(logs="workout_logs"):
+    # volume_rollups as it would be computed from scratch from the given
+    # logs table
+    return f'''
+    WITH logs AS (
+        /* full scan */
+        SELECT wl.exercise_id, e.category_id, COALESCE(wl.sets * wl.reps, 0) AS volume,
+               wl.date AS day,
+               {dates.sql_week_start('wl.date')} AS week,
+               {dates.sql_month_start('wl.date')} AS month
+        FROM {logs} wl
+        LEFT JOIN exercises e ON wl.exercise_id = e.id
+    ),
+    bucketed AS (
+        SELECT exercise_id, category_id, volume, 'day' AS period, day AS bucket FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'week', week FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'month', month FROM logs
+    )
+    SELECT 'exercise', exercise_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE exercise_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY exercise_id, period, bucket
+    UNION ALL
+    SELECT 'category', category_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE category_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY category_id, period, bucket
+'''
+
+
+VOLUME_ROLLUPS_QUERY = volume_rollups_query()
+
+
+def full_volume_rollups_query(conn):
+    # VOLUME_ROLLUPS_QUERY with archived logs included. Each archive is
+    # aggregated on its own into a temp table, so any number of years can
+    # be covered, and the query adds the partial totals up.
+    if not archive.archive_years(conn):
+        return VOLUME_ROLLUPS_QUERY
+
+    conn.execute("DROP TABLE IF EXISTS temp.partial_volume_rollups")
+    conn.execute("CREATE TEMP TABLE partial_volume_rollups (scope, scope_id, period, bucket, volume, log_count)")
+    with conn:
+        conn.execute("INSERT INTO temp.partial_volume_rollups " + VOLUME_ROLLUPS_QUERY)
+    for schema in archive.each_archive(conn):
+        with conn:
+            conn.execute("INSERT INTO temp.partial_volume_rollups "
+                         + volume_rollups_query(f"{schema}.workout_logs"))
+    return '''
+    SELECT scope, scope_id, period, bucket, SUM(volume), SUM(log_count)
+    FROM temp.partial_volume_rollups
+    GROUP BY scope, scope_id, period, bucket
+'''
+
+
+def rebuild_volume_rollups(conn=None):
+    # The goal windows' running totals are summed from the rollups, so
+    # they are rebuilt along with them
+    conn = conn or db.get_connection()
+    query = full_volume_rollups_query(conn)
+    with conn:
+        conn.execute("DELETE FROM volume_rollups")
+        conn.execute("INSERT INTO volume_rollups " + query)
+        _fill_volume_prefix(conn)
+    return conn.execute("SELECT COUNT(*) FROM volume_rollups").fetchone()[0]
+
+
+def verify_volume_rollups(conn=None):
+    # Number of rollup rows that differ from a full recompute
+    conn = conn or db.get_connection()
+    query = full_volume_rollups_query(conn)
+    return conn.execute(f'''
+    SELECT COUNT(*) FROM (
+        SELECT * FROM ({query}) EXCEPT SELECT * FROM volume_rollups
+        UNION ALL
+        SELECT * FROM (SELECT * FROM volume_rollups EXCEPT SELECT * FROM ({query}))
+    )
+    ''').fetchone()[0]
+
+
+# category_volume_prefix as it would be computed from scratch
+VOLUME_PREFIX_QUERY = '''
+    /* full scan */
+    SELECT scope_id, bucket, SUM(volume) OVER (PARTITION BY scope_id ORDER BY bucket)
+    FROM volume_rollups
+    WHERE scope = 'category' AND period = 'day'
+'''
+
+
+def _fill_volume_prefix(conn):
+    conn.execute("DELETE FROM category_volume_stale")
+    conn.execute("DELETE FROM category_volume_prefix")
+    conn.execute("INSERT INTO category_volume_prefix " + VOLUME_PREFIX_QUERY)
+
+
+def rebuild_volume_prefix(conn=None):
+    conn = conn or db.get_connection()
+    with conn:
+        _fill_volume_prefix(conn)
+    return conn.execute("SELECT COUNT(*) FROM category_volume_prefix").fetchone()[0]
+
+
+def verify_volume_prefix(conn=None):
+    # Number of running-total rows that differ from a full recompute, once
+    # stale categories have been brought up to date
+    conn = conn or db.get_connection()
+    volume_index.refresh(conn)
+    return conn.execute(f'''
+    SELECT COUNT(*) FROM (
+        SELECT * FROM ({VOLUME_PREFIX_QUERY}) EXCEPT SELECT * FROM category_volume_prefix
+        UNION ALL
+        SELECT * FROM (SELECT * FROM category_volume_prefix EXCEPT SELECT * FROM ({VOLUME_PREFIX_QUERY}))
+    )
+    ''').fetchone()[0]
+
+
+# Rows removed per transaction when deleting a category, so other writers
+# get the lock between chunks
+DEFAULT_CHUNK_SIZE = 1000
+
+# Everything that hangs off a category, in the order it is removed. Derived
+# rows (stats, rollups) and goals go first, so the workout_logs triggers have
+# nothing left to adjust while the logs are deleted. Each statement takes
+# the category id and a chunk size.
+CATEGORY_CASCADE = [
+    ("goals", '''
+        DELETE FROM goals WHERE id IN (
+            SELECT id FROM goals WHERE category_id=? LIMIT ?
+        )'''),
+    ("exercise_stats", '''
+        DELETE FROM exercise_stats WHERE exercise_id IN (
+            SELECT s.exercise_id FROM exercise_stats s
+            JOIN exercises e ON s.exercise_id = e.id
+            WHERE e.category_id=? LIMIT ?
+        )'''),
+    ("archived_exercise_stats", '''
+        DELETE FROM archived_exercise_stats WHERE exercise_id IN (
+            SELECT s.exercise_id FROM archived_exercise_stats s
+            JOIN exercises e ON s.exercise_id = e.id
+            WHERE e.category_id=? LIMIT ?
+        )'''),
+    ("volume_rollups", '''
+        DELETE FROM volume_rollups WHERE (scope, scope_id, period, bucket) IN (
+            SELECT scope, scope_id, period, bucket FROM volume_rollups
+            WHERE scope='category' AND scope_id=? LIMIT ?
+        )'''),
+    # A chunk of exercises at a time, each a primary key range. Only those
+    # with rollups left are picked, so a short chunk means the last one.
+    ("volume_rollups", '''
+        DELETE FROM volume_rollups WHERE scope='exercise' AND scope_id IN (
+            SELECT id FROM exercises e WHERE category_id=? AND EXISTS (
+                SELECT 1 FROM volume_rollups WHERE scope='exercise' AND scope_id=e.id
+            ) LIMIT ?
+        )'''),
+    ("workout_logs", '''
+        DELETE FROM workout_logs WHERE id IN (
+            SELECT wl.id FROM workout_logs wl
+            JOIN exercises e ON wl.exercise_id = e.id
+            WHERE e.category_id=? LIMIT ?
+        )'''),
+    # After the logs, whose deletion flags the category stale again
+    ("category_volume_prefix", '''
+        DELETE FROM category_volume_prefix WHERE (category_id, day) IN (
+            SELECT category_id, day FROM category_volume_prefix WHERE category_id=? LIMIT ?
+        )'''),
+    ("category_volume_stale", '''
+        DELETE FROM category_volume_stale WHERE category_id IN (
+            SELECT category_id FROM category_volume_stale WHERE category_id=? LIMIT ?
+        )'''),
+    ("routine_exercises", '''
+        DELETE FROM routine_exercises WHERE (routine_id, exercise_id) IN (
+            SELECT re.routine_id, re.exercise_id FROM routine_exercises re
+            JOIN exercises e ON re.exercise_id = e.id
+            WHERE e.category_id=? LIMIT ?
+        )'''),
+    ("exercises", '''
+        DELETE FROM exercises WHERE id IN (
+            SELECT id FROM exercises WHERE category_id=? LIMIT ?
+        )'''),
+]
+
+
+def delete_category(conn, category_id, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    # Remove a category and everything that refers to it, committing after
+    # every chunk. progress(table, rows_deleted_so_far) is called per chunk.
+    # Safe to re-run if interrupted. Returns rows deleted per table.
+    deleted = {}
+
+    # Archived logs go first, while the category's exercises still say
+    # which logs are its
+    archived = archive.delete_category_logs(conn, category_id)
+    if archived:
+        deleted["archived workout_logs"] = archived
+        if progress:
+            progress("archived workout_logs", archived)
+
+    for table, sql in CATEGORY_CASCADE:
+        while True:
+            with conn:
+                count = conn.execute(sql, (category_id, chunk_size)).rowcount
+            deleted[table] = deleted.get(table, 0) + count
+            if progress and count:
+                progress(table, deleted[table])
+            if count < chunk_size:
+                break
+
+    with conn:
+        conn.execute("DELETE FROM exercise_categories WHERE id=?", (category_id,))
+    return deleted
+
+
+def soft_delete_category(conn, category_id):
+    # Hide the category right away; purge_deleted_categories() removes it later
+    with conn:
+        conn.execute(
+            "UPDATE exercise_categories SET deleted_at=? WHERE id=?",
+            (datetime.datetime.now().isoformat(timespec="seconds"), category_id)
+        )
+
+
+def purge_deleted_categories(conn=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    # Physically delete every soft-deleted category; returns how many
+    conn = conn or db.get_connection()
+    purged = 0
+    while True:
+        row = conn.execute(
+            "SELECT id FROM exercise_categories WHERE deleted_at IS NOT NULL LIMIT 1"
+        ).fetchone()
+        if row is None:
+            break
+        delete_category(conn, row[0], chunk_size, progress)
+        purged += 1
+
+    if purged:
+        incremental_vacuum(conn)
+    return purged
+
+
+def start_background_purge(chunk_size=DEFAULT_CHUNK_SIZE):
+    # Purge soft-deleted categories on a daemon thread with its own
+    # connection. If the app exits first, the next purge picks up where
+    # this one stopped.
+    def run():
+        purge_deleted_categories(db.get_connection(), chunk_size)
+        db.close_connection()
+
+    thread = threading.Thread(target=run, name="category-purge", daemon=True)
+    thread.start()
+    return thread
+
+
+def incremental_vacuum(conn=None, pages_per_step=1000):
+    # Give free pages back to the file system a step at a time. Only works
+    # on databases in auto_vacuum=INCREMENTAL mode (new databases are; see
+    # enable_incremental_vacuum() for older ones). Returns pages released.
+    conn = conn or db.get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+
+    start = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        conn.execute(f"PRAGMA incremental_vacuum({pages_per_step})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+    return start - free
+
+
+def enable_incremental_vacuum(conn=None):
+    # Switching an existing database over needs one full VACUUM
+    conn = conn or db.get_connection()
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fitness tracker maintenance tasks")
+    parser.add_argument("command", choices=["recompute-goals", "rebuild-stats", "verify-stats",
+                                            "rebuild-rollups", "verify-rollups", "refresh-volume-prefix",
+                                            "rebuild-volume-prefix", "verify-volume-prefix", "purge-deleted",
+                                            "vacuum", "enable-incremental-vacuum"])
+    args = parser.parse_args()
+
+    if args.command == "recompute-goals":
+        count = recompute_goals()
+        print(f"Recomputed progress for {count} goals.")
+    elif args.command == "rebuild-stats":
+        count = rebuild_exercise_stats()
+        print(f"Rebuilt stats for {count} exercises.")
+    elif args.command == "verify-stats":
+        mismatched = verify_exercise_stats()
+        if mismatched:
+            print(f"Stats out of date for exercise IDs: {', '.join(map(str, mismatched))}")
+            print("Run 'python maintenance.py rebuild-stats' to fix them.")
+            sys.exit(1)
+        print("Exercise stats match the workout logs.")
+    elif args.command == "rebuild-rollups":
+        count = rebuild_volume_rollups()
+        print(f"Rebuilt {count} volume rollup rows.")
+    elif args.command == "verify-rollups":
+        mismatched = verify_volume_rollups()
+        if mismatched:
+            print(f"{mismatched} volume rollup rows are out of date.")
+            print("Run 'python maintenance.py rebuild-rollups' to fix them.")
+            sys.exit(1)
+        print("Volume rollups match the workout logs.")
+    elif args.command == "refresh-volume-prefix":
+        count = volume_index.refresh(db.get_connection())
+        print(f"Refreshed running volume totals for {count} categories.")
+    elif args.command == "rebuild-volume-prefix":
+        count = rebuild_volume_prefix()
+        print(f"Rebuilt {count} running volume total rows.")
+    elif args.command == "verify-volume-prefix":
+        mismatched = verify_volume_prefix()
+        if mismatched:
+            print(f"{mismatched} running volume total rows are out of date.")
+            print("Run 'python maintenance.py rebuild-volume-prefix' to fix them.")
+            sys.exit(1)
+        print("Running volume totals match the volume rollups.")
+    elif args.command == "purge-deleted":
+        def progress(table, deleted):
+            print(f"  {table}: {deleted} rows deleted")
+        count = purge_deleted_categories(progress=progress)
+        print(f"Purged {count} deleted categories.")
+    elif args.command == "vacuum":
+        pages = incremental_vacuum()
+        print(f"Released {pages} free pages.")
+    elif args.command == "enable-incremental-vacuum":
+        enable_incremental_vacuum()
+        print("Incremental vacuum enabled.")
+
+
+if __name__ == "__main__":
+    main()
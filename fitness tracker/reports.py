@@ -0,0 +1,200 @@
+import argparse
+import collections
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import archive
+import dates
+import db
+
+# Non-interactive progress report for every exercise (or one category).
+# Exercises are split into chunks and handed to a process pool; each
+# worker opens its own read-only connection, so they never contend for
+# locks and the app can keep writing meanwhile. Chunks come back in order
+# and are merged into one text, CSV or JSON report.
+#
+#   python reports.py --format csv --output report.csv --workers 8
+#   python reports.py --category 2 --workers 1     # serial, in-process
+
+DEFAULT_CHUNK_SIZE = 50
+DEFAULT_RECENT = 5
+RECENT_DAYS = 28
+
+CSV_FIELDS = [
+    "exercise_id", "exercise", "category", "workouts", "total_sets", "total_reps", "total_volume",
+    "max_sets", "max_reps", "max_volume", "avg_sets", "avg_reps", "first_date", "last_date",
+    f"volume_{RECENT_DAYS}d", "best_day", "best_day_volume", "recent",
+]
+
+# Set in each worker process by _init_worker()
+_worker_conn = None
+_worker_recent = DEFAULT_RECENT
+
+
+def report_exercise_ids(conn, category_id=None):
+    if category_id is None:
+        rows = conn.execute('''
+        SELECT id FROM exercises
+        WHERE category_id IN (SELECT id FROM exercise_categories WHERE deleted_at IS NULL)
+        ORDER BY id
+        ''')
+    else:
+        rows = conn.execute("SELECT id FROM exercises WHERE category_id=? ORDER BY id", (category_id,))
+    return [row[0] for row in rows]
+
+
+def exercise_report(conn, exercise_id, recent=DEFAULT_RECENT):
+    # Stats and a summary of the full history for one exercise, as a dict
+    exercise = conn.execute('''
+    SELECT e.name, ec.name
+    FROM exercises e
+    LEFT JOIN exercise_categories ec ON e.category_id = ec.id
+    WHERE e.id=?
+    ''', (exercise_id,)).fetchone()
+    if exercise is None:
+        return None
+
+    stats = conn.execute('''
+    SELECT workout_count, total_sets, total_reps, max_sets, max_reps, max_total, first_date, last_date
+    FROM exercise_stats
+    WHERE exercise_id=?
+    ''', (exercise_id,)).fetchone() or (0, 0, 0, None, None, None, None, None)
+    workouts, total_sets, total_reps = stats[:3]
+
+    # One pass over the history, oldest first
+    since = dates.today() - RECENT_DAYS + 1
+    total_volume = recent_volume = 0
+    day_volume = {}
+    latest = collections.deque(maxlen=recent)
+    for day, _, sets, reps in archive.read_logs(
+            conn, "SELECT date, id, sets, reps FROM all_workout_logs WHERE exercise_id=? ORDER BY date, id",
+            (exercise_id,), key=lambda row: row[:2]):
+        volume = (sets or 0) * (reps or 0)
+        total_volume += volume
+        day_volume[day] = day_volume.get(day, 0) + volume
+        if day >= since:
+            recent_volume += volume
+        latest.append((day, sets, reps))
+    best_day = max(day_volume, key=day_volume.get) if day_volume else None
+
+    return {
+        "exercise_id": exercise_id,
+        "exercise": exercise[0],
+        "category": exercise[1],
+        "workouts": workouts,
+        "total_sets": total_sets,
+        "total_reps": total_reps,
+        "total_volume": total_volume,
+        "max_sets": stats[3],
+        "max_reps": stats[4],
+        "max_volume": stats[5],
+        "avg_sets": round(total_sets / workouts, 2) if workouts else None,
+        "avg_reps": round(total_reps / workouts, 2) if workouts else None,
+        "first_date": dates.to_iso(stats[6]),
+        "last_date": dates.to_iso(stats[7]),
+        f"volume_{RECENT_DAYS}d": recent_volume,
+        "best_day": dates.to_iso(best_day),
+        "best_day_volume": day_volume.get(best_day),
+        "recent": [[dates.to_iso(day), sets, reps] for day, sets, reps in reversed(latest)],
+    }
+
+
+def report_chunk(conn, exercise_ids, recent=DEFAULT_RECENT):
+    reports = (exercise_report(conn, exercise_id, recent) for exercise_id in exercise_ids)
+    return [report for report in reports if report is not None]
+
+
+def _init_worker(path, recent):
+    global _worker_conn, _worker_recent
+    _worker_conn = db.connect(path, read_only=True)
+    _worker_recent = recent
+
+
+def _run_chunk(exercise_ids):
+    return report_chunk(_worker_conn, exercise_ids, _worker_recent)
+
+
+def generate_report(path=None, category_id=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    recent=DEFAULT_RECENT):
+    # Report rows in exercise id order. workers=None uses every core;
+    # workers=1 runs serially in this process, for comparison or when
+    # processes aren't available.
+    path = path or db.get_database_path()
+    workers = workers or os.cpu_count() or 1
+    conn = db.connect(path, read_only=True)
+    try:
+        exercise_ids = report_exercise_ids(conn, category_id)
+        chunks = [exercise_ids[i:i + chunk_size] for i in range(0, len(exercise_ids), chunk_size)]
+        if workers == 1 or len(chunks) <= 1:
+            return [row for chunk in chunks for row in report_chunk(conn, chunk, recent)]
+    finally:
+        conn.close()
+
+    with multiprocessing.Pool(min(workers, len(chunks)), _init_worker, (path, recent)) as pool:
+        return [row for rows in pool.imap(_run_chunk, chunks) for row in rows]
+
+
+def write_text(rows, out):
+    for row in rows:
+        print(f"{row['exercise']} (Category: {row['category']})", file=out)
+        print("-" * 50, file=out)
+        if not row["workouts"]:
+            print("No workout logs.\n", file=out)
+            continue
+        print(f"Total workouts: {row['workouts']}", file=out)
+        print(f"Max sets: {row['max_sets']}  Max reps: {row['max_reps']}  Max total reps: {row['max_volume']}",
+              file=out)
+        print(f"Average sets: {row['avg_sets']:.1f}  Average reps: {row['avg_reps']:.1f}", file=out)
+        print(f"Total volume: {row['total_volume']}  Last {RECENT_DAYS} days: {row[f'volume_{RECENT_DAYS}d']}",
+              file=out)
+        print(f"Best day: {row['best_day']} ({row['best_day_volume']})", file=out)
+        print(f"First workout: {row['first_date']}  Last workout: {row['last_date']}", file=out)
+        recent = ", ".join(f"{day} {sets}x{reps}" for day, sets, reps in row["recent"])
+        print(f"Recent: {recent}\n", file=out)
+
+
+def write_csv(rows, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        recent = "; ".join(f"{day} {sets}x{reps}" for day, sets, reps in row["recent"])
+        writer.writerow(dict(row, recent=recent))
+
+
+def write_json(rows, out):
+    json.dump(rows, out, indent=2)
+    out.write("\n")
+
+
+WRITERS = {"text": write_text, "csv": write_csv, "json": write_json}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Progress report for every exercise")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="text")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument("--category", type=int, help="only this category's exercises")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per core; 1 = serial)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="exercises per task")
+    parser.add_argument("--recent", type=int, default=DEFAULT_RECENT, help="latest logs listed per exercise")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = generate_report(category_id=args.category, workers=args.workers, chunk_size=args.chunk_size,
+                           recent=args.recent)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, "w", newline="" if args.format == "csv" else None) as out:
+            WRITERS[args.format](rows, out)
+    else:
+        WRITERS[args.format](rows, sys.stdout)
+    print(f"{len(rows)} exercises reported in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
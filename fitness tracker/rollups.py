@@ -0,0 +1,93 @@
+import argparse
+import datetime
+
+import dates
+import db
+
+# Volume trends read from the volume_rollups table, which triggers on
+# workout_logs keep current. Reading a trend costs one row per bucket, no
+# matter how many logs went into it.
+#
+#   python rollups.py exercise 3 week 2024-01-01 2024-06-30
+#   python rollups.py category 1 month 2023-01-01 2023-12-31
+
+PERIODS = ("day", "week", "month")
+
+
+def bucket_start(day, period):
+    # First day of the bucket a date falls in; weeks start on Monday (ISO)
+    if period == "day":
+        return day
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period '{period}' (use day, week or month)")
+
+
+def next_bucket(bucket, period):
+    if period == "day":
+        return bucket + datetime.timedelta(days=1)
+    if period == "week":
+        return bucket + datetime.timedelta(days=7)
+    if bucket.month == 12:
+        return bucket.replace(year=bucket.year + 1, month=1)
+    return bucket.replace(month=bucket.month + 1)
+
+
+def volume_trend(scope, scope_id, period, start_date, end_date, conn=None):
+    # [(bucket start date, volume, log count)] for every bucket in the range,
+    # with zeros for buckets that have no workouts
+    if scope not in ("exercise", "category"):
+        raise ValueError(f"Unknown scope '{scope}' (use exercise or category)")
+
+    conn = conn or db.get_connection()
+    first = bucket_start(start_date, period)
+    last = bucket_start(end_date, period)
+
+    rows = conn.execute('''
+    SELECT bucket, volume, log_count
+    FROM volume_rollups
+    WHERE scope=? AND scope_id=? AND period=? AND bucket >= ? AND bucket <= ?
+    ORDER BY bucket
+    ''', (scope, scope_id, period, dates.to_day(first), dates.to_day(last)))
+    found = {bucket: (volume, log_count) for bucket, volume, log_count in rows}
+
+    series = []
+    bucket = first
+    while bucket <= last:
+        volume, log_count = found.get(dates.to_day(bucket), (0, 0))
+        series.append((bucket, volume, log_count))
+        bucket = next_bucket(bucket, period)
+    return series
+
+
+def exercise_trend(exercise_id, period, start_date, end_date, conn=None):
+    return volume_trend("exercise", exercise_id, period, start_date, end_date, conn)
+
+
+def category_trend(category_id, period, start_date, end_date, conn=None):
+    return volume_trend("category", category_id, period, start_date, end_date, conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a volume trend from the rollup tables")
+    parser.add_argument("scope", choices=["exercise", "category"])
+    parser.add_argument("id", type=int)
+    parser.add_argument("period", choices=PERIODS)
+    parser.add_argument("start", type=datetime.date.fromisoformat)
+    parser.add_argument("end", type=datetime.date.fromisoformat)
+    args = parser.parse_args()
+
+    series = volume_trend(args.scope, args.id, args.period, args.start, args.end)
+    peak = max((volume for _, volume, _ in series), default=0)
+
+    print(f"{'Period':<12} {'Volume':>8} {'Logs':>5}")
+    print("-" * 50)
+    for bucket, volume, log_count in series:
+        bar = "#" * (round(volume / peak * 30) if peak else 0)
+        print(f"{bucket.isoformat():<12} {volume:>8} {log_count:>5} {bar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1248 @@
+import os
+import sqlite3
+import urllib.parse
+
+import archive
+import dates
+
+# Database schema, applied lazily the first time a connection is opened.
+#
+# PRAGMA user_version records how many of the MIGRATIONS below a database
+# has had. When it is current, opening the database costs one PRAGMA read
+# and no DDL. Migrations run in order, in a single transaction, and must
+# never be edited once released: add a new one instead.
+
+
+def create_tables(conn):
+    # Create exercise categories table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''')
+
+    # Create exercises table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS exercises (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        category_id INTEGER,
+        description TEXT,
+        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
+    )
+    ''')
+
+    # Create workout routines table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS workout_routines (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        date_created TEXT NOT NULL
+    )
+    ''')
+
+    # Create routine exercises junction table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS routine_exercises (
+        routine_id INTEGER,
+        exercise_id INTEGER,
+        sets INTEGER,
+        reps INTEGER,
+        PRIMARY KEY (routine_id, exercise_id),
+        FOREIGN KEY (routine_id) REFERENCES workout_routines (id),
+        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+    )
+    ''')
+
+    # Create goals table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS goals (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        target_value INTEGER,
+        current_value INTEGER DEFAULT 0,
+        category_id INTEGER,
+        deadline TEXT,
+        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
+    )
+    ''')
+
+    # Create workout logs table to track progress
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS workout_logs (
+        id INTEGER PRIMARY KEY,
+        exercise_id INTEGER,
+        date TEXT NOT NULL,
+        sets INTEGER,
+        reps INTEGER,
+        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+    )
+    ''')
+
+
+def create_indexes(conn):
+    # Indexes for the lookups the menus run all the time. routine_exercises
+    # needs none: its primary key already starts with routine_id.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_workout_logs_exercise_date ON workout_logs (exercise_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_exercises_category ON exercises (category_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_goals_category ON goals (category_id)")
+
+
+def create_goal_triggers(conn):
+    # Goal progress is the total reps (sets * reps) logged in the goal's
+    # category. These triggers keep it in step with every change to the logs.
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_goals_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        UPDATE goals SET current_value = current_value + COALESCE(NEW.sets * NEW.reps, 0)
+        WHERE category_id = (SELECT category_id FROM exercises WHERE id = NEW.exercise_id);
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_goals_delete
+    AFTER DELETE ON workout_logs
+    BEGIN
+        UPDATE goals SET current_value = current_value - COALESCE(OLD.sets * OLD.reps, 0)
+        WHERE category_id = (SELECT category_id FROM exercises WHERE id = OLD.exercise_id);
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_goals_update
+    AFTER UPDATE OF exercise_id, sets, reps ON workout_logs
+    BEGIN
+        UPDATE goals SET current_value = current_value - COALESCE(OLD.sets * OLD.reps, 0)
+        WHERE category_id = (SELECT category_id FROM exercises WHERE id = OLD.exercise_id);
+        UPDATE goals SET current_value = current_value + COALESCE(NEW.sets * NEW.reps, 0)
+        WHERE category_id = (SELECT category_id FROM exercises WHERE id = NEW.exercise_id);
+    END
+    ''')
+
+
+def create_exercise_stats(conn):
+    # Per-exercise summary for the progress screen, maintained by triggers
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS exercise_stats (
+        exercise_id INTEGER PRIMARY KEY,
+        workout_count INTEGER NOT NULL,
+        total_sets INTEGER NOT NULL,
+        total_reps INTEGER NOT NULL,
+        max_sets INTEGER,
+        max_reps INTEGER,
+        max_total INTEGER,
+        first_date TEXT,
+        last_date TEXT
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_stats_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        INSERT INTO exercise_stats (exercise_id, workout_count, total_sets, total_reps,
+                                    max_sets, max_reps, max_total, first_date, last_date)
+        VALUES (NEW.exercise_id, 1, NEW.sets, NEW.reps,
+                NEW.sets, NEW.reps, NEW.sets * NEW.reps, NEW.date, NEW.date)
+        ON CONFLICT (exercise_id) DO UPDATE SET
+            workout_count = workout_count + 1,
+            total_sets = total_sets + excluded.total_sets,
+            total_reps = total_reps + excluded.total_reps,
+            max_sets = MAX(max_sets, excluded.max_sets),
+            max_reps = MAX(max_reps, excluded.max_reps),
+            max_total = MAX(max_total, excluded.max_total),
+            first_date = MIN(first_date, excluded.first_date),
+            last_date = MAX(last_date, excluded.last_date);
+    END
+    ''')
+
+    # Counts and sums can simply be taken back out. Maxima and dates can't,
+    # so they are looked up again only when the deleted row was one of them.
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_stats_delete
+    AFTER DELETE ON workout_logs
+    BEGIN
+        UPDATE exercise_stats SET
+            workout_count = workout_count - 1,
+            total_sets = total_sets - OLD.sets,
+            total_reps = total_reps - OLD.reps
+        WHERE exercise_id = OLD.exercise_id;
+
+        UPDATE exercise_stats SET
+            max_sets = (SELECT MAX(sets) FROM workout_logs WHERE exercise_id = OLD.exercise_id),
+            max_reps = (SELECT MAX(reps) FROM workout_logs WHERE exercise_id = OLD.exercise_id),
+            max_total = (SELECT MAX(sets * reps) FROM workout_logs WHERE exercise_id = OLD.exercise_id),
+            first_date = (SELECT MIN(date) FROM workout_logs WHERE exercise_id = OLD.exercise_id),
+            last_date = (SELECT MAX(date) FROM workout_logs WHERE exercise_id = OLD.exercise_id)
+        WHERE exercise_id = OLD.exercise_id
+          AND (OLD.sets >= max_sets OR OLD.reps >= max_reps OR OLD.sets * OLD.reps >= max_total
+               OR OLD.date <= first_date OR OLD.date >= last_date);
+
+        DELETE FROM exercise_stats WHERE exercise_id = OLD.exercise_id AND workout_count <= 0;
+    END
+    ''')
+
+    # Edits are rare, so just rebuild the affected rows
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_stats_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        DELETE FROM exercise_stats WHERE exercise_id IN (OLD.exercise_id, NEW.exercise_id);
+        INSERT INTO exercise_stats
+        SELECT exercise_id, COUNT(*), SUM(sets), SUM(reps),
+               MAX(sets), MAX(reps), MAX(sets * reps), MIN(date), MAX(date)
+        FROM workout_logs
+        WHERE exercise_id IN (OLD.exercise_id, NEW.exercise_id)
+        GROUP BY exercise_id;
+    END
+    ''')
+
+    # Fill it for databases that already had logs
+    conn.execute("DELETE FROM exercise_stats")
+    conn.execute('''
+    INSERT INTO exercise_stats
+    /* full scan */
+    SELECT exercise_id, COUNT(*), COALESCE(SUM(sets), 0), COALESCE(SUM(reps), 0),
+           MAX(sets), MAX(reps), MAX(sets * reps), MIN(date), MAX(date)
+    FROM workout_logs
+    GROUP BY exercise_id
+    ''')
+
+
+def create_volume_rollups(conn):
+    # Total volume (sets * reps) per exercise and per category for each day,
+    # ISO week and month. Buckets are named by their first day, so weeks
+    # start on Monday. Maintained by triggers for the trend queries.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS volume_rollups (
+        scope TEXT NOT NULL,
+        scope_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        volume INTEGER NOT NULL,
+        log_count INTEGER NOT NULL,
+        PRIMARY KEY (scope, scope_id, period, bucket)
+    ) WITHOUT ROWID
+    ''')
+
+    # The rollup rows a log belongs to: its exercise and its category, each at
+    # day, week and month granularity
+    rollup_keys = '''
+        SELECT s.scope, s.scope_id, p.period, p.bucket
+        FROM (SELECT 'exercise' AS scope, {row}.exercise_id AS scope_id
+              UNION ALL
+              SELECT 'category', category_id FROM exercises WHERE id = {row}.exercise_id) s,
+             (SELECT 'day' AS period, date({row}.date) AS bucket
+              UNION ALL
+              SELECT 'week', date({row}.date, 'weekday 0', '-6 days')
+              UNION ALL
+              SELECT 'month', date({row}.date, 'start of month')) p
+        WHERE s.scope_id IS NOT NULL AND p.bucket IS NOT NULL
+    '''
+    add_rollups = '''
+        INSERT INTO volume_rollups (scope, scope_id, period, bucket, volume, log_count)
+        SELECT k.*, COALESCE(NEW.sets * NEW.reps, 0), 1 FROM ({keys}) k WHERE true
+        ON CONFLICT DO UPDATE SET
+            volume = volume + excluded.volume,
+            log_count = log_count + 1;
+    '''.format(keys=rollup_keys.format(row='NEW'))
+    remove_rollups = '''
+        UPDATE volume_rollups SET
+            volume = volume - COALESCE(OLD.sets * OLD.reps, 0),
+            log_count = log_count - 1
+        WHERE (scope, scope_id, period, bucket) IN ({keys});
+        DELETE FROM volume_rollups
+        WHERE (scope, scope_id, period, bucket) IN ({keys}) AND log_count <= 0;
+    '''.format(keys=rollup_keys.format(row='OLD'))
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_rollups_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        {add_rollups}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_rollups_delete
+    AFTER DELETE ON workout_logs
+    BEGIN
+        {remove_rollups}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_workout_logs_rollups_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        {remove_rollups}
+        {add_rollups}
+    END
+    ''')
+
+    # Fill it for databases that already had logs
+    conn.execute("DELETE FROM volume_rollups")
+    conn.execute('''
+    INSERT INTO volume_rollups
+    WITH logs AS (
+        /* full scan */
+        SELECT wl.exercise_id, e.category_id, COALESCE(wl.sets * wl.reps, 0) AS volume,
+               date(wl.date) AS day,
+               date(wl.date, 'weekday 0', '-6 days') AS week,
+               date(wl.date, 'start of month') AS month
+        FROM workout_logs wl
+        LEFT JOIN exercises e ON wl.exercise_id = e.id
+    ),
+    bucketed AS (
+        SELECT exercise_id, category_id, volume, 'day' AS period, day AS bucket FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'week', week FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'month', month FROM logs
+    )
+    SELECT 'exercise', exercise_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE exercise_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY exercise_id, period, bucket
+    UNION ALL
+    SELECT 'category', category_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE category_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY category_id, period, bucket
+    ''')
+
+
+def add_category_soft_delete(conn):
+    # Categories can be hidden at once and purged later in the background
+    conn.execute("ALTER TABLE exercise_categories ADD COLUMN deleted_at TEXT")
+    # Lets the category purge find routine entries by exercise
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_routine_exercises_exercise ON routine_exercises (exercise_id)")
+
+
+def speed_up_rollup_triggers(conn):
+    # The first rollup delete/update triggers matched their keys with a row
+    # value IN (...) that SQLite could only resolve by scanning a whole scope.
+    # Written as UPDATE ... FROM and explicit key lists instead, so both
+    # statements seek straight to the six rows through the primary key.
+    rollup_keys = '''
+        SELECT s.scope, s.scope_id, p.period, p.bucket
+        FROM (SELECT 'exercise' AS scope, {row}.exercise_id AS scope_id
+              UNION ALL
+              SELECT 'category', category_id FROM exercises WHERE id = {row}.exercise_id) s,
+             (SELECT 'day' AS period, date({row}.date) AS bucket
+              UNION ALL
+              SELECT 'week', date({row}.date, 'weekday 0', '-6 days')
+              UNION ALL
+              SELECT 'month', date({row}.date, 'start of month')) p
+        WHERE s.scope_id IS NOT NULL AND p.bucket IS NOT NULL
+    '''
+    add_rollups = '''
+        INSERT INTO volume_rollups (scope, scope_id, period, bucket, volume, log_count)
+        SELECT k.*, COALESCE(NEW.sets * NEW.reps, 0), 1 FROM ({keys}) k WHERE true
+        ON CONFLICT DO UPDATE SET
+            volume = volume + excluded.volume,
+            log_count = log_count + 1;
+    '''.format(keys=rollup_keys.format(row='NEW'))
+    remove_rollups = '''
+        UPDATE volume_rollups SET
+            volume = volume - COALESCE(OLD.sets * OLD.reps, 0),
+            log_count = log_count - 1
+        FROM ({keys}) k
+        WHERE volume_rollups.scope = k.scope AND volume_rollups.scope_id = k.scope_id
+          AND volume_rollups.period = k.period AND volume_rollups.bucket = k.bucket;
+        DELETE FROM volume_rollups
+        WHERE log_count <= 0
+          AND ((scope = 'exercise' AND scope_id = OLD.exercise_id)
+            OR (scope = 'category' AND scope_id = (SELECT category_id FROM exercises WHERE id = OLD.exercise_id)))
+          AND period IN ('day', 'week', 'month')
+          AND bucket IN (date(OLD.date), date(OLD.date, 'weekday 0', '-6 days'), date(OLD.date, 'start of month'));
+    '''.format(keys=rollup_keys.format(row='OLD'))
+
+    for name in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_workout_logs_rollups_{name}")
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        {add_rollups}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_delete
+    AFTER DELETE ON workout_logs
+    BEGIN
+        {remove_rollups}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        {remove_rollups}
+        {add_rollups}
+    END
+    ''')
+
+
+def legacy_day(column):
+    # Day number for an old TEXT date. Well-formed dates are converted in
+    # SQL; only the rest go through the slower dates.parse_legacy(). The
+    # round trip through julianday() catches dates like 2024-02-30, which
+    # date() alone passes through unchanged.
+    return (f"CASE WHEN date(julianday({column})) = {column} THEN {dates.sql_from_iso(column)} "
+            f"ELSE legacy_day({column}) END")
+
+
+# New definitions for compact_storage(), and what to copy into each
+COMPACT_TABLES = [
+    ("exercise_categories", '''
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL,
+        deleted_at TEXT
+    ) STRICT''', "SELECT id, name, deleted_at FROM exercise_categories"),
+    ("exercises", '''
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        category_id INTEGER,
+        description TEXT,
+        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
+    ) STRICT''', "SELECT id, name, category_id, description FROM exercises"),
+    # Routine dates were always generated by the app, so one that can't be
+    # read is only possible from hand edits; it becomes the migration day
+    ("workout_routines", '''
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        date_created INTEGER NOT NULL
+    ) STRICT''',
+     f"SELECT id, name, COALESCE({legacy_day('date_created')}, today()) FROM workout_routines"),
+    # The primary key is how every query reaches these rows, so there is
+    # no point in a separate rowid b-tree
+    ("routine_exercises", '''
+        routine_id INTEGER NOT NULL,
+        exercise_id INTEGER NOT NULL,
+        sets INTEGER,
+        reps INTEGER,
+        PRIMARY KEY (routine_id, exercise_id),
+        FOREIGN KEY (routine_id) REFERENCES workout_routines (id),
+        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+    ) STRICT, WITHOUT ROWID''',
+     "SELECT * FROM routine_exercises WHERE routine_id IS NOT NULL AND exercise_id IS NOT NULL"),
+    # An unreadable deadline is dropped rather than guessed at
+    ("goals", '''
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        target_value INTEGER,
+        current_value INTEGER DEFAULT 0,
+        category_id INTEGER,
+        deadline INTEGER,
+        FOREIGN KEY (category_id) REFERENCES exercise_categories (id)
+    ) STRICT''',
+     f"SELECT id, name, target_value, current_value, category_id, {legacy_day('deadline')} FROM goals"),
+    ("workout_logs", '''
+        id INTEGER PRIMARY KEY,
+        exercise_id INTEGER,
+        date INTEGER NOT NULL,
+        sets INTEGER,
+        reps INTEGER,
+        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+    ) STRICT''',
+     f"SELECT * FROM (SELECT id, exercise_id, {legacy_day('date')} AS date, sets, reps FROM workout_logs) "
+     "WHERE date IS NOT NULL"),
+]
+
+# The rollup triggers over day numbers that compact_storage() creates,
+# and create_log_archive() rebuilds the delete one from. Both migrations
+# are released, so these must not change either.
+def rollup_keys(row):
+    # The rollup rows a log belongs to: its exercise and its category, each
+    # at day, week and month granularity. Buckets are day numbers.
+    date = f"{row}.date"
+    return f'''
+    SELECT s.scope, s.scope_id, p.period, p.bucket
+    FROM (SELECT 'exercise' AS scope, {row}.exercise_id AS scope_id
+          UNION ALL
+          SELECT 'category', category_id FROM exercises WHERE id = {row}.exercise_id) s,
+         (SELECT 'day' AS period, {date} AS bucket
+          UNION ALL
+          SELECT 'week', {dates.sql_week_start(date)}
+          UNION ALL
+          SELECT 'month', {dates.sql_month_start(date)}) p
+    WHERE s.scope_id IS NOT NULL AND p.bucket IS NOT NULL
+'''
+
+
+ADD_ROLLUPS = '''
+    INSERT INTO volume_rollups (scope, scope_id, period, bucket, volume, log_count)
+    SELECT k.*, COALESCE(NEW.sets * NEW.reps, 0), 1 FROM ({keys}) k WHERE true
+    ON CONFLICT DO UPDATE SET
+        volume = volume + excluded.volume,
+        log_count = log_count + 1;
+'''.format(keys=rollup_keys('NEW'))
+
+# Written as UPDATE ... FROM and explicit key lists so both statements seek
+# straight to the six rows through the primary key
+REMOVE_ROLLUPS = '''
+    UPDATE volume_rollups SET
+        volume = volume - COALESCE(OLD.sets * OLD.reps, 0),
+        log_count = log_count - 1
+    FROM ({keys}) k
+    WHERE volume_rollups.scope = k.scope AND volume_rollups.scope_id = k.scope_id
+      AND volume_rollups.period = k.period AND volume_rollups.bucket = k.bucket;
+    DELETE FROM volume_rollups
+    WHERE log_count <= 0
+      AND ((scope = 'exercise' AND scope_id = OLD.exercise_id)
+        OR (scope = 'category' AND scope_id = (SELECT category_id FROM exercises WHERE id = OLD.exercise_id)))
+      AND period IN ('day', 'week', 'month')
+      AND bucket IN (OLD.date, {week}, {month});
+'''.format(keys=rollup_keys('OLD'), week=dates.sql_week_start('OLD.date'),
+           month=dates.sql_month_start('OLD.date'))
+
+
+def create_rollup_triggers(conn):
+    for name in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_workout_logs_rollups_{name}")
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        {ADD_ROLLUPS}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_delete
+    AFTER DELETE ON workout_logs
+    BEGIN
+        {REMOVE_ROLLUPS}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        {REMOVE_ROLLUPS}
+        {ADD_ROLLUPS}
+    END
+    ''')
+
+
+LOG_TRIGGERS = [
+    "trg_workout_logs_goals_insert", "trg_workout_logs_goals_delete", "trg_workout_logs_goals_update",
+    "trg_workout_logs_stats_insert", "trg_workout_logs_stats_delete", "trg_workout_logs_stats_update",
+    "trg_workout_logs_rollups_insert", "trg_workout_logs_rollups_delete", "trg_workout_logs_rollups_update",
+]
+
+
+def compact_storage(conn):
+    # Dates become day numbers (see dates.py), every table becomes STRICT
+    # and routine_exercises and volume_rollups are WITHOUT ROWID. SQLite
+    # can't alter a table into any of that, so each one is copied into a
+    # new table that then takes the old one's name. Derived data (stats,
+    # rollups, goal progress) is rebuilt from the logs afterwards.
+    conn.create_function("legacy_day", 1, dates.parse_legacy, deterministic=True)
+    conn.create_function("today", 0, dates.today)
+
+    for name in LOG_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    # Logs whose date can't be read are kept aside instead of being lost
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS malformed_workout_logs (
+        id INTEGER PRIMARY KEY,
+        exercise_id INTEGER,
+        date TEXT,
+        sets INTEGER,
+        reps INTEGER
+    )
+    ''')
+    conn.execute(f'''
+    INSERT INTO malformed_workout_logs
+    /* full scan */
+    SELECT id, exercise_id, date, sets, reps FROM workout_logs WHERE {legacy_day('date')} IS NULL
+    ''')
+
+    for table, definition, select in COMPACT_TABLES:
+        conn.execute(f"CREATE TABLE {table}_new ({definition}")
+        conn.execute(f"INSERT INTO {table}_new {select}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    create_indexes(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_routine_exercises_exercise ON routine_exercises (exercise_id)")
+    create_goal_triggers(conn)
+
+    # The derived tables only need new definitions; they are refilled below
+    conn.execute("DROP TABLE exercise_stats")
+    conn.execute('''
+    CREATE TABLE exercise_stats (
+        exercise_id INTEGER PRIMARY KEY,
+        workout_count INTEGER NOT NULL,
+        total_sets INTEGER NOT NULL,
+        total_reps INTEGER NOT NULL,
+        max_sets INTEGER,
+        max_reps INTEGER,
+        max_total INTEGER,
+        first_date INTEGER,
+        last_date INTEGER
+    ) STRICT
+    ''')
+    create_exercise_stats(conn)
+
+    conn.execute("DROP TABLE volume_rollups")
+    conn.execute('''
+    CREATE TABLE volume_rollups (
+        scope TEXT NOT NULL,
+        scope_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        volume INTEGER NOT NULL,
+        log_count INTEGER NOT NULL,
+        PRIMARY KEY (scope, scope_id, period, bucket)
+    ) STRICT, WITHOUT ROWID
+    ''')
+    create_rollup_triggers(conn)
+    conn.execute(f'''
+    INSERT INTO volume_rollups
+    WITH logs AS (
+        /* full scan */
+        SELECT wl.exercise_id, e.category_id, COALESCE(wl.sets * wl.reps, 0) AS volume,
+               wl.date AS day,
+               {dates.sql_week_start('wl.date')} AS week,
+               {dates.sql_month_start('wl.date')} AS month
+        FROM workout_logs wl
+        LEFT JOIN exercises e ON wl.exercise_id = e.id
+    ),
+    bucketed AS (
+        SELECT exercise_id, category_id, volume, 'day' AS period, day AS bucket FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'week', week FROM logs
+        UNION ALL
+        SELECT exercise_id, category_id, volume, 'month', month FROM logs
+    )
+    SELECT 'exercise', exercise_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE exercise_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY exercise_id, period, bucket
+    UNION ALL
+    SELECT 'category', category_id, period, bucket, SUM(volume), COUNT(*)
+    FROM bucketed
+    WHERE category_id IS NOT NULL AND bucket IS NOT NULL
+    GROUP BY category_id, period, bucket
+    ''')
+
+    # Malformed logs no longer count towards goals
+    conn.execute("UPDATE goals SET current_value = 0")
+    conn.execute('''
+    UPDATE goals SET current_value = totals.volume
+    FROM (
+        /* full scan */
+        SELECT e.category_id, SUM(wl.sets * wl.reps) AS volume
+        FROM workout_logs wl
+        JOIN exercises e ON wl.exercise_id = e.id
+        GROUP BY e.category_id
+    ) AS totals
+    WHERE goals.category_id = totals.category_id
+    ''')
+
+
+def create_exercise_search(conn):
+    # Full-text index over each exercise's name, description and category
+    # name, keyed by exercise id (see search.py). The prefix indexes make
+    # as-you-type queries cheap; the vocabulary table lists the indexed
+    # terms, for correcting typos.
+    conn.execute('''
+    CREATE VIRTUAL TABLE exercise_search USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    ''')
+    conn.execute("CREATE VIRTUAL TABLE exercise_search_terms USING fts5vocab(exercise_search, 'row')")
+
+    conn.execute('''
+    CREATE TRIGGER trg_exercises_search_insert
+    AFTER INSERT ON exercises
+    BEGIN
+        INSERT INTO exercise_search (rowid, name, description, category)
+        VALUES (NEW.id, NEW.name, NEW.description,
+                (SELECT name FROM exercise_categories WHERE id = NEW.category_id));
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER trg_exercises_search_delete
+    AFTER DELETE ON exercises
+    BEGIN
+        DELETE FROM exercise_search WHERE rowid = OLD.id;
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER trg_exercises_search_update
+    AFTER UPDATE OF id, name, description, category_id ON exercises
+    BEGIN
+        DELETE FROM exercise_search WHERE rowid = OLD.id;
+        INSERT INTO exercise_search (rowid, name, description, category)
+        VALUES (NEW.id, NEW.name, NEW.description,
+                (SELECT name FROM exercise_categories WHERE id = NEW.category_id));
+    END
+    ''')
+
+    conn.execute('''
+    CREATE TRIGGER trg_exercise_categories_search_rename
+    AFTER UPDATE OF name ON exercise_categories
+    BEGIN
+        UPDATE exercise_search SET category = NEW.name
+        WHERE rowid IN (SELECT id FROM exercises WHERE category_id = NEW.id);
+    END
+    ''')
+
+    conn.execute('''
+    INSERT INTO exercise_search (rowid, name, description, category)
+    SELECT e.id, e.name, e.description, ec.name
+    FROM exercises e
+    LEFT JOIN exercise_categories ec ON e.category_id = ec.id
+    ''')
+
+
+def create_log_archive(conn):
+    # Logs past a horizon can be moved out to per-year archive databases
+    # (see archive.py) while goals, stats and rollups keep covering them.
+    # log_archives lists the archived years, and archived_exercise_stats
+    # sums up each exercise's archived logs for the triggers that recompute
+    # stats from the logs. A move sets log_archive_control.moving inside its
+    # own transaction, which the delete triggers check before taking the
+    # moved logs back out of the totals.
+    conn.execute('''
+    CREATE TABLE log_archives (
+        year INTEGER PRIMARY KEY,
+        log_count INTEGER NOT NULL,
+        first_day INTEGER NOT NULL,
+        last_day INTEGER NOT NULL
+    ) STRICT
+    ''')
+
+    conn.execute('''
+    CREATE TABLE archived_exercise_stats (
+        exercise_id INTEGER PRIMARY KEY,
+        workout_count INTEGER NOT NULL,
+        total_sets INTEGER NOT NULL,
+        total_reps INTEGER NOT NULL,
+        max_sets INTEGER,
+        max_reps INTEGER,
+        max_total INTEGER,
+        first_date INTEGER,
+        last_date INTEGER,
+        total_volume INTEGER NOT NULL
+    ) STRICT
+    ''')
+
+    conn.execute("CREATE TABLE log_archive_control (moving INTEGER NOT NULL) STRICT")
+    conn.execute("INSERT INTO log_archive_control (moving) VALUES (0)")
+
+    stats = '''
+        SELECT exercise_id, SUM(workout_count) AS workout_count, SUM(total_sets) AS total_sets,
+               SUM(total_reps) AS total_reps, MAX(max_sets) AS max_sets, MAX(max_reps) AS max_reps,
+               MAX(max_total) AS max_total, MIN(first_date) AS first_date, MAX(last_date) AS last_date
+        FROM (
+            SELECT exercise_id, COUNT(*) AS workout_count, SUM(sets) AS total_sets, SUM(reps) AS total_reps,
+                   MAX(sets) AS max_sets, MAX(reps) AS max_reps, MAX(sets * reps) AS max_total,
+                   MIN(date) AS first_date, MAX(date) AS last_date
+            FROM workout_logs
+            WHERE {condition}
+            GROUP BY exercise_id
+            UNION ALL
+            SELECT exercise_id, workout_count, total_sets, total_reps,
+                   max_sets, max_reps, max_total, first_date, last_date
+            FROM archived_exercise_stats
+            WHERE {condition}
+        )
+        GROUP BY exercise_id
+    '''
+    deleted_stats = stats.format(condition="exercise_id = OLD.exercise_id")
+    updated_stats = stats.format(condition="exercise_id IN (OLD.exercise_id, NEW.exercise_id)")
+
+    for name in ("goals_delete", "stats_delete", "stats_update", "rollups_delete"):
+        conn.execute(f"DROP TRIGGER trg_workout_logs_{name}")
+    not_moving = "WHEN NOT (SELECT moving FROM log_archive_control)"
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_goals_delete
+    AFTER DELETE ON workout_logs
+    {not_moving}
+    BEGIN
+        UPDATE goals SET current_value = current_value - COALESCE(OLD.sets * OLD.reps, 0)
+        WHERE category_id = (SELECT category_id FROM exercises WHERE id = OLD.exercise_id);
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_rollups_delete
+    AFTER DELETE ON workout_logs
+    {not_moving}
+    BEGIN
+        {REMOVE_ROLLUPS}
+    END
+    ''')
+
+    # As before, but maxima and dates are looked up in the archived
+    # summary as well as the remaining logs
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_stats_delete
+    AFTER DELETE ON workout_logs
+    {not_moving}
+    BEGIN
+        UPDATE exercise_stats SET
+            workout_count = workout_count - 1,
+            total_sets = total_sets - OLD.sets,
+            total_reps = total_reps - OLD.reps
+        WHERE exercise_id = OLD.exercise_id;
+
+        UPDATE exercise_stats SET (max_sets, max_reps, max_total, first_date, last_date) = (
+            SELECT max_sets, max_reps, max_total, first_date, last_date
+            FROM ({deleted_stats})
+        )
+        WHERE exercise_id = OLD.exercise_id
+          AND (OLD.sets >= max_sets OR OLD.reps >= max_reps OR OLD.sets * OLD.reps >= max_total
+               OR OLD.date <= first_date OR OLD.date >= last_date);
+
+        DELETE FROM exercise_stats WHERE exercise_id = OLD.exercise_id AND workout_count <= 0;
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_stats_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        DELETE FROM exercise_stats WHERE exercise_id IN (OLD.exercise_id, NEW.exercise_id);
+        INSERT INTO exercise_stats
+        {updated_stats};
+    END
+    ''')
+
+
+def mark_volume_stale(row):
+    # Flags the log's category in category_volume_stale from the log's day
+    return f'''
+    INSERT INTO category_volume_stale (category_id, from_day)
+    SELECT category_id, {row}.date FROM exercises WHERE id = {row}.exercise_id AND category_id IS NOT NULL
+    ON CONFLICT (category_id) DO UPDATE SET from_day = MIN(from_day, excluded.from_day);
+'''
+
+
+def create_goal_windows(conn):
+    # Goals can count the volume in a window (the last window_days days,
+    # this week or this month) instead of all time. Windows are summed from
+    # category_volume_prefix, each category's running volume total at the
+    # end of every day it was trained (see volume_index.py). Changes to the
+    # logs only flag the category in category_volume_stale from the day
+    # they touch; the totals are brought up to date when next read.
+    conn.execute("ALTER TABLE goals ADD COLUMN window_type TEXT CHECK (window_type IN ('days', 'week', 'month'))")
+    conn.execute("ALTER TABLE goals ADD COLUMN window_days INTEGER")
+
+    conn.execute('''
+    CREATE TABLE category_volume_prefix (
+        category_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        volume INTEGER NOT NULL,
+        PRIMARY KEY (category_id, day)
+    ) STRICT, WITHOUT ROWID
+    ''')
+
+    conn.execute('''
+    CREATE TABLE category_volume_stale (
+        category_id INTEGER PRIMARY KEY,
+        from_day INTEGER NOT NULL
+    ) STRICT
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_prefix_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        {mark_volume_stale('NEW')}
+    END
+    ''')
+
+    # Archiving leaves the rollups, and so the totals, as they are
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_prefix_delete
+    AFTER DELETE ON workout_logs
+    WHEN NOT (SELECT moving FROM log_archive_control)
+    BEGIN
+        {mark_volume_stale('OLD')}
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_prefix_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        {mark_volume_stale('OLD')}
+        {mark_volume_stale('NEW')}
+    END
+    ''')
+
+    # Fill it for databases that already had logs
+    conn.execute('''
+    INSERT INTO category_volume_prefix
+    /* full scan */
+    SELECT scope_id, bucket, SUM(volume) OVER (PARTITION BY scope_id ORDER BY bucket)
+    FROM volume_rollups
+    WHERE scope = 'category' AND period = 'day'
+    ''')
+
+
+# The tables sync.py keeps in step between devices, parents first, with
+# the columns it copies and which of those refer to another synced table.
+# A table's code in sync_rows is its position here plus one.
+SYNC_TABLES = [
+    ("exercise_categories", ["name", "deleted_at"], {}),
+    ("exercises", ["name", "category_id", "description"], {"category_id": "exercise_categories"}),
+    ("workout_routines", ["name", "date_created"], {}),
+    ("routine_exercises", ["routine_id", "exercise_id", "sets", "reps"],
+     {"routine_id": "workout_routines", "exercise_id": "exercises"}),
+    ("goals", ["name", "target_value", "category_id", "deadline", "window_type", "window_days"],
+     {"category_id": "exercise_categories"}),
+    ("workout_logs", ["exercise_id", "date", "sets", "reps"], {"exercise_id": "exercises"}),
+]
+
+
+def sync_key(table, row):
+    # The (row_id, sub_id) a row is filed under in sync_rows
+    if table == "routine_exercises":
+        return f"{row}.routine_id", f"{row}.exercise_id"
+    return f"{row}.id", "0"
+
+
+def create_sync_log(conn):
+    # Every change to the synced tables is recorded in sync_rows, one entry
+    # per row holding its global id, the version it is at (a Lamport clock
+    # and the device that made the change) and the local sequence number of
+    # its latest change, which sync.py exports deltas by. Global ids are
+    # (device, sequence number when created). routine_exercises rows have
+    # none: they are known by their routine and exercise.
+    conn.execute('''
+    CREATE TABLE sync_devices (
+        id INTEGER PRIMARY KEY,
+        device TEXT NOT NULL UNIQUE
+    ) STRICT
+    ''')
+    conn.execute("INSERT INTO sync_devices (id, device) VALUES (1, lower(hex(randomblob(8))))")
+
+    # One row: this file's device and its counters
+    conn.execute('''
+    CREATE TABLE sync_state (
+        device_id INTEGER NOT NULL REFERENCES sync_devices (id),
+        seq INTEGER NOT NULL,
+        clock INTEGER NOT NULL
+    ) STRICT
+    ''')
+    conn.execute("INSERT INTO sync_state (device_id, seq, clock) VALUES (1, 0, 0)")
+
+    # Deleted rows stay as tombstones. row_id is cleared if SQLite hands
+    # the id of a deleted row to a new one.
+    conn.execute('''
+    CREATE TABLE sync_rows (
+        seq INTEGER PRIMARY KEY,
+        tbl INTEGER NOT NULL,
+        row_id INTEGER,
+        sub_id INTEGER NOT NULL,
+        gid_device INTEGER REFERENCES sync_devices (id),
+        gid_number INTEGER,
+        clock INTEGER NOT NULL,
+        origin INTEGER NOT NULL REFERENCES sync_devices (id),
+        deleted INTEGER NOT NULL
+    ) STRICT
+    ''')
+    conn.execute("CREATE UNIQUE INDEX idx_sync_rows_row ON sync_rows (tbl, row_id, sub_id)")
+    conn.execute("CREATE UNIQUE INDEX idx_sync_rows_gid ON sync_rows (tbl, gid_device, gid_number)")
+
+    # The last sequence number imported from each other device
+    conn.execute('''
+    CREATE TABLE sync_peers (
+        device TEXT PRIMARY KEY,
+        received INTEGER NOT NULL
+    ) STRICT
+    ''')
+
+    for code, (table, columns, _) in enumerate(SYNC_TABLES, 1):
+        if table == "routine_exercises":
+            order, gid = "routine_id, exercise_id", "NULL, NULL"
+        else:
+            order, gid = "id", "s.device_id, s.seq + t.n"
+        row_id, sub_id = sync_key(table, "t")
+        conn.execute(f'''
+        INSERT INTO sync_rows (seq, tbl, row_id, sub_id, gid_device, gid_number, clock, origin, deleted)
+        SELECT s.seq + t.n, {code}, {row_id}, {sub_id}, {gid}, s.seq + t.n, s.device_id, 0
+        FROM (SELECT *, ROW_NUMBER() OVER (ORDER BY {order}) AS n FROM {table}) t, sync_state s
+        ''')
+        conn.execute("UPDATE sync_state SET seq = (SELECT COALESCE(MAX(seq), 0) FROM sync_rows)")
+
+        # Each trigger takes the next sequence number and clock tick first
+        new_id, new_sub = sync_key(table, "NEW")
+        old_id, old_sub = sync_key(table, "OLD")
+        if table == "routine_exercises":
+            # The same routine and exercise again is the same row back
+            record_insert = f'''
+            INSERT INTO sync_rows (seq, tbl, row_id, sub_id, gid_device, gid_number, clock, origin, deleted)
+            SELECT seq, {code}, {new_id}, {new_sub}, NULL, NULL, clock, device_id, 0 FROM sync_state WHERE true
+            ON CONFLICT (tbl, row_id, sub_id) DO UPDATE SET
+                seq = excluded.seq, clock = excluded.clock, origin = excluded.origin, deleted = 0;
+            '''
+        else:
+            record_insert = f'''
+            UPDATE sync_rows SET row_id = NULL WHERE tbl = {code} AND row_id = {new_id} AND sub_id = 0;
+            INSERT INTO sync_rows (seq, tbl, row_id, sub_id, gid_device, gid_number, clock, origin, deleted)
+            SELECT seq, {code}, {new_id}, 0, device_id, seq, clock, device_id, 0 FROM sync_state;
+            '''
+        conn.execute(f'''
+        CREATE TRIGGER trg_{table}_sync_insert
+        AFTER INSERT ON {table}
+        BEGIN
+            UPDATE sync_state SET seq = seq + 1, clock = clock + 1;
+            {record_insert}
+        END
+        ''')
+
+        conn.execute(f'''
+        CREATE TRIGGER trg_{table}_sync_update
+        AFTER UPDATE OF {", ".join(columns)} ON {table}
+        BEGIN
+            UPDATE sync_state SET seq = seq + 1, clock = clock + 1;
+            UPDATE sync_rows SET seq = s.seq, clock = s.clock, origin = s.device_id,
+                                 row_id = {new_id}, sub_id = {new_sub}
+            FROM sync_state s
+            WHERE sync_rows.tbl = {code} AND sync_rows.row_id = {old_id} AND sync_rows.sub_id = {old_sub};
+        END
+        ''')
+
+        # Logs moved to an archive haven't been deleted
+        moving = "WHEN NOT (SELECT moving FROM log_archive_control)" if table == "workout_logs" else ""
+        conn.execute(f'''
+        CREATE TRIGGER trg_{table}_sync_delete
+        AFTER DELETE ON {table}
+        {moving}
+        BEGIN
+            UPDATE sync_state SET seq = seq + 1, clock = clock + 1;
+            UPDATE sync_rows SET seq = s.seq, clock = s.clock, origin = s.device_id, deleted = 1
+            FROM sync_state s
+            WHERE sync_rows.tbl = {code} AND sync_rows.row_id = {old_id} AND sync_rows.sub_id = {old_sub};
+        END
+        ''')
+    conn.execute("UPDATE sync_state SET clock = seq")
+
+
+def count_missing_sets_as_zero(conn):
+    # Logs may leave sets or reps empty, which the stats triggers put
+    # straight into the NOT NULL totals. Count them as 0 like the goals do,
+    # and keep the maxima of the values that are there (the two-argument
+    # MAX is NULL if either is).
+    stats = '''
+        SELECT exercise_id, SUM(workout_count) AS workout_count, SUM(total_sets) AS total_sets,
+               SUM(total_reps) AS total_reps, MAX(max_sets) AS max_sets, MAX(max_reps) AS max_reps,
+               MAX(max_total) AS max_total, MIN(first_date) AS first_date, MAX(last_date) AS last_date
+        FROM (
+            SELECT exercise_id, COUNT(*) AS workout_count, COALESCE(SUM(sets), 0) AS total_sets,
+                   COALESCE(SUM(reps), 0) AS total_reps,
+                   MAX(sets) AS max_sets, MAX(reps) AS max_reps, MAX(sets * reps) AS max_total,
+                   MIN(date) AS first_date, MAX(date) AS last_date
+            FROM workout_logs
+            WHERE {condition}
+            GROUP BY exercise_id
+            UNION ALL
+            SELECT exercise_id, workout_count, total_sets, total_reps,
+                   max_sets, max_reps, max_total, first_date, last_date
+            FROM archived_exercise_stats
+            WHERE {condition}
+        )
+        GROUP BY exercise_id
+    '''
+    deleted_stats = stats.format(condition="exercise_id = OLD.exercise_id")
+    updated_stats = stats.format(condition="exercise_id IN (OLD.exercise_id, NEW.exercise_id)")
+
+    for name in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER trg_workout_logs_stats_{name}")
+
+    conn.execute('''
+    CREATE TRIGGER trg_workout_logs_stats_insert
+    AFTER INSERT ON workout_logs
+    BEGIN
+        INSERT INTO exercise_stats (exercise_id, workout_count, total_sets, total_reps,
+                                    max_sets, max_reps, max_total, first_date, last_date)
+        VALUES (NEW.exercise_id, 1, COALESCE(NEW.sets, 0), COALESCE(NEW.reps, 0),
+                NEW.sets, NEW.reps, NEW.sets * NEW.reps, NEW.date, NEW.date)
+        ON CONFLICT (exercise_id) DO UPDATE SET
+            workout_count = workout_count + 1,
+            total_sets = total_sets + excluded.total_sets,
+            total_reps = total_reps + excluded.total_reps,
+            max_sets = COALESCE(MAX(max_sets, excluded.max_sets), max_sets, excluded.max_sets),
+            max_reps = COALESCE(MAX(max_reps, excluded.max_reps), max_reps, excluded.max_reps),
+            max_total = COALESCE(MAX(max_total, excluded.max_total), max_total, excluded.max_total),
+            first_date = MIN(first_date, excluded.first_date),
+            last_date = MAX(last_date, excluded.last_date);
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_stats_delete
+    AFTER DELETE ON workout_logs
+    WHEN NOT (SELECT moving FROM log_archive_control)
+    BEGIN
+        UPDATE exercise_stats SET
+            workout_count = workout_count - 1,
+            total_sets = total_sets - COALESCE(OLD.sets, 0),
+            total_reps = total_reps - COALESCE(OLD.reps, 0)
+        WHERE exercise_id = OLD.exercise_id;
+
+        UPDATE exercise_stats SET (max_sets, max_reps, max_total, first_date, last_date) = (
+            SELECT max_sets, max_reps, max_total, first_date, last_date
+            FROM ({deleted_stats})
+        )
+        WHERE exercise_id = OLD.exercise_id
+          AND (OLD.sets >= max_sets OR OLD.reps >= max_reps OR OLD.sets * OLD.reps >= max_total
+               OR OLD.date <= first_date OR OLD.date >= last_date);
+
+        DELETE FROM exercise_stats WHERE exercise_id = OLD.exercise_id AND workout_count <= 0;
+    END
+    ''')
+
+    conn.execute(f'''
+    CREATE TRIGGER trg_workout_logs_stats_update
+    AFTER UPDATE OF exercise_id, date, sets, reps ON workout_logs
+    BEGIN
+        DELETE FROM exercise_stats WHERE exercise_id IN (OLD.exercise_id, NEW.exercise_id);
+        INSERT INTO exercise_stats
+        {updated_stats};
+    END
+    ''')
+
+
+def add_catalog_version(conn):
+    # Bumped by every change to the catalog tables, so catalog_cache.py can
+    # tell a catalog edit from any other commit to the database
+    conn.execute("CREATE TABLE catalog_version (version INTEGER NOT NULL) STRICT")
+    conn.execute("INSERT INTO catalog_version (version) VALUES (0)")
+    for table in ("exercise_categories", "exercises"):
+        for event in ("insert", "update", "delete"):
+            conn.execute(f'''
+            CREATE TRIGGER trg_{table}_catalog_{event}
+            AFTER {event.upper()} ON {table}
+            BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END
+            ''')
+
+
+def index_live_categories(conn):
+    # The goal view, reports and exercise list start from the live
+    # categories and look their goals and exercises up by index, so a
+    # hidden category waiting to be purged costs them nothing
+    conn.execute("CREATE INDEX idx_exercise_categories_live ON exercise_categories (id) WHERE deleted_at IS NULL")
+
+
+def never_reuse_log_ids(conn):
+    # Without AUTOINCREMENT SQLite hands out ids from one past the largest
+    # in the table, which once the newest logs are deleted can be the id of
+    # an archived log. The table is copied into one with AUTOINCREMENT, and
+    # its counter starts past every log id in the archives as well.
+    saved = conn.execute('''
+    SELECT sql FROM sqlite_master
+    WHERE tbl_name = 'workout_logs' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ORDER BY rowid
+    ''').fetchall()
+
+    conn.execute('''
+    CREATE TABLE workout_logs_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exercise_id INTEGER,
+        date INTEGER NOT NULL,
+        sets INTEGER,
+        reps INTEGER,
+        FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+    ) STRICT
+    ''')
+    conn.execute("INSERT INTO workout_logs_new (id, exercise_id, date, sets, reps) SELECT * FROM workout_logs")
+    conn.execute("DROP TABLE workout_logs")
+    conn.execute("ALTER TABLE workout_logs_new RENAME TO workout_logs")
+    for (sql,) in saved:
+        conn.execute(sql)
+
+    # The archives can't be attached inside the migration's transaction
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM workout_logs").fetchone()[0]
+    for (year,) in conn.execute("SELECT year FROM log_archives").fetchall():
+        path = archive.archive_path(conn, year)
+        if not os.path.exists(path):
+            continue
+        archived = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True)
+        try:
+            last_id = max(last_id, archived.execute("SELECT COALESCE(MAX(id), 0) FROM workout_logs").fetchone()[0])
+        finally:
+            archived.close()
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'workout_logs'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('workout_logs', ?)", (last_id,))
+
+
+MIGRATIONS = [
+    create_tables,
+    create_indexes,
+    create_goal_triggers,
+    create_exercise_stats,
+    create_volume_rollups,
+    add_category_soft_delete,
+    speed_up_rollup_triggers,
+    compact_storage,
+    create_exercise_search,
+    create_log_archive,
+    create_goal_windows,
+    create_sync_log,
+    count_missing_sets_as_zero,
+    add_catalog_version,
+    index_live_categories,
+    never_reuse_log_ids,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_schema(conn):
+    # Bring the database up to SCHEMA_VERSION; returns the migrations run
+    if schema_version(conn) == SCHEMA_VERSION:
+        return 0
+
+    # Rebuilding a table means dropping the original while other tables
+    # still refer to it, which foreign key enforcement won't allow. It can
+    # only be switched off outside a transaction.
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys=OFF")
+
+    # Take the write lock first so two processes can't migrate at once,
+    # then check again in case another one just did
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than this app supports ({SCHEMA_VERSION})"
+            )
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys={foreign_keys}")
+    return SCHEMA_VERSION - version
@@ -0,0 +1,120 @@
+import argparse
+import re
+
+import db
+
+# Exercise search over the exercise_search FTS5 index (name, description and
+# category name; triggers keep it in step with the tables). Every word of
+# the query matches as a prefix, so results show up while a word is still
+# being typed. A word that no indexed term starts with is treated as a typo
+# and replaced by the closest terms in the index's vocabulary. Results are
+# ranked by bm25, with the name weighted above the category and description.
+#
+#   search.search_exercises(conn, "incl dumbel pres")
+#   python search.py "bench pres" -k 5
+
+DEFAULT_LIMIT = 10
+# bm25 weights for name, description and category
+WEIGHTS = (10.0, 1.0, 4.0)
+# Closest vocabulary terms tried in place of a misspelt word
+MAX_CORRECTIONS = 5
+
+_WORD = re.compile(r"\w+")
+
+SEARCH_QUERY = f'''
+    SELECT exercise_search.rowid, exercise_search.name, exercise_search.category, exercise_search.description
+    FROM exercise_search
+    JOIN exercises e ON e.id = exercise_search.rowid
+    LEFT JOIN exercise_categories ec ON ec.id = e.category_id
+    WHERE exercise_search MATCH ? AND ec.deleted_at IS NULL
+    ORDER BY bm25(exercise_search, {", ".join(map(str, WEIGHTS))})
+    LIMIT ?
+'''
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, or limit + 1 once it is certain to exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _prefix_range(word):
+    # term >= ? AND term < ? bounds matching every term starting with word
+    return word, word + "\U0010ffff"
+
+
+def known_prefix(conn, word):
+    return conn.execute(
+        "SELECT 1 FROM exercise_search_terms WHERE term >= ? AND term < ? LIMIT 1", _prefix_range(word)
+    ).fetchone() is not None
+
+
+def corrections(conn, word, limit=MAX_CORRECTIONS):
+    # Indexed terms within one edit (two for longer words) of word, or of
+    # its start if it is still being typed; the most common first. Only
+    # terms sharing the first letter are considered, so the lookup stays
+    # a range read of the vocabulary.
+    max_distance = 1 if len(word) <= 5 else 2
+    found = []
+    for term, docs in conn.execute(
+            "SELECT term, doc FROM exercise_search_terms WHERE term >= ? AND term < ?", _prefix_range(word[0])):
+        distance = min(edit_distance(word, term, max_distance),
+                       edit_distance(word, term[:len(word)], max_distance))
+        if distance <= max_distance:
+            found.append((distance, -docs, term))
+    return [term for _, _, term in sorted(found)[:limit]]
+
+
+def build_query(conn, text, fuzzy=True):
+    # The FTS5 query for text as a list of per-word clauses, or [] if
+    # nothing in it can match
+    clauses = []
+    for word in _WORD.findall(text.lower()):
+        if not fuzzy or known_prefix(conn, word):
+            clauses.append(f'"{word}"*')
+            continue
+        terms = corrections(conn, word)
+        if terms:
+            clauses.append("(" + " OR ".join(f'"{term}"' for term in terms) + ")")
+    return clauses
+
+
+def search_exercises(conn=None, text="", limit=DEFAULT_LIMIT, fuzzy=True):
+    # [(exercise_id, name, category, description)], best match first.
+    # Exercises matching every word come first; if there are fewer than
+    # limit of those, the rest are filled with ones matching some words.
+    conn = conn or db.get_connection()
+    clauses = build_query(conn, text, fuzzy)
+    if not clauses:
+        return []
+
+    results = conn.execute(SEARCH_QUERY, (" AND ".join(clauses), limit)).fetchall()
+    if len(results) < limit and len(clauses) > 1:
+        seen = {row[0] for row in results}
+        for row in conn.execute(SEARCH_QUERY, (" OR ".join(clauses), limit)):
+            if row[0] not in seen and len(results) < limit:
+                results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the exercise catalog")
+    parser.add_argument("query")
+    parser.add_argument("-k", type=int, default=DEFAULT_LIMIT, help="results to show")
+    args = parser.parse_args()
+
+    for exercise_id, name, category, description in search_exercises(text=args.query, limit=args.k):
+        print(f"{exercise_id:>7}  {name}  ({category})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import api
+import catalog_cache
+import dates
+import db
+import search
+import write_queue
+
+# Local HTTP/JSON server over the tracker database, for clients that can't
+# drive the menu. The event loop only parses requests and writes responses;
+# every database call runs on a bounded thread pool where each thread keeps
+# its own connection (db.get_connection()), and single workout logs posted
+# concurrently are committed together by a WriteQueue.
+#
+#   python server.py --port 8080 --workers 8
+#   curl localhost:8080/goals
+#   curl -d '{"exercise_id": 3, "sets": 3, "reps": 10}' localhost:8080/logs
+#
+# GET  /categories                     POST /categories {"name"}
+# GET  /categories/<id>/exercises      POST /exercises {"name", "category_id", "description"}
+#                                           (or a list of them)
+# GET  /exercises/search?q=&limit=
+# GET  /exercises/<id>/stats           GET  /exercises/<id>/history?start=&end=&limit=
+# GET  /routines                       POST /routines {"name", "items": [{"exercise_id", "sets", "reps"}]}
+# GET  /routines/<id>                  POST /routines/<id>/sessions {"date", "overrides": {"<ex id>": [sets, reps]}}
+# POST /logs {"exercise_id", "date", "sets", "reps"}
+# GET  /goals                          POST /goals {"category_id", "name", "target", "deadline",
+#                                           "window_type", "window_days"}
+# GET  /metrics                        request latency per route, the write queue and the catalog cache
+#
+# Dates are YYYY-MM-DD and default to today. Errors come back as
+# {"error": message} with 400 (bad input), 404 (unknown id or path),
+# 409 (constraint violation) or 503 (log queue full).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 8
+MAX_BODY = 1024 * 1024
+# Latency samples kept per route for the percentiles in /metrics
+LATENCY_SAMPLES = 10000
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _require(body, *names):
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Expected a JSON object")
+    missing = [name for name in names if name not in body]
+    if missing:
+        raise HTTPError(400, f"Missing {', '.join(missing)}")
+    return [body[name] for name in names]
+
+
+def _found(value, what):
+    if value is None:
+        raise HTTPError(404, f"{what} not found")
+    return value
+
+
+def _date(value):
+    return None if value is None else value.isoformat()
+
+
+# Handlers run on the thread pool: (path ids, query, body) -> (status, payload)
+
+def list_categories(ids, query, body):
+    conn = db.get_connection()
+    return 200, [{"id": category_id, "name": name} for category_id, name in catalog_cache.categories(conn)]
+
+
+def add_category(ids, query, body):
+    name, = _require(body, "name")
+    return 201, {"id": api.add_category(name)}
+
+
+def list_exercises(ids, query, body):
+    conn = db.get_connection()
+    category_id = ids[0]
+    _found(catalog_cache.category_name(conn, category_id), "Category")
+    return 200, [{"id": exercise_id, "name": name, "description": description}
+                 for exercise_id, name, description in catalog_cache.exercises_in_category(conn, category_id)]
+
+
+def add_exercises(ids, query, body):
+    many = isinstance(body, list)
+    rows = []
+    for item in body if many else [body]:
+        name, category_id = _require(item, "name", "category_id")
+        rows.append((name, category_id, item.get("description", "")))
+    new_ids = api.add_exercises(rows)
+    return 201, {"ids": new_ids} if many else {"id": new_ids[0]}
+
+
+def search_exercises(ids, query, body):
+    limit = int(query.get("limit", search.DEFAULT_LIMIT))
+    return 200, [{"id": exercise_id, "name": name, "category": category, "description": description}
+                 for exercise_id, name, category, description in api.search_exercises(query.get("q", ""), limit)]
+
+
+def exercise_stats(ids, query, body):
+    _found(catalog_cache.exercise_name(db.get_connection(), ids[0]), "Exercise")
+    stats = api.exercise_stats(ids[0]) or {"workouts": 0}
+    for key in ("first_date", "last_date"):
+        if key in stats:
+            stats[key] = _date(stats[key])
+    return 200, stats
+
+
+def exercise_history(ids, query, body):
+    _found(catalog_cache.exercise_name(db.get_connection(), ids[0]), "Exercise")
+    limit = int(query["limit"]) if "limit" in query else None
+    rows = api.exercise_history(ids[0], query.get("start"), query.get("end"), limit)
+    return 200, [{"id": log_id, "date": _date(day), "sets": sets, "reps": reps} for log_id, day, sets, reps in rows]
+
+
+def list_routines(ids, query, body):
+    return 200, [{"id": routine_id, "name": name, "date_created": _date(created)}
+                 for routine_id, name, created in api.list_routines()]
+
+
+def get_routine(ids, query, body):
+    name = _found(api.routine_name(ids[0]), "Routine")
+    exercises = [{"exercise_id": exercise_id, "exercise": exercise, "category": category, "sets": sets, "reps": reps}
+                 for exercise_id, exercise, category, sets, reps in api.routine_exercises(ids[0])]
+    return 200, {"id": ids[0], "name": name, "exercises": exercises}
+
+
+def create_routine(ids, query, body):
+    name, items = _require(body, "name", "items")
+    rows = [_require(item, "exercise_id", "sets", "reps") for item in items]
+    return 201, {"id": api.create_routine(name, rows)}
+
+
+def log_session(ids, query, body):
+    body = body or {}
+    _found(api.routine_name(ids[0]), "Routine")
+    overrides = {int(exercise_id): tuple(values)
+                 for exercise_id, values in (body.get("overrides") or {}).items()}
+    return 201, {"logged": api.log_session(ids[0], body.get("date"), overrides)}
+
+
+def goal_progress(ids, query, body):
+    goals = api.goal_progress()
+    for goal in goals:
+        for key in ("deadline", "window_start", "window_end"):
+            goal[key] = _date(goal[key])
+    return 200, goals
+
+
+def set_goal(ids, query, body):
+    category_id, name, target = _require(body, "category_id", "name", "target")
+    return 201, {"id": api.set_goal(category_id, name, target, body.get("deadline"), body.get("window_type"),
+                                    body.get("window_days"))}
+
+
+ROUTES = [
+    ("GET", r"/categories", list_categories),
+    ("POST", r"/categories", add_category),
+    ("GET", r"/categories/(\d+)/exercises", list_exercises),
+    ("POST", r"/exercises", add_exercises),
+    ("GET", r"/exercises/search", search_exercises),
+    ("GET", r"/exercises/(\d+)/stats", exercise_stats),
+    ("GET", r"/exercises/(\d+)/history", exercise_history),
+    ("GET", r"/routines", list_routines),
+    ("POST", r"/routines", create_routine),
+    ("GET", r"/routines/(\d+)", get_routine),
+    ("POST", r"/routines/(\d+)/sessions", log_session),
+    ("GET", r"/goals", goal_progress),
+    ("POST", r"/goals", set_goal),
+]
+# (method, name in /metrics, compiled pattern, handler)
+ROUTES = [(method, method + " " + pattern.replace(r"(\d+)", "<id>"), re.compile(pattern + "$"), handler)
+          for method, pattern, handler in ROUTES]
+
+
+class TrackerServer:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS,
+                 max_batch=write_queue.DEFAULT_MAX_BATCH, max_delay_ms=write_queue.DEFAULT_MAX_DELAY_MS):
+        self.host = host
+        self.port = port
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self.writer = write_queue.WriteQueue(max_batch=max_batch, max_delay_ms=max_delay_ms)
+        self._server = None
+        self._lock = threading.Lock()
+        self._latency = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+        self._counts = collections.Counter()
+        self._started = time.monotonic()
+
+    async def start(self):
+        self.writer.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.writer.stop()
+        self.executor.shutdown()
+
+    def _record(self, route, status, seconds):
+        with self._lock:
+            self._latency[route].append(seconds)
+            self._counts[(route, status)] += 1
+
+    def metrics(self):
+        routes = {}
+        with self._lock:
+            samples = {route: sorted(values) for route, values in self._latency.items()}
+            counts = dict(self._counts)
+        for route, values in samples.items():
+            routes[route] = {
+                "requests": sum(n for (name, _), n in counts.items() if name == route),
+                "errors": sum(n for (name, status), n in counts.items() if name == route and status >= 400),
+                "p50_ms": round(values[len(values) // 2] * 1000, 3),
+                "p95_ms": round(values[int(len(values) * 0.95)] * 1000, 3),
+                "p99_ms": round(values[int(len(values) * 0.99)] * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return {
+            "uptime_s": round(time.monotonic() - self._started, 1),
+            "routes": routes,
+            "write_queue": self.writer.metrics(),
+            "catalog_cache": catalog_cache.stats(),
+        }
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                start = time.perf_counter()
+                route, status, payload = await self._dispatch(method, target, body)
+                self._record(route, status, time.perf_counter() - start)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as error:
+            # The request itself couldn't be read; answer and hang up
+            data = json.dumps({"error": str(error)}).encode()
+            writer.write(f"HTTP/1.1 {error.status} {REASONS[error.status]}\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + data)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _dispatch(self, method, target, raw_body):
+        # (route name for the metrics, status, JSON payload)
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        route = "unknown"
+        try:
+            try:
+                body = json.loads(raw_body) if raw_body else None
+            except ValueError:
+                raise HTTPError(400, "Body is not valid JSON")
+
+            if url.path == "/metrics" and method == "GET":
+                return "GET /metrics", 200, self.metrics()
+            if url.path == "/logs":
+                route = "POST /logs"
+                if method != "POST":
+                    raise HTTPError(405, "Use POST")
+                return route, 201, {"id": await self._log(body)}
+
+            allowed = False
+            for route_method, name, pattern, handler in ROUTES:
+                match = pattern.match(url.path)
+                if not match:
+                    continue
+                allowed = True
+                if route_method != method:
+                    continue
+                route = name
+                ids = [int(value) for value in match.groups()]
+                loop = asyncio.get_running_loop()
+                status, payload = await loop.run_in_executor(self.executor, self._call, handler, ids, query, body)
+                return route, status, payload
+            raise HTTPError(405 if allowed else 404, "Method not allowed" if allowed else "No such path")
+        except HTTPError as error:
+            return route, error.status, {"error": str(error)}
+        except sqlite3.IntegrityError as error:
+            return route, 409, {"error": str(error)}
+        except (ValueError, TypeError) as error:
+            return route, 400, {"error": str(error)}
+        except queue.Full:
+            return route, 503, {"error": "Too many pending logs, try again"}
+        except Exception as error:
+            return route, 500, {"error": f"{type(error).__name__}: {error}"}
+
+    @staticmethod
+    def _call(handler, ids, query, body):
+        conn = db.get_connection()
+        try:
+            return handler(ids, query, body)
+        finally:
+            db.release_connection(conn)
+
+    async def _log(self, body):
+        # Coalesced with every other log posted meanwhile; don't wait for
+        # room in the queue, the client can retry
+        exercise_id, sets, reps = _require(body, "exercise_id", "sets", "reps")
+        future = self.writer.submit(exercise_id, body.get("date") or dates.today(), sets, reps, timeout=0)
+        return await asyncio.wrap_future(future)
+
+
+async def serve(host, port, workers):
+    server = await TrackerServer(host, port, workers).start()
+    print(f"Serving {db.get_database_path()} on http://{server.host}:{server.port} ({workers} workers)", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the fitness tracker")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="database threads")
+    args = parser.parse_args()
+
+    # Set up (or migrate) the schema once before the workers connect
+    db.get_connection()
+    db.close_connection()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import glob
+import os
+import re
+import threading
+import zlib
+
+import db
+import schema
+
+# Multi-tenant storage: each user's data lives in its own shard file, so
+# users never wait on each other's write lock and every file stays small.
+# ShardRouter maps a user id to its file, creates the shard with the normal
+# schema the first time it is used, and keeps an LRU pool of open
+# connections capped at max_open file handles.
+#
+#   router = shards.ShardRouter("shards/")
+#   with router.connection("alice") as conn:
+#       api.log_session(routine_id, "2024-05-01", conn=conn)
+#   volumes = router.fan_out(lambda user, conn: conn.execute(TOTAL_VOLUME).fetchone()[0])
+#
+# The tables have no user column, so users can't share a file. The files
+# are spread over DIRECTORY_BUCKETS subdirectories by a hash of the user id
+# instead, so no single directory holds every user.
+#
+#   python shards.py shards/ users
+#   python shards.py shards/ volume
+
+DEFAULT_MAX_OPEN = 64
+DIRECTORY_BUCKETS = 256
+
+# User ids become part of a file name
+_USER_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+
+TOTAL_VOLUME = '''
+    SELECT COUNT(*), COALESCE(SUM(sets * reps), 0) FROM workout_logs
+'''
+
+
+class _Shard:
+    # A pooled connection; busy while a thread is using it
+    def __init__(self):
+        self.conn = None
+        self.busy = True
+
+
+class ShardRouter:
+    def __init__(self, directory, max_open=DEFAULT_MAX_OPEN):
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.directory = directory
+        self.max_open = max_open
+        # user id -> _Shard, least recently used first
+        self._pool = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._metrics = {"hits": 0, "opened": 0, "created": 0, "evicted": 0, "waits": 0}
+
+    def shard_path(self, user_id):
+        user_id = str(user_id)
+        if not _USER_ID.fullmatch(user_id):
+            raise ValueError(f"Invalid user id {user_id!r}")
+        bucket = zlib.crc32(user_id.encode()) % DIRECTORY_BUCKETS
+        return os.path.join(self.directory, f"{bucket:02x}", f"user-{user_id}.db")
+
+    def exists(self, user_id):
+        return os.path.exists(self.shard_path(user_id))
+
+    def users(self):
+        # Every user with a shard, sorted
+        paths = glob.glob(os.path.join(self.directory, "*", "user-*.db"))
+        return sorted(os.path.basename(path)[len("user-"):-len(".db")] for path in paths)
+
+    @contextlib.contextmanager
+    def connection(self, user_id, create=True):
+        # The user's connection, held by this thread until the block ends;
+        # anything left uncommitted is rolled back then. Raises ValueError
+        # for a user without a shard when create is False.
+        user_id = str(user_id)
+        shard = self._acquire(user_id, create)
+        try:
+            yield shard.conn
+        finally:
+            db.release_connection(shard.conn)
+            self._release(shard)
+
+    def _acquire(self, user_id, create):
+        if not create and not self.exists(user_id):
+            raise ValueError(f"No shard for user {user_id}")
+        with self._condition:
+            while True:
+                shard = self._pool.get(user_id)
+                if shard is not None:
+                    if not shard.busy:
+                        shard.busy = True
+                        self._pool.move_to_end(user_id)
+                        self._metrics["hits"] += 1
+                        return shard
+                elif len(self._pool) < self.max_open or self._evict_idle():
+                    # Reserve the slot; the file is opened outside the lock
+                    shard = self._pool[user_id] = _Shard()
+                    break
+                self._metrics["waits"] += 1
+                self._condition.wait()
+
+        try:
+            shard.conn = self._open(user_id, create)
+        except BaseException:
+            with self._condition:
+                del self._pool[user_id]
+                self._condition.notify_all()
+            raise
+        return shard
+
+    def _open(self, user_id, create):
+        path = self.shard_path(user_id)
+        created = not os.path.exists(path)
+        if created:
+            if not create:
+                raise ValueError(f"No shard for user {user_id}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        conn = db.connect(path, check_same_thread=False)
+        try:
+            schema.ensure_schema(conn)
+        except BaseException:
+            conn.close()
+            raise
+        with self._condition:
+            self._metrics["opened"] += 1
+            self._metrics["created"] += created
+        return conn
+
+    def _evict_idle(self):
+        # Closes the least recently used idle connection; False if all busy
+        for user_id, shard in self._pool.items():
+            if not shard.busy:
+                del self._pool[user_id]
+                shard.conn.close()
+                self._metrics["evicted"] += 1
+                return True
+        return False
+
+    def _release(self, shard):
+        with self._condition:
+            shard.busy = False
+            self._condition.notify_all()
+
+    def fan_out(self, query, user_ids=None, workers=8):
+        # {user id: query(user id, connection)} over every shard (or the
+        # given users), a few at a time. Shards aren't created for it.
+        user_ids = self.users() if user_ids is None else [str(user_id) for user_id in user_ids]
+        workers = max(1, min(workers, self.max_open, len(user_ids) or 1))
+
+        def run(user_id):
+            with self.connection(user_id, create=False) as conn:
+                return query(user_id, conn)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard") as pool:
+            return dict(zip(user_ids, pool.map(run, user_ids)))
+
+    def metrics(self):
+        with self._condition:
+            result = dict(self._metrics)
+            result["open"] = len(self._pool)
+            result["busy"] = sum(shard.busy for shard in self._pool.values())
+        return result
+
+    def close(self):
+        # Closes every pooled connection; none may be in use
+        with self._condition:
+            for shard in self._pool.values():
+                if shard.conn is not None:
+                        shard.conn.close()
+            self._pool.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a directory of per-user shards")
+    parser.add_argument("directory")
+    parser.add_argument("command", choices=["users", "volume"])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    router = ShardRouter(args.directory)
+    if args.command == "users":
+        for user_id in router.users():
+            print(user_id)
+    else:
+        totals = router.fan_out(lambda user_id, conn: conn.execute(TOTAL_VOLUME).fetchone(), workers=args.workers)
+        print(f"{'User':<24} {'Logs':>10} {'Volume':>12}")
+        for user_id, (logs, volume) in sorted(totals.items()):
+            print(f"{user_id:<24} {logs:>10} {volume:>12}")
+        print(f"{'All users':<24} {sum(t[0] for t in totals.values()):>10} "
+              f"{sum(t[1] for t in totals.values()):>12}")
+    router.close()
+
+
+if __name__ == "__main__":
+    main()
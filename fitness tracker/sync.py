@@ -0,0 +1,471 @@
+import argparse
+import json
+import sys
+import time
+
+import archive
+import db
+import schema
+
+# Delta sync between copies of the database on different devices. Triggers
+# record every change to the six synced tables in sync_rows (see
+# schema.create_sync_log), so a delta is the rows changed since a sequence
+# number: a day of workouts is a few kilobytes whatever the size of the
+# history. Rows are matched across devices by global id, "<device>:<n>",
+# and references between rows travel as the global ids they point at.
+#
+# Conflicts are settled the same way on every device:
+# - Each row has a version, (Lamport clock, device that changed it), and
+#   the higher version wins the whole row. A deletion is a change too.
+# - A row whose parent has been deleted here is dropped. The deletion,
+#   once synced back, deletes the row on the other device as well.
+#   Deleting a row deletes whatever still refers to it.
+# - Two categories can't share a name: the one with the greater global id
+#   is renamed "<name> (2)".
+#
+# To add a device, copy the database file over and run new-device on the
+# copy. Changes from elsewhere to logs this file has archived are recorded
+# but not applied to the archive.
+#
+#   python sync.py sync phone.db laptop.db
+#   python sync.py export --since 120 -o delta.json
+#   python sync.py import delta.json
+#   python sync.py new-device
+#   python sync.py status
+
+FORMAT = 1
+
+TABLES = [table for table, _, _ in schema.SYNC_TABLES]
+CODES = {table: code for code, table in enumerate(TABLES, 1)}
+COLUMNS = {table: columns for table, columns, _ in schema.SYNC_TABLES}
+REFERENCES = {table: references for table, _, references in schema.SYNC_TABLES}
+
+# Progress isn't synced: each device counts it from its own logs, as
+# api.set_goal() does
+GOAL_PROGRESS = '''
+    UPDATE goals SET current_value = (
+        SELECT COALESCE(SUM(wl.sets * wl.reps), 0)
+        FROM workout_logs wl
+        JOIN exercises e ON wl.exercise_id = e.id
+        WHERE e.category_id = goals.category_id
+    ) + (
+        SELECT COALESCE(SUM(s.total_volume), 0)
+        FROM archived_exercise_stats s
+        JOIN exercises e ON s.exercise_id = e.id
+        WHERE e.category_id = goals.category_id
+    )
+    WHERE id = ?
+'''
+
+# What goes with a row another device deleted, besides its children in
+# the synced tables
+CASCADES = {
+    "workout_routines": ["DELETE FROM routine_exercises WHERE routine_id=?"],
+    "exercises": [
+        "DELETE FROM routine_exercises WHERE exercise_id=?",
+        "DELETE FROM workout_logs WHERE exercise_id=?",
+        "DELETE FROM exercise_stats WHERE exercise_id=?",
+        "DELETE FROM archived_exercise_stats WHERE exercise_id=?",
+        "DELETE FROM volume_rollups WHERE scope='exercise' AND scope_id=?",
+    ],
+    "exercise_categories": [
+        "DELETE FROM goals WHERE category_id=?",
+        "DELETE FROM volume_rollups WHERE scope='category' AND scope_id=?",
+        "DELETE FROM category_volume_prefix WHERE category_id=?",
+        "DELETE FROM category_volume_stale WHERE category_id=?",
+    ],
+}
+
+
+def device(conn):
+    # This file's device id
+    return conn.execute('''
+    SELECT d.device FROM sync_state s JOIN sync_devices d ON d.id = s.device_id
+    ''').fetchone()[0]
+
+
+def _device_ref(conn, device):
+    conn.execute("INSERT OR IGNORE INTO sync_devices (device) VALUES (?)", (device,))
+    return conn.execute("SELECT id FROM sync_devices WHERE device=?", (device,)).fetchone()[0]
+
+
+def _split(gid):
+    # "<device>:<n>" -> (device, n), which is also the order global ids sort in
+    device, number = gid.split(":")
+    return device, int(number)
+
+
+def _gid(conn, table, row_id):
+    # Global id of a local row, or None
+    row = conn.execute('''
+    SELECT d.device, r.gid_number FROM sync_rows r JOIN sync_devices d ON d.id = r.gid_device
+    WHERE r.tbl=? AND r.row_id=? AND r.sub_id=0
+    ''', (CODES[table], row_id)).fetchone()
+    return None if row is None else f"{row[0]}:{row[1]}"
+
+
+def _entry(conn, table, gid):
+    # (seq, row_id, deleted, clock, origin) of the row with a global id, or
+    # None if it has never been seen here
+    device, number = _split(gid)
+    return conn.execute('''
+    SELECT r.seq, r.row_id, r.deleted, r.clock, o.device
+    FROM sync_rows r
+    JOIN sync_devices g ON g.id = r.gid_device
+    JOIN sync_devices o ON o.id = r.origin
+    WHERE r.tbl=? AND g.device=? AND r.gid_number=?
+    ''', (CODES[table], device, number)).fetchone()
+
+
+def _routine_entry(conn, routine_id, exercise_id):
+    # The same for a routine_exercises row, found by its local key
+    return conn.execute('''
+    SELECT r.seq, r.row_id, r.deleted, r.clock, o.device
+    FROM sync_rows r JOIN sync_devices o ON o.id = r.origin
+    WHERE r.tbl=? AND r.row_id=? AND r.sub_id=?
+    ''', (CODES["routine_exercises"], routine_id, exercise_id)).fetchone()
+
+
+def _parent_id(conn, table, gid, child):
+    # Local id of a row referred to by another; None if it has been
+    # deleted here. Raises ValueError if it has never been seen.
+    entry = _entry(conn, table, gid)
+    if entry is None:
+        raise ValueError(f"{child} refers to {table} {gid}, which hasn't been synced here; "
+                         "export the changes from an earlier sequence number")
+    return None if entry[2] else entry[1]
+
+
+def _export_row(conn, table, row_id, sub_id, gid_device, gid_number, deleted):
+    # The change a sync_rows entry stands for, without its version; None if
+    # it can't be sent (a routine entry whose routine or exercise id was
+    # reused after a deletion, or a log moved to an archive since)
+    if table == "routine_exercises":
+        routine, exercise = _gid(conn, "workout_routines", row_id), _gid(conn, "exercises", sub_id)
+        if routine is None or exercise is None:
+            return None
+        gid, where, key = f"{routine}/{exercise}", "routine_id=? AND exercise_id=?", (row_id, sub_id)
+    else:
+        gid, where, key = f"{gid_device}:{gid_number}", "id=?", (row_id,)
+    if deleted:
+        return {"table": table, "gid": gid, "deleted": True}
+
+    values = conn.execute(f"SELECT {', '.join(COLUMNS[table])} FROM {table} WHERE {where}", key).fetchone()
+    if values is None:
+        return None
+    row = dict(zip(COLUMNS[table], values))
+    for column, parent in REFERENCES[table].items():
+        if row[column] is not None:
+            row[column] = _gid(conn, parent, row[column])
+    return {"table": table, "gid": gid, "row": row}
+
+
+def export_changes(conn, since=0, peer=None):
+    # The changes made or received here after sequence number since, as a
+    # delta for import_changes(). Changes that came from the device peer
+    # are left out, as it has them already.
+    conn.execute("BEGIN")
+    try:
+        until = conn.execute("SELECT seq FROM sync_state").fetchone()[0]
+        entries = conn.execute('''
+        SELECT r.tbl, r.row_id, r.sub_id, g.device, r.gid_number, r.clock, o.device, r.deleted
+        FROM sync_rows r
+        JOIN sync_devices o ON o.id = r.origin
+        LEFT JOIN sync_devices g ON g.id = r.gid_device
+        WHERE r.seq > ? AND o.device IS NOT ?
+        ORDER BY r.seq
+        ''', (since, peer)).fetchall()
+        changes = []
+        for code, row_id, sub_id, gid_device, gid_number, clock, origin, deleted in entries:
+            change = _export_row(conn, TABLES[code - 1], row_id, sub_id, gid_device, gid_number, deleted)
+            if change is not None:
+                change["clock"], change["origin"] = clock, origin
+                changes.append(change)
+        return {"format": FORMAT, "device": device(conn), "since": since, "until": until, "changes": changes}
+    finally:
+        conn.rollback()
+
+
+def _stamp(conn, table, row_id, sub_id, clock, origin):
+    # Gives a row the version it had on the device the change came from.
+    # It keeps its new sequence number, so it is passed on to other devices.
+    conn.execute("UPDATE sync_rows SET clock=?, origin=? WHERE tbl=? AND row_id=? AND sub_id=?",
+                 (clock, _device_ref(conn, origin), CODES[table], row_id, sub_id))
+
+
+def _free_name(conn, name):
+    number = 2
+    while conn.execute("SELECT 1 FROM exercise_categories WHERE name=?", (f"{name} ({number})",)).fetchone():
+        number += 1
+    return f"{name} ({number})"
+
+
+def _settle_name(conn, row, gid, row_id):
+    # Makes room for an incoming category whose name is taken by another:
+    # whichever of the two has the greater global id is renamed. Returns
+    # True if that is the incoming one.
+    clash = conn.execute("SELECT id FROM exercise_categories WHERE name=? AND id IS NOT ?",
+                         (row["name"], row_id)).fetchone()
+    if clash is None:
+        return False
+    free = _free_name(conn, row["name"])
+    if _split(gid) > _split(_gid(conn, "exercise_categories", clash[0])):
+        row["name"] = free
+        return True
+    conn.execute("UPDATE exercise_categories SET name=? WHERE id=?", (free, clash[0]))
+    return False
+
+
+def _apply_row(conn, change):
+    # Inserts or updates a row unless the version here is newer. Returns 1
+    # if it was applied.
+    table, gid = change["table"], change["gid"]
+    row = dict(change["row"])
+    for column, parent in REFERENCES[table].items():
+        if row[column] is not None:
+            row[column] = _parent_id(conn, parent, row[column], f"{table} {gid}")
+            if row[column] is None:
+                return 0
+
+    if table == "routine_exercises":
+        entry = _routine_entry(conn, row["routine_id"], row["exercise_id"])
+    else:
+        entry = _entry(conn, table, gid)
+    if entry is not None and tuple(entry[3:]) >= (change["clock"], change["origin"]):
+        return 0
+    live = entry is not None and not entry[2]
+
+    renamed = table == "exercise_categories" and _settle_name(conn, row, gid, entry[1] if live else None)
+    columns = COLUMNS[table]
+    values = [row[column] for column in columns]
+    if table == "routine_exercises":
+        conn.execute('''
+        INSERT INTO routine_exercises (routine_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)
+        ON CONFLICT (routine_id, exercise_id) DO UPDATE SET sets = excluded.sets, reps = excluded.reps
+        ''', values)
+        row_id, sub_id = row["routine_id"], row["exercise_id"]
+    elif live:
+        row_id, sub_id = entry[1], 0
+        assignments = ", ".join(f"{column}=?" for column in columns)
+        conn.execute(f"UPDATE {table} SET {assignments} WHERE id=?", values + [row_id])
+    else:
+        # The new row's entry takes over the global id from any tombstone
+        if entry is not None:
+            conn.execute("DELETE FROM sync_rows WHERE seq=?", (entry[0],))
+        placeholders = ", ".join("?" for _ in columns)
+        row_id, sub_id = conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                                      values).lastrowid, 0
+        device, number = _split(gid)
+        conn.execute("UPDATE sync_rows SET gid_device=?, gid_number=? WHERE tbl=? AND row_id=? AND sub_id=0",
+                     (_device_ref(conn, device), number, CODES[table], row_id))
+
+    if table == "goals":
+        conn.execute(GOAL_PROGRESS, (row_id,))
+    # A row renamed here keeps the local version the rename gave it, so the
+    # new name goes back to the sender
+    if not renamed:
+        _stamp(conn, table, row_id, sub_id, change["clock"], change["origin"])
+    return 1
+
+
+def _delete_row(conn, table, row_id, sub_id, deleted_exercises):
+    # Deletes a row and everything that refers to it; the triggers record
+    # each deletion
+    if table == "exercise_categories":
+        for (exercise_id,) in conn.execute("SELECT id FROM exercises WHERE category_id=?", (row_id,)).fetchall():
+            _delete_row(conn, "exercises", exercise_id, 0, deleted_exercises)
+    elif table == "exercises":
+        deleted_exercises.append(row_id)
+    for sql in CASCADES.get(table, []):
+        conn.execute(sql, (row_id,))
+    if table == "routine_exercises":
+        conn.execute("DELETE FROM routine_exercises WHERE routine_id=? AND exercise_id=?", (row_id, sub_id))
+    else:
+        conn.execute(f"DELETE FROM {table} WHERE id=?", (row_id,))
+
+
+def _apply_deletion(conn, change, deleted_exercises):
+    # Deletes a row unless the version here is newer. Returns 1 if the
+    # deletion was applied or recorded.
+    table, gid = change["table"], change["gid"]
+    if table == "routine_exercises":
+        routine_gid, exercise_gid = gid.split("/")
+        routine, exercise = _entry(conn, "workout_routines", routine_gid), _entry(conn, "exercises", exercise_gid)
+        if routine is None or exercise is None or routine[1] is None or exercise[1] is None:
+            # Its routine or exercise never made it here, or went with a
+            # deletion, and the row with it
+            return 0
+        row_id, sub_id = routine[1], exercise[1]
+        entry = _routine_entry(conn, row_id, sub_id)
+    else:
+        entry = _entry(conn, table, gid)
+        row_id, sub_id = (entry[1] if entry else None), 0
+    if entry is not None and tuple(entry[3:]) >= (change["clock"], change["origin"]):
+        return 0
+
+    if entry is not None and not entry[2]:
+        _delete_row(conn, table, row_id, sub_id, deleted_exercises)
+        _stamp(conn, table, row_id, sub_id, change["clock"], change["origin"])
+        return 1
+
+    # Already deleted here, or never seen: the tombstone takes the newer
+    # version, so an older copy of the row can't come back, and is passed on
+    conn.execute("UPDATE sync_state SET seq = seq + 1")
+    origin = _device_ref(conn, change["origin"])
+    if entry is not None:
+        conn.execute("UPDATE sync_rows SET seq = (SELECT seq FROM sync_state), clock=?, origin=? WHERE seq=?",
+                     (change["clock"], origin, entry[0]))
+    elif table == "routine_exercises":
+        conn.execute('''
+        INSERT INTO sync_rows (seq, tbl, row_id, sub_id, gid_device, gid_number, clock, origin, deleted)
+        SELECT seq, ?, ?, ?, NULL, NULL, ?, ?, 1 FROM sync_state
+        ''', (CODES[table], row_id, sub_id, change["clock"], origin))
+    else:
+        device, number = _split(gid)
+        conn.execute('''
+        INSERT INTO sync_rows (seq, tbl, row_id, sub_id, gid_device, gid_number, clock, origin, deleted)
+        SELECT seq, ?, NULL, 0, ?, ?, ?, ?, 1 FROM sync_state
+        ''', (CODES[table], _device_ref(conn, device), number, change["clock"], origin))
+    return 1
+
+
+def import_changes(conn, delta):
+    # Applies a delta from another device's export_changes() in one
+    # transaction. Returns (changes applied, changes skipped because the
+    # version here was as new or newer, or the row's parent was deleted).
+    if delta.get("format") != FORMAT:
+        raise ValueError(f"Unknown delta format {delta.get('format')!r}")
+    source, changes = delta["device"], delta["changes"]
+    for change in changes:
+        if change.get("table") not in CODES:
+            raise ValueError(f"Unknown table {change.get('table')!r} in delta")
+    # Rows parents first, then deletions children first. sorted() keeps
+    # each table's changes in the order they were made.
+    rows = sorted((c for c in changes if not c.get("deleted")), key=lambda c: CODES[c["table"]])
+    deletions = sorted((c for c in changes if c.get("deleted")), key=lambda c: -CODES[c["table"]])
+
+    deleted_exercises = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if source == device(conn):
+            raise ValueError(f"The delta comes from this device ({source}). If this file is a copy, "
+                             "give it a device id of its own with 'python sync.py new-device'.")
+        received = received_from(conn, source)
+        if delta["since"] > received:
+            raise ValueError(f"The delta starts after sequence number {delta['since']}, but only changes "
+                             f"up to {received} have been received from {source}")
+        applied = sum(_apply_row(conn, change) for change in rows)
+        applied += sum(_apply_deletion(conn, change, deleted_exercises) for change in deletions)
+        conn.execute("UPDATE sync_state SET clock = MAX(clock, ?)",
+                     (max((change["clock"] for change in changes), default=0),))
+        conn.execute('''
+        INSERT INTO sync_peers (device, received) VALUES (?, ?)
+        ON CONFLICT (device) DO UPDATE SET received = MAX(received, excluded.received)
+        ''', (source, delta["until"]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    # Archives can only be attached outside a transaction
+    if deleted_exercises:
+        archive.delete_exercise_logs(conn, deleted_exercises)
+    return applied, len(changes) - applied
+
+
+def received_from(conn, peer):
+    # The last sequence number of peer's imported here
+    row = conn.execute("SELECT received FROM sync_peers WHERE device=?", (peer,)).fetchone()
+    return row[0] if row else 0
+
+
+def encode(delta):
+    return json.dumps(delta, separators=(",", ":"))
+
+
+def pull(conn, source):
+    # Imports into conn what source has that conn hasn't received yet, as
+    # an encoded delta, the way it would travel between devices. Returns
+    # (changes sent, delta size in bytes, changes applied).
+    data = encode(export_changes(source, received_from(conn, device(source)), peer=device(conn)))
+    delta = json.loads(data)
+    applied, _ = import_changes(conn, delta)
+    return len(delta["changes"]), len(data), applied
+
+
+def new_device(conn):
+    # Gives a copy of another device's database a device id of its own.
+    # The copy has every change the original had, which isn't sent to it
+    # again. Returns the new id.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        original = device(conn)
+        conn.execute("INSERT INTO sync_devices (device) VALUES (lower(hex(randomblob(8))))")
+        conn.execute("UPDATE sync_state SET device_id = last_insert_rowid()")
+        conn.execute('''
+        INSERT INTO sync_peers (device, received) SELECT ?, seq FROM sync_state WHERE true
+        ON CONFLICT (device) DO UPDATE SET received = excluded.received
+        ''', (original,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return device(conn)
+
+
+def _open(path):
+    conn = db.connect(path)
+    schema.ensure_schema(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync changes between copies of the tracker database")
+    parser.add_argument("command", choices=["sync", "export", "import", "new-device", "status"])
+    parser.add_argument("paths", nargs="*", help="sync: two database files; import: the delta file")
+    parser.add_argument("--since", type=int, default=0, help="export: changes after this sequence number")
+    parser.add_argument("--peer", help="export: leave out changes that came from this device")
+    parser.add_argument("-o", "--output", help="export: file to write (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        if len(args.paths) != 2:
+            parser.error("sync takes two database files")
+        first, second = (_open(path) for path in args.paths)
+        for source, target, (source_path, target_path) in [(first, second, args.paths),
+                                                           (second, first, args.paths[::-1])]:
+            start = time.perf_counter()
+            sent, size, applied = pull(target, source)
+            print(f"{source_path} -> {target_path}: {sent} changes, {size / 1024:.1f} KB, {applied} applied "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        first.close()
+        second.close()
+    elif args.command == "export":
+        data = encode(export_changes(db.get_connection(), args.since, args.peer))
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(data)
+        else:
+            print(data)
+    elif args.command == "import":
+        if len(args.paths) != 1:
+            parser.error("import takes one delta file")
+        with open(args.paths[0]) as f:
+            delta = json.load(f)
+        try:
+            applied, skipped = import_changes(db.get_connection(), delta)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"{applied} changes applied, {skipped} skipped")
+    elif args.command == "new-device":
+        print(f"This database is now device {new_device(db.get_connection())}")
+    else:
+        conn = db.get_connection()
+        print(f"Device {device(conn)}, last change {conn.execute('SELECT seq FROM sync_state').fetchone()[0]}")
+        for peer, received in conn.execute("SELECT device, received FROM sync_peers ORDER BY device"):
+            print(f"  received from {peer} up to {received}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import datetime
+import itertools
+import random
+
+import dates
+import db
+
+# Builds a database full of realistic-looking fake data for benchmarks:
+#
+#   python synthetic_data.py bench.db --logs 1000000
+#
+# Exercise popularity follows a Zipf-like curve (a few lifts get most of the
+# logs), workouts cluster on Mon/Wed/Fri and get more frequent towards the
+# end date, and sets/reps sit around 3x10.
+
+CATEGORY_NAMES = ["Legs", "Chest", "Back", "Shoulders", "Arms", "Core", "Cardio",
+                  "Mobility", "Olympic", "Plyometrics", "Grip", "Neck"]
+
+WEEKDAY_WEIGHTS = [3, 1, 3, 1, 3, 2, 0.5]
+
+BATCH_SIZE = 50000
+
+
+def exercise_weights(count):
+    return [1 / rank for rank in range(1, count + 1)]
+
+
+def generate_logs(rng, count, exercises, end_date, years):
+    # Yields (exercise_id, date, sets, reps) rows one at a time
+    days = years * 365
+    start = end_date - datetime.timedelta(days=days)
+    day_weights = []
+    for offset in range(days + 1):
+        day = start + datetime.timedelta(days=offset)
+        # Activity ramps up over time, from a third of the final rate
+        day_weights.append(WEEKDAY_WEIGHTS[day.weekday()] * (1 + 2 * offset / days))
+    day_cum = list(itertools.accumulate(day_weights))
+    exercise_cum = list(itertools.accumulate(exercise_weights(exercises)))
+
+    day_numbers = [dates.to_day(start) + offset for offset in range(days + 1)]
+    for done in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - done)
+        picked_dates = rng.choices(day_numbers, cum_weights=day_cum, k=size)
+        picked_exercises = rng.choices(range(1, exercises + 1), cum_weights=exercise_cum, k=size)
+        for date, exercise_id in zip(picked_dates, picked_exercises):
+            sets = max(1, min(8, round(rng.gauss(3.5, 1))))
+            reps = max(1, min(30, round(rng.gauss(10, 3))))
+            yield exercise_id, date, sets, reps
+
+
+def populate(conn, categories=10, exercises=200, routines=50, goals=20, logs=100000,
+             years=5, seed=0, end_date=None):
+    rng = random.Random(seed)
+    end_date = end_date or datetime.date.today()
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO exercise_categories (id, name) VALUES (?, ?)",
+            [(i, CATEGORY_NAMES[i - 1] if i <= len(CATEGORY_NAMES) else f"Category {i}")
+             for i in range(1, categories + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO exercises (id, name, category_id, description) VALUES (?, ?, ?, ?)",
+            [(i, f"Exercise {i}", rng.randint(1, categories), f"Synthetic exercise number {i}")
+             for i in range(1, exercises + 1)]
+        )
+
+        conn.executemany(
+            "INSERT INTO workout_routines (id, name, date_created) VALUES (?, ?, ?)",
+            [(i, f"Routine {i}", dates.to_day(end_date)) for i in range(1, routines + 1)]
+        )
+        weights = exercise_weights(exercises)
+        for routine_id in range(1, routines + 1):
+            picked = set(rng.choices(range(1, exercises + 1), weights=weights, k=rng.randint(4, 8)))
+            conn.executemany(
+                "INSERT INTO routine_exercises (routine_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+                [(routine_id, ex_id, 3, rng.choice([5, 8, 10, 12])) for ex_id in picked]
+            )
+
+        conn.executemany(
+            "INSERT INTO goals (name, target_value, current_value, category_id, deadline) VALUES (?, ?, 0, ?, ?)",
+            [(f"Goal {i}", rng.randint(1, 50) * 1000, rng.randint(1, categories),
+              dates.to_day(end_date) + rng.randint(30, 365))
+             for i in range(1, goals + 1)]
+        )
+
+    rows = generate_logs(rng, logs, exercises, end_date, years)
+    while True:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        with conn:
+            conn.executemany(
+                "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+                batch
+            )
+
+
+def build_database(path, **scale):
+    # Creates the schema at path and fills it; returns the loaded app module
+    db.set_database_path(path)
+    tracker = db.load_tracker()
+    populate(db.get_connection(), **scale)
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic fitness tracker database")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--exercises", type=int, default=200)
+    parser.add_argument("--routines", type=int, default=50)
+    parser.add_argument("--goals", type=int, default=20)
+    parser.add_argument("--logs", type=int, default=100000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    build_database(args.path, categories=args.categories, exercises=args.exercises,
+                   routines=args.routines, goals=args.goals, logs=args.logs,
+                   years=args.years, seed=args.seed)
+    print(f"Wrote {args.logs} workout logs to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
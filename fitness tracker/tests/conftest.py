@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules sit in the directory above, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    # The calling thread's connection, to a new database file
+    db.set_database_path(str(tmp_path / "fitness_tracker.db"))
+    yield db.get_connection()
+    db.close_connection()
@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+
+import analytics
+import api
+import archive
+import columnar
+import dates
+import maintenance
+import reports
+
+
+@pytest.fixture
+def history(conn):
+    # An exercise with logs in more years than can be attached at once,
+    # all but the last one archived. Returns (exercise id, [(id, day, sets,
+    # reps)] newest first).
+    legs = api.add_category("Legs", conn)
+    squat = api.add_exercise("Squat", legs, conn=conn)
+    this_year = dates.to_date(dates.today()).year
+    days = [dates.to_day(datetime.date(year, month, 1))
+            for year in range(this_year - archive.MAX_ATTACHED - 3, this_year - 1) for month in (3, 9)]
+    days.append(dates.today())
+    with conn:
+        conn.executemany("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+                         [(squat, day, 1 + n % 5, 5 + n % 7) for n, day in enumerate(days)])
+    archive.archive_old_logs(conn, horizon_days=365, batch_size=7)
+    logs = conn.execute("SELECT id, date, sets, reps FROM workout_logs").fetchall()
+    for schema in archive.each_archive(conn):
+        logs += conn.execute(f"SELECT id, date, sets, reps FROM {schema}.workout_logs").fetchall()
+    return squat, sorted(logs, key=lambda log: (log[1], log[0]), reverse=True)
+
+
+def test_logs_are_moved_out_of_the_main_file(conn, history):
+    squat, logs = history
+    assert len(archive.archive_years(conn)) > archive.MAX_ATTACHED
+    assert conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0] == 1
+    assert len(logs) == 2 * (archive.MAX_ATTACHED + 2) + 1
+    # The derived data still covers the archived logs
+    assert maintenance.verify_exercise_stats(conn) == []
+    assert maintenance.verify_volume_rollups(conn) == 0
+    assert api.exercise_stats(squat, conn)["workouts"] == len(logs)
+
+
+def test_history_reads_every_archived_year(conn, history):
+    squat, logs = history
+    expected = [(log_id, dates.to_date(day), sets, reps) for log_id, day, sets, reps in logs]
+    assert api.exercise_history(squat, conn=conn) == expected
+    assert api.exercise_history(squat, limit=3, conn=conn) == expected[:3]
+    start, end = logs[-2][1], logs[-5][1]
+    assert api.exercise_history(squat, start, end, conn=conn) == expected[-5:-1]
+
+
+def test_history_pages_cover_every_log_once(conn, history):
+    squat, logs = history
+    pages = [api.history_page(squat, dates.MIN_DAY, dates.MAX_DAY, page_size=4, conn=conn)]
+    while pages[-1]:
+        older_than = pages[-1][-1][:2]
+        pages.append(api.history_page(squat, dates.MIN_DAY, dates.MAX_DAY, older_than, page_size=4, conn=conn))
+    assert [(log_id, day) for page in pages for day, log_id, *_ in page] == [log[:2] for log in logs]
+
+    # And back again from the last page
+    back = api.history_page(squat, dates.MIN_DAY, dates.MAX_DAY, newer_than=pages[-2][0][:2], page_size=4,
+                            conn=conn)
+    assert back == pages[-3]
+
+
+def test_reports_and_analytics_read_every_archived_year(conn, history):
+    squat, logs = history
+    volume = sum(sets * reps for _, _, sets, reps in logs)
+    assert reports.exercise_report(conn, squat)["total_volume"] == volume
+    if analytics.numpy is not None:
+        metrics = analytics.exercise_metrics(squat, conn)
+        assert metrics["logs"] == len(logs)
+
+
+def test_columnar_export_includes_archived_years(conn, history, tmp_path):
+    squat, logs = history
+    directory = str(tmp_path / "columns")
+    assert columnar.export(directory, conn) == len(logs)
+    columns = columnar.open_columns(directory)
+    assert sorted(zip(columns.day, columns.volume)) == sorted((day, sets * reps) for _, day, sets, reps in logs)
+    assert columns.last_id == max(log[0] for log in logs)
+
+    # A log archived before the next export is still appended, once
+    old_day = logs[-1][1]
+    with conn:
+        conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, 3, 10)",
+                     (squat, old_day))
+    archive.archive_old_logs(conn, horizon_days=365)
+    assert conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0] == 1
+    assert columnar.export(directory, conn) == 1
+    assert columnar.export(directory, conn) == 0
+    assert columnar.export(directory, conn, rebuild=True) == len(logs) + 1
+
+
+def test_new_logs_never_take_an_archived_id(conn, history):
+    squat, logs = history
+    with conn:
+        conn.execute("DELETE FROM workout_logs")
+        log_id = conn.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, 3, 10)",
+                              (squat, dates.today())).lastrowid
+    assert log_id > max(log[0] for log in logs)
@@ -0,0 +1,31 @@
+import check_query_plans
+
+
+def test_no_statement_reads_too_much_of_a_large_table():
+    checked, failures, _ = check_query_plans.run()
+    assert checked
+    assert [f"{where}: {sql} ({'; '.join(flagged)})" for where, sql, flagged in failures] == []
+
+
+def test_every_full_scan_is_allowed_with_a_reason():
+    unlisted, unused = check_query_plans.check_full_scans()
+    assert unlisted == []
+    assert unused == []
+
+
+def test_unfiltered_join_is_checked(conn):
+    # Listing every log is fine. Matching each log's exercise by name scans
+    # exercises once per log, or builds a throwaway index over all of it.
+    assert check_query_plans.check(conn, "SELECT * FROM workout_logs") == []
+    assert check_query_plans.check(conn, '''
+    SELECT wl.id, e.name FROM workout_logs wl JOIN exercises e ON e.id = wl.exercise_id
+    ''') == []
+    assert check_query_plans.check(conn, '''
+    SELECT wl.id, e.name FROM workout_logs wl JOIN exercises e ON e.name LIKE wl.exercise_id
+    ''')
+    assert check_query_plans.check(conn, '''
+    SELECT wl.id, e.name FROM workout_logs wl JOIN exercises e ON e.name = 'Squat' || wl.exercise_id
+    ''')
+    assert check_query_plans.check(conn, '''
+    SELECT id, (SELECT COUNT(*) FROM workout_logs WHERE sets = g.target_value) FROM goals g
+    ''')
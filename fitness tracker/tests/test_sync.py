@@ -0,0 +1,184 @@
+import pytest
+
+import api
+import dates
+import maintenance
+import sync
+
+
+@pytest.fixture
+def devices(tmp_path):
+    # Two devices' database files, each with its own device id
+    first, second = (sync._open(str(tmp_path / name)) for name in ("phone.db", "laptop.db"))
+    yield first, second
+    first.close()
+    second.close()
+
+
+def sync_both(first, second):
+    # What "python sync.py sync" does
+    sync.pull(second, first)
+    sync.pull(first, second)
+
+
+def snapshot(conn):
+    # The synced data with local ids swapped for names, which is what two
+    # devices that have converged agree on
+    queries = {
+        "categories": "SELECT name, deleted_at FROM exercise_categories",
+        "exercises": '''
+            SELECT e.name, c.name, e.description
+            FROM exercises e LEFT JOIN exercise_categories c ON c.id = e.category_id
+        ''',
+        "routines": '''
+            SELECT r.name, r.date_created, e.name, re.sets, re.reps
+            FROM workout_routines r
+            LEFT JOIN routine_exercises re ON re.routine_id = r.id
+            LEFT JOIN exercises e ON e.id = re.exercise_id
+        ''',
+        "logs": '''
+            SELECT e.name, wl.date, wl.sets, wl.reps
+            FROM workout_logs wl LEFT JOIN exercises e ON e.id = wl.exercise_id
+        ''',
+        "goals": '''
+            SELECT g.name, c.name, g.target_value, g.current_value
+            FROM goals g LEFT JOIN exercise_categories c ON c.id = g.category_id
+        ''',
+        "stats": '''
+            SELECT e.name, s.workout_count, s.total_sets, s.total_reps
+            FROM exercise_stats s LEFT JOIN exercises e ON e.id = s.exercise_id
+        ''',
+    }
+    return {name: sorted(conn.execute(sql).fetchall(), key=repr) for name, sql in queries.items()}
+
+
+def category_id(conn, name):
+    return conn.execute("SELECT id FROM exercise_categories WHERE name=?", (name,)).fetchone()[0]
+
+
+def version(conn, category):
+    # (clock, device) of a category's latest change
+    return conn.execute('''
+    SELECT r.clock, d.device
+    FROM sync_rows r JOIN sync_devices d ON d.id = r.origin
+    WHERE r.tbl = ? AND r.row_id = ? AND r.sub_id = 0
+    ''', (sync.CODES["exercise_categories"], category)).fetchone()
+
+
+def test_changes_reach_the_other_device(devices):
+    first, second = devices
+    legs = api.add_category("Legs", first)
+    squat, lunge = api.add_exercises([("Squat", legs, "Deep"), ("Lunge", legs)], first)
+    routine = api.create_routine("Leg day", [(squat, 5, 5), (lunge, 3, 12)], "2024-05-01", first)
+    api.log_session(routine, "2024-05-01", conn=first)
+    api.set_goal(legs, "Volume", 1000, conn=first)
+    api.add_category("Arms", second)
+
+    sync_both(first, second)
+
+    assert snapshot(first) == snapshot(second)
+    assert len(snapshot(second)["logs"]) == 2
+    assert maintenance.verify_exercise_stats(second) == []
+    assert maintenance.verify_volume_rollups(second) == 0
+
+
+def test_higher_version_wins(devices):
+    first, second = devices
+    api.add_category("Legs", first)
+    sync_both(first, second)
+
+    # Edited on both devices before they sync again
+    first.execute("UPDATE exercise_categories SET name='Legs A' WHERE name='Legs'")
+    first.commit()
+    second.execute("UPDATE exercise_categories SET name='Legs X' WHERE name='Legs'")
+    second.execute("UPDATE exercise_categories SET name='Legs B' WHERE name='Legs X'")
+    second.commit()
+    winner = max((version(first, category_id(first, "Legs A")), "Legs A"),
+                 (version(second, category_id(second, "Legs B")), "Legs B"))[1]
+
+    sync_both(first, second)
+
+    assert snapshot(first) == snapshot(second)
+    assert snapshot(first)["categories"] == [(winner, None)]
+
+
+def test_name_clash_is_renamed(devices):
+    first, second = devices
+    first_legs = api.add_category("Legs", first)
+    api.add_exercise("Squat", first_legs, conn=first)
+    second_legs = api.add_category("Legs", second)
+    api.add_exercise("Lunge", second_legs, conn=second)
+
+    sync_both(first, second)
+
+    assert snapshot(first) == snapshot(second)
+    assert sorted(name for name, _ in snapshot(first)["categories"]) == ["Legs", "Legs (2)"]
+    # Each exercise stays with its own category
+    exercises = {name: category for name, category, _ in snapshot(first)["exercises"]}
+    assert exercises["Squat"] != exercises["Lunge"]
+
+
+def test_deleting_a_category_deletes_what_refers_to_it(devices):
+    first, second = devices
+    legs = api.add_category("Legs", first)
+    arms = api.add_category("Arms", first)
+    squat, curl = api.add_exercises([("Squat", legs), ("Curl", arms)], first)
+    routine = api.create_routine("Full body", [(squat, 5, 5), (curl, 3, 10)], "2024-05-01", first)
+    api.log_session(routine, "2024-05-01", conn=first)
+    api.set_goal(legs, "Legs volume", 1000, conn=first)
+    api.set_goal(arms, "Arms volume", 1000, conn=first)
+    sync_both(first, second)
+
+    maintenance.delete_category(second, category_id(second, "Legs"))
+    sync_both(first, second)
+
+    for conn in (first, second):
+        data = snapshot(conn)
+        assert data["categories"] == [("Arms", None)]
+        assert [row[0] for row in data["exercises"]] == ["Curl"]
+        assert [row[2] for row in data["routines"]] == ["Curl"]
+        assert [row[0] for row in data["logs"]] == ["Curl"]
+        assert [row[0] for row in data["goals"]] == ["Arms volume"]
+        assert maintenance.verify_exercise_stats(conn) == []
+        assert maintenance.verify_volume_rollups(conn) == 0
+    assert snapshot(first) == snapshot(second)
+
+
+def test_an_old_delta_cannot_bring_a_deleted_row_back(devices):
+    first, second = devices
+    legs = api.add_category("Legs", first)
+    squat = api.add_exercise("Squat", legs, conn=first)
+    first.execute("INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, 3, 10)",
+                  (squat, dates.to_day("2024-05-01")))
+    first.commit()
+    old_delta = sync.export_changes(first, 0, peer=sync.device(second))
+    sync_both(first, second)
+
+    maintenance.delete_category(first, legs)
+    sync_both(first, second)
+    deleted = snapshot(second)
+    assert deleted["categories"] == [] and deleted["logs"] == []
+
+    # The tombstones are newer than every row in the delta
+    applied, skipped = sync.import_changes(second, old_delta)
+    assert applied == 0
+    assert skipped == len(old_delta["changes"])
+    assert snapshot(second) == deleted
+
+
+def test_deleted_row_stays_deleted_over_an_older_edit(devices):
+    first, second = devices
+    api.add_category("Legs", first)
+    sync_both(first, second)
+
+    # The edit is older: the first device moves its clock on before deleting
+    second.execute("UPDATE exercise_categories SET name='Legs B' WHERE name='Legs'")
+    second.commit()
+    for name in ("Arms", "Core", "Back"):
+        api.add_category(name, first)
+    maintenance.delete_category(first, category_id(first, "Legs"))
+
+    sync_both(first, second)
+
+    assert snapshot(first) == snapshot(second)
+    assert sorted(name for name, _ in snapshot(first)["categories"]) == ["Arms", "Back", "Core"]
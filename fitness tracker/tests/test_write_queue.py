@@ -0,0 +1,98 @@
+import logging
+import sqlite3
+import threading
+
+import pytest
+
+import api
+import dates
+import volume_index
+import write_queue
+
+
+@pytest.fixture
+def squat(conn):
+    legs = api.add_category("Legs", conn)
+    return api.add_exercise("Squat", legs, conn=conn)
+
+
+@pytest.fixture
+def writer(conn):
+    # Waits long enough for every entry a test submits to share a batch
+    writer = write_queue.WriteQueue(max_delay_ms=200).start()
+    yield writer
+    writer.stop()
+
+
+def test_batch_is_written_together(conn, squat, writer):
+    futures = [writer.submit(squat, "2024-05-01", 3, reps) for reps in range(1, 6)]
+    ids = [future.result(timeout=5) for future in futures]
+
+    rows = conn.execute("SELECT id, reps FROM workout_logs ORDER BY id").fetchall()
+    assert rows == list(zip(ids, range(1, 6)))
+    metrics = writer.metrics()
+    assert (metrics["batches"], metrics["written"], metrics["failed"]) == (1, 5, 0)
+
+
+def test_bad_entry_fails_alone(conn, squat, writer):
+    # No such exercise: the foreign key rejects it, and the batch is
+    # retried one entry at a time
+    futures = [writer.submit(squat, "2024-05-01", 3, 10),
+               writer.submit(9999, "2024-05-01", 3, 10),
+               writer.submit(squat, "2024-05-02", 3, 10)]
+
+    assert futures[0].result(timeout=5) and futures[2].result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(timeout=5)
+    assert conn.execute("SELECT COUNT(*) FROM workout_logs").fetchone()[0] == 2
+    metrics = writer.metrics()
+    assert (metrics["written"], metrics["failed"]) == (2, 1)
+
+
+def test_failed_refresh_still_writes_the_logs(conn, squat, writer, monkeypatch, caplog):
+    def failing_refresh(conn):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(volume_index, "refresh_in_transaction", failing_refresh)
+    with caplog.at_level(logging.ERROR, logger="write_queue"):
+        assert writer.submit(squat, "2024-05-01", 3, 10).result(timeout=5)
+    assert writer.metrics()["refresh_failed"] == 1
+    assert "goal window totals" in caplog.text
+    # Left stale, and summed from the rollups meanwhile
+    assert conn.execute("SELECT COUNT(*) FROM category_volume_stale").fetchone()[0] == 1
+    day = dates.to_day("2024-05-01")
+    assert volume_index.window_volume(conn, 1, day, day) == 30
+
+    # The next batch catches up
+    monkeypatch.undo()
+    assert writer.submit(squat, "2024-05-02", 3, 10).result(timeout=5)
+    assert conn.execute("SELECT COUNT(*) FROM category_volume_stale").fetchone()[0] == 0
+    assert volume_index.window_volume(conn, 1, day, day + 1) == 60
+
+
+def test_stopped_queue_refuses_entries(conn, squat, writer):
+    writer.submit(squat, "2024-05-01", 3, 10).result(timeout=5)
+    writer.stop()
+    with pytest.raises(RuntimeError):
+        writer.submit(squat, "2024-05-01", 3, 10)
+
+
+# The writer thread re-raises whatever stopped it
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_writer_failure_fails_everything_queued(conn, squat, monkeypatch):
+    # The writer thread can't open its connection, once an entry is queued
+    queued = threading.Event()
+
+    def broken_connection():
+        queued.wait(5)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(write_queue.db, "get_connection", broken_connection)
+    writer = write_queue.WriteQueue().start()
+    future = writer.submit(squat, "2024-05-01", 3, 10)
+    queued.set()
+    with pytest.raises(sqlite3.OperationalError):
+        future.result(timeout=5)
+    writer.stop()
+    with pytest.raises(RuntimeError):
+        writer.submit(squat, "2024-05-01", 3, 10)
@@ -0,0 +1,134 @@
+import argparse
+
+import dates
+import db
+
+# Windowed goal progress from category_volume_prefix, each category's
+# running volume total at the end of every day it was trained. The volume
+# in any window of days is the total at its last day minus the total
+# before its first, two index lookups however many logs there are.
+#
+# Logging a workout only flags its category in category_volume_stale from
+# the log's day, so writes cost the same whatever day they are for. The
+# write paths call refresh() once they have committed (the write queue
+# runs it inside each batch's transaction), which brings the totals up to
+# date from the day rollups, one row per training day from that day on (a
+# single row for a workout logged today). Reads never write:
+# a window that reaches a stale category's stale days is summed from its
+# day rollups instead, one row per day in the window.
+#
+#   volume_index.window_volume(conn, category_id, first_day, last_day)
+#   python volume_index.py 1 2024-05-01 2024-05-30
+
+WINDOW_TYPES = ("days", "week", "month")
+
+WINDOW_VOLUME = '''
+    SELECT COALESCE((SELECT volume FROM category_volume_prefix
+                     WHERE category_id = :category AND day <= :last ORDER BY day DESC LIMIT 1), 0)
+         - COALESCE((SELECT volume FROM category_volume_prefix
+                     WHERE category_id = :category AND day < :first ORDER BY day DESC LIMIT 1), 0)
+'''
+
+WINDOW_VOLUME_FROM_ROLLUPS = '''
+    SELECT COALESCE(SUM(volume), 0) FROM volume_rollups
+    WHERE scope = 'category' AND scope_id = :category AND period = 'day' AND bucket BETWEEN :first AND :last
+'''
+
+
+def refresh(conn):
+    # Recomputes the running totals of stale categories from the day they
+    # went stale. Returns the number of categories refreshed. Call it after
+    # committing a write; inside a transaction it does nothing.
+    if conn.in_transaction:
+        return 0
+    if conn.execute("SELECT 1 FROM category_volume_stale LIMIT 1").fetchone() is None:
+        return 0
+    # Take the write lock before reading what is stale, so nothing flagged
+    # meanwhile is cleared unseen
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        refreshed = refresh_in_transaction(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return refreshed
+
+
+def refresh_in_transaction(conn):
+    # refresh() as part of a write transaction the caller already holds and
+    # commits, for writers that fold it into their own commit
+    stale = conn.execute("SELECT category_id, from_day FROM category_volume_stale").fetchall()
+    for category_id, from_day in stale:
+        base = conn.execute('''
+        SELECT volume FROM category_volume_prefix
+        WHERE category_id=? AND day < ? ORDER BY day DESC LIMIT 1
+        ''', (category_id, from_day)).fetchone()
+        conn.execute("DELETE FROM category_volume_prefix WHERE category_id=? AND day >= ?",
+                     (category_id, from_day))
+        conn.execute('''
+        INSERT INTO category_volume_prefix (category_id, day, volume)
+        SELECT scope_id, bucket, ? + SUM(volume) OVER (ORDER BY bucket)
+        FROM volume_rollups
+        WHERE scope = 'category' AND scope_id = ? AND period = 'day' AND bucket >= ?
+        ''', (base[0] if base else 0, category_id, from_day))
+        conn.execute("DELETE FROM category_volume_stale WHERE category_id=?", (category_id,))
+    return len(stale)
+
+
+def window_volume(conn, category_id, first_day, last_day):
+    # Volume logged in the category from first_day to last_day inclusive
+    params = {"category": category_id, "first": first_day, "last": last_day}
+    stale = conn.execute("SELECT from_day FROM category_volume_stale WHERE category_id=?",
+                         (category_id,)).fetchone()
+    if stale is not None and stale[0] <= last_day:
+        return conn.execute(WINDOW_VOLUME_FROM_ROLLUPS, params).fetchone()[0]
+    return conn.execute(WINDOW_VOLUME, params).fetchone()[0]
+
+
+def window_bounds(window_type, window_days, today, deadline=None):
+    # (first day, last day) of a goal's current window: the last window_days
+    # days, this week from Monday or this month from the 1st, up to today,
+    # or up to the deadline once it has passed
+    last = today if deadline is None else min(today, deadline)
+    if window_type == "days":
+        return last - window_days + 1, last
+    date = dates.to_date(last)
+    if window_type == "week":
+        return last - date.weekday(), last
+    if window_type == "month":
+        return dates.to_day(date.replace(day=1)), last
+    raise ValueError(f"Unknown goal window {window_type!r}")
+
+
+def check_window(window_type, window_days):
+    # Raises ValueError unless the pair describes a goal window (or, both
+    # None, a goal over all time)
+    if window_type is None:
+        if window_days is not None:
+            raise ValueError("window_days needs window_type 'days'")
+    elif window_type not in WINDOW_TYPES:
+        raise ValueError(f"Goal window must be one of {', '.join(WINDOW_TYPES)}")
+    elif window_type == "days":
+        if not isinstance(window_days, int) or window_days < 1:
+            raise ValueError("window_days must be a whole number of days, at least 1")
+    elif window_days is not None:
+        raise ValueError(f"A '{window_type}' window doesn't take window_days")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Volume logged in a category between two dates")
+    parser.add_argument("category_id", type=int)
+    parser.add_argument("first", help="first day, YYYY-MM-DD")
+    parser.add_argument("last", nargs="?", help="last day, YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    refresh(conn)
+    first = dates.parse_day(args.first)
+    last = dates.parse_day(args.last) if args.last else dates.today()
+    print(window_volume(conn, args.category_id, first, last))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import concurrent.futures
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import dates
+import db
+import volume_index
+
+# Group commit for workout logs. Any thread can submit() an entry; one
+# writer thread owns the only write connection and commits whatever has
+# queued up as a single transaction, every max_batch entries or max_delay_ms
+# milliseconds, whichever comes first. Each submit() returns a Future that
+# resolves to the new log id once its transaction has committed.
+#
+#   writer = WriteQueue()
+#   writer.start()
+#   log_id = writer.submit(exercise_id, "2024-05-01", 3, 10).result()
+#   writer.stop()
+
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_DELAY_MS = 5
+DEFAULT_MAX_PENDING = 10000
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, max_batch=DEFAULT_MAX_BATCH, max_delay_ms=DEFAULT_MAX_DELAY_MS,
+                 max_pending=DEFAULT_MAX_PENDING, synchronous="FULL"):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        # One fsync per batch is cheap enough to make every commit durable
+        self.synchronous = synchronous
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0,
+            "written": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,
+            "refresh_failed": 0,
+            "max_batch_size": 0,
+            "max_queue_depth": 0,
+        }
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        # Writes everything already queued, then stops the writer thread
+        if self._thread is not None:
+            if self._thread.is_alive():
+                self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, exercise_id, date, sets, reps, timeout=None):
+        # date can be anything dates.to_day() takes. Blocks while the queue
+        # is full (backpressure); raises queue.Full if there is still no
+        # room after timeout seconds, and RuntimeError unless the writer
+        # thread is running.
+        if not self._running:
+            raise RuntimeError("The write queue isn't running")
+        row = (exercise_id, dates.to_day(date), sets, reps)
+        future = concurrent.futures.Future()
+        try:
+            self._queue.put((row, future), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._metrics["rejected"] += 1
+            raise
+
+        with self._lock:
+            self._metrics["submitted"] += 1
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._queue.qsize())
+        # The writer may have exited since the check above, after failing
+        # what was queued then
+        if not self._running:
+            self._fail_pending(RuntimeError("The write queue stopped"))
+        return future
+
+    def metrics(self):
+        with self._lock:
+            result = dict(self._metrics)
+        result["queue_depth"] = self._queue.qsize()
+        result["avg_batch_size"] = result["written"] / result["batches"] if result["batches"] else 0
+        return result
+
+    def _next_batch(self):
+        # Wait for one entry, then gather more until the batch is full or
+        # the delay since the first one runs out
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, conn, batch):
+        # Returns the new ids, or raises and leaves nothing written
+        try:
+            ids = []
+            for row, future in batch:
+                cursor = conn.execute(
+                    "INSERT INTO workout_logs (exercise_id, date, sets, reps) VALUES (?, ?, ?, ?)",
+                    row
+                )
+                ids.append(cursor.lastrowid)
+            self._refresh(conn)
+            conn.commit()
+            return ids
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _refresh(self, conn):
+        # Brings the goal window totals up to date in the batch's own
+        # transaction, so it adds no commit or fsync of its own. Reads sum
+        # stale categories from the rollups meanwhile, so if it fails the
+        # logs are still written and the next batch tries again.
+        conn.execute("SAVEPOINT refresh")
+        try:
+            volume_index.refresh_in_transaction(conn)
+        except sqlite3.Error:
+            conn.execute("ROLLBACK TO refresh")
+            with self._lock:
+                self._metrics["refresh_failed"] += 1
+            logger.exception("Refreshing the goal window totals failed; retrying with the next batch")
+        conn.execute("RELEASE refresh")
+
+    def _fail_pending(self, error):
+        # Fails every entry still queued
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and not item[1].done():
+                item[1].set_exception(error)
+
+    def _run(self):
+        batch = []
+        reason = RuntimeError("The write queue stopped")
+        try:
+            conn = db.get_connection()
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if not batch:
+                    continue
+
+                try:
+                    ids = self._write(conn, batch)
+                    results = [(future, log_id, None) for (row, future), log_id in zip(batch, ids)]
+                except Exception:
+                    # One bad entry shouldn't sink the others: retry them one by one
+                    results = []
+                    for item in batch:
+                        try:
+                            results.append((item[1], self._write(conn, [item])[0], None))
+                        except Exception as error:
+                            results.append((item[1], None, error))
+
+                written = sum(1 for _, _, error in results if error is None)
+                with self._lock:
+                    self._metrics["batches"] += 1
+                    self._metrics["written"] += written
+                    self._metrics["failed"] += len(results) - written
+                    self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], len(batch))
+
+                for future, log_id, error in results:
+                    if error is None:
+                        future.set_result(log_id)
+                    else:
+                        future.set_exception(error)
+                batch = []
+        except BaseException as exc:
+            reason = exc
+            raise
+        finally:
+            # Whatever made the writer exit, nothing submitted may wait on it
+            # forever: fail the batch in hand and everything still queued
+            self._running = False
+            for row, future in batch:
+                if not future.done():
+                    future.set_exception(reason)
+            self._fail_pending(reason)
+            db.close_connection()